@@ -1,11 +1,12 @@
 from django.contrib import admin
 
-from api.models import PersonalAccount, BusinessAccount, Transaction, PaymentDetails, BankDetails
+from api.models import PersonalAccount, BusinessAccount, Transaction, ArchivedTransaction, PaymentDetails, BankDetails
 
 # Register your models here.
 
 admin.site.register(PersonalAccount)
 admin.site.register(BusinessAccount)
 admin.site.register(Transaction)
+admin.site.register(ArchivedTransaction)
 admin.site.register(PaymentDetails)
 admin.site.register(BankDetails)
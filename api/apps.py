@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save
 
 
 class Lab1Config(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from api import database, known_accounts, metrics
+
+        # Sets the journal mode, busy timeout and cache size of SQLite connections
+        connection_created.connect(database.configure_connection)
+
+        # Counts the queries made by each request, for /metrics
+        connection_created.connect(metrics.install_query_wrapper)
+
+        # Keeps the filters of known cards and payee accounts up to date
+        for model in known_accounts.WATCHED_MODELS:
+            post_save.connect(known_accounts.account_saved, sender=model)
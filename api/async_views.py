@@ -0,0 +1,218 @@
+import asyncio
+from datetime import date
+
+from asgiref.sync import sync_to_async
+from django.db import DatabaseError
+
+from api import ledger
+from api.codec import JsonResponse
+from api.functions import check_valid_request, error_response, service_response, validate_payment_request, \
+    validate_refund_request, check_transaction_open
+from api.idempotency import idempotent
+from api.lookups import find_payee, find_payer
+from api.models import Transaction, PaymentDetails, BankDetails, BusinessAccount, PersonalAccount
+from api.ratelimit import PAYMENT_LIMITS, REFUND_LIMITS, rate_limited
+from api.services import currency, pns
+from api.views import read_conversion
+
+
+# Async versions of the payment, refund and currency conversion endpoints, for when the API is served over ASGI.
+# Whilst one payment is waiting on the database or an upstream service, the worker can carry on with others.
+
+
+# Runs a database lookup in its own thread (with its own connection), so independent lookups can run at the same time.
+# Returns the object found, or the error code for the lookup that failed.
+async def run_lookup(function, payment):
+    try:
+        return await sync_to_async(function, thread_sensitive=False)(payment)
+
+    # If the bank details provided do not exist
+    except BankDetails.DoesNotExist:
+        return 107
+
+    # If the bank details provided exist, but there's not a business account with the same account number
+    except BusinessAccount.DoesNotExist:
+        return 109
+
+    # If the payment details provided don't exist in the db
+    except PaymentDetails.DoesNotExist:
+        return 106
+
+    # If the payment details exist, but there is not an account linked with those payment details
+    except PersonalAccount.DoesNotExist:
+        return 108
+
+    # If the connection to the database fails
+    except DatabaseError:
+        return 401
+
+
+@idempotent
+@rate_limited(**PAYMENT_LIMITS)
+async def initiate_payment_async(request):
+    # The JSON default data of the response, stored in a dictionary
+    response_data = {
+        'ErrorCode': None,
+        'Comment': ""
+    }
+
+    # A function which checks if the response is not empty and can be converted to JSON
+    request_data = check_valid_request(request, response_data)
+
+    if isinstance(request_data, JsonResponse):
+        return request_data  # Will be a JSON response of the error
+
+    if request.method != 'POST':
+        return error_response(response_data, 105)
+
+    # Checks every field of the payment. The email check can make a DNS lookup, so it's run outside the event loop.
+    payment = await sync_to_async(validate_payment_request, thread_sensitive=False)(request_data, response_data)
+
+    if isinstance(payment, JsonResponse):
+        return payment  # Will be a JSON response of the error
+
+    curr_date = date.today()
+    tasks = [run_lookup(find_payee, payment), run_lookup(find_payer, payment)]
+
+    # If both currency codes are not the same then the amount is converted whilst the accounts are looked up
+    if payment['payer_currency_code'] != payment['payee_currency_code']:
+        tasks.append(currency.convert_async(payment['amount'], payment['payer_currency_code'],
+                                            payment['payee_currency_code'], curr_date))
+
+    results = await asyncio.gather(*tasks)
+    payee_object, payer_object = results[0], results[1]
+
+    # Reports the errors in the same order as the sync view, payee first
+    for result in (payee_object, payer_object):
+        if isinstance(result, int):
+            return error_response(response_data, result)
+
+    amount = payment['amount']
+
+    if len(results) == 3:
+        conversion = results[2]
+
+        if not conversion.ok:
+            return error_response(response_data, conversion.error_code, conversion.comment)
+
+        # If everything is valid, then set the amount to the new value
+        amount = conversion.value
+
+    # Sends the payment to the PNS
+    pns_result = await pns.send_payment_async(request_data)
+
+    if not pns_result.ok:
+        return error_response(response_data, pns_result.error_code, pns_result.comment)
+
+    # Save the transaction now that it has been completed
+    new_transaction = Transaction(payer=payer_object, payee=payee_object, amount=amount,
+                                  currency=payment['payee_currency_code'], date=curr_date,
+                                  transactionStatus="Completed")
+
+    try:
+        await sync_to_async(ledger.record_payment)(new_transaction)
+    except DatabaseError:
+        return error_response(response_data, 401)
+
+    response_data["Comment"] = "Payment Successfully Completed"
+    return JsonResponse(response_data, status=200)
+
+
+@idempotent
+@rate_limited(**REFUND_LIMITS)
+async def initiate_refund_async(request):
+    # The JSON default data of the response, stored in a dictionary
+    response_data = {
+        'ErrorCode': None,
+        'Comment': ""
+    }
+
+    # A function which checks if the response is not empty and can be converted to JSON
+    request_data = check_valid_request(request, response_data)
+
+    if isinstance(request_data, JsonResponse):
+        return request_data  # Will be a JSON response of the error
+
+    if request.method != 'POST':
+        return error_response(response_data, 105)
+
+    # Checks every field of the refund, returning the cleaned values
+    refund = validate_refund_request(request_data, response_data)
+
+    if isinstance(refund, JsonResponse):
+        return refund  # Will be a JSON response of the error
+
+    amount = refund['amount']
+
+    # transaction will already exist from initial payment. Only the fields needed are read.
+    curr_transaction = await sync_to_async(ledger.get_transaction)(refund['transaction_id'])
+
+    # Will produce the appropriate error code if we can't find the transaction
+    if curr_transaction is None:
+        return error_response(response_data, 402)
+
+    # Return an error if the transaction is already refunded or cancelled, or is itself a refund
+    transaction_error = check_transaction_open(curr_transaction['transactionStatus'], response_data)
+
+    if transaction_error is not None:
+        return transaction_error
+
+    # If the currency that we want a refund in is not the same that was carried out for the transaction
+    if curr_transaction['currency'] != refund['currency_code']:
+        conversion = await currency.convert_async(amount, refund['currency_code'], curr_transaction['currency'],
+                                                  date.today())
+
+        if not conversion.ok:
+            return error_response(response_data, conversion.error_code, conversion.comment)
+
+        amount = conversion.value
+
+    if amount > curr_transaction['amount']:
+        return error_response(response_data, 104, "Error. The amount requested was greater than the total fee "
+                                                  "of your booking.")
+
+    # The transaction is claimed before the PNS is asked, so that if another request refunds or cancels it in the
+    # meantime, only one of them goes ahead
+    if not await sync_to_async(ledger.claim_refund)(curr_transaction):
+        return await sync_to_async(ledger.transition_error)(refund['transaction_id'], response_data)
+
+    # Sends the refund to the PNS, which is passed on as it was sent to us. The claim is given up if it can't be sent.
+    try:
+        pns_result = await pns.send_refund_async(request.body)
+
+    except BaseException:
+        await sync_to_async(ledger.release_refund)(curr_transaction)
+        raise
+
+    if not pns_result.ok:
+        await sync_to_async(ledger.release_refund)(curr_transaction)
+        return error_response(response_data, pns_result.error_code, pns_result.comment)
+
+    # Set the status to refunded, and create a new transaction detailing how much was refunded (which is in a
+    # negative value)
+    if not await sync_to_async(ledger.refund_transaction)(curr_transaction, amount):
+        return await sync_to_async(ledger.transition_error)(refund['transaction_id'], response_data)
+
+    response_data['Comment'] = "Refund Successful"
+    return JsonResponse(response_data, status=200)
+
+
+async def convert_currency_async(request):
+    # The JSON default data of the response, stored in a dictionary
+    response_data = {
+        'ErrorCode': None,
+        'Comment': "",
+        'Amount': None
+    }
+
+    conversion = read_conversion(request, response_data)
+
+    if isinstance(conversion, JsonResponse):
+        return conversion  # Will be a JSON response of the error
+
+    # Uses the same rate cache as the sync view
+    result = await currency.convert_async(conversion['Amount'], conversion['CurrencyFrom'], conversion['CurrencyTo'],
+                                          conversion.get('Date'))
+    response_data['Amount'] = result.value
+
+    return service_response(result, response_data)
@@ -0,0 +1,59 @@
+import hashlib
+import math
+import threading
+
+
+# A Bloom filter of strings. It can say a string is definitely not in the set, or probably is, with the chance of it
+# wrongly saying probably (the false positive rate) growing as more strings are added than it was sized for.
+class BloomFilter:
+    # Sized for the capacity at the error rate given, unless that would need more than max_bytes
+    def __init__(self, capacity, error_rate=0.001, max_bytes=None):
+        capacity = max(1, capacity)
+        bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+
+        if max_bytes is not None:
+            bits = min(bits, max_bytes * 8)
+
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bits = max(8, bits)
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.count = 0
+
+        self._array = bytearray((self.bits + 7) // 8)
+        self._lock = threading.Lock()
+
+    # The bit positions of a string, from two hashes combined (Kirsch-Mitzenmacher), so only one digest is needed
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+        return [(first + index * second) % self.bits for index in range(self.hashes)]
+
+    def add(self, item):
+        positions = self._positions(item)
+
+        # Setting a bit reads and writes its byte, so two threads adding at once could lose one of the bits
+        with self._lock:
+            for position in positions:
+                self._array[position >> 3] |= 1 << (position & 7)
+
+            self.count += 1
+
+    def __contains__(self, item):
+        array = self._array
+        return all(array[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    # The chance of a string which was never added being reported as probably in the set, with what's in it now
+    def false_positive_rate(self):
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+    def stats(self):
+        return {
+            'capacity': self.capacity,
+            'items': self.count,
+            'bytes': len(self._array),
+            'hashes': self.hashes,
+            'target_false_positive_rate': self.error_rate,
+            'false_positive_rate': round(self.false_positive_rate(), 6),
+        }
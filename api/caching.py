@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+# A bounded in-process cache. Entries expire after their TTL, and once the cache is full the least recently used
+# entry is evicted to make room.
+class LocalCache:
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Maps each key to a tuple of (expiry time, value), oldest used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            # Counts expired entries as misses, and removes them
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+
+            # Marks the entry as the most recently used
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+
+            # Evicts the least recently used entries until we're back under the limit
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'backend': 'local',
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._entries),
+            'max_entries': self.max_entries
+        }
+
+
+# Keeps the entries in one of Django's cache aliases instead, so every worker shares them. Size limits and eviction
+# are left to the cache backend, so only the hits and misses of this process are counted.
+class DjangoCache:
+    def __init__(self, alias='default', ttl=300, prefix=''):
+        self.alias = alias
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    # Django's caches need string keys, so tuples are joined together
+    def make_key(self, key):
+        if isinstance(key, tuple):
+            key = ':'.join(str(part) for part in key)
+
+        return '%s:%s' % (self.prefix, key)
+
+    def get(self, key, default=None):
+        value = caches[self.alias].get(self.make_key(key))
+
+        if value is None:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        caches[self.alias].set(self.make_key(key), value, self.ttl if ttl is None else ttl)
+
+    def delete(self, key):
+        caches[self.alias].delete(self.make_key(key))
+
+    def clear(self):
+        # Only this cache's keys should go, and Django can't delete by prefix, so they're left to expire
+        pass
+
+    def stats(self):
+        return {
+            'backend': 'django',
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': None,
+            'size': None,
+            'max_entries': None
+        }
+
+
+# Every cache which has been created, by name
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+# Returns the named cache from the API_CACHES setting, creating it the first time it's used
+def get_cache(name):
+    cache = _caches.get(name)
+
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(name)
+
+            if cache is None:
+                config = settings.API_CACHES.get(name, {})
+
+                if config.get('BACKEND', 'local') == 'django':
+                    cache = DjangoCache(alias=config.get('ALIAS', 'default'), ttl=config.get('TTL', 300),
+                                        prefix=name)
+                else:
+                    cache = LocalCache(max_entries=config.get('MAX_ENTRIES', 1024), ttl=config.get('TTL', 300))
+
+                _caches[name] = cache
+
+    return cache
+
+
+# Returns the counters of every cache created so far
+def cache_stats():
+    return {name: cache.stats() for name, cache in _caches.items()}
@@ -0,0 +1,80 @@
+import base64
+import hashlib
+import hmac
+import os
+from functools import lru_cache
+
+from django.conf import settings
+
+from api.schemas import strip_separators
+
+# Cards are found by a keyed hash of their number rather than the number itself, so the full card number is never
+# the search key. The key is CARD_FINGERPRINT_KEY, and changing it means running backfill_card_fingerprints --all.
+
+
+# Returns the fingerprint of a card number, ignoring any spaces or hyphens in it
+def card_fingerprint(card_number):
+    return keyed_hash(strip_separators(str(card_number)))
+
+
+# A keyed hash of the values together, for keeping card details (e.g. in a cache) without keeping the details themselves
+def keyed_hash(*values):
+    mac = keyed_hmac(settings.CARD_FINGERPRINT_KEY).copy()
+    mac.update('\x1f'.join(str(value) for value in values).encode())
+    return mac.hexdigest()
+
+
+# The HMAC with the key already applied, which is copied for each hash rather than keying a new one every time
+@lru_cache(maxsize=1)
+def keyed_hmac(key):
+    return hmac.new(key.encode(), digestmod=hashlib.sha256)
+
+
+# Encrypts card details which have to be kept for a while, i.e. payments waiting in the PNS outbox, so they aren't kept
+# in plain text. The cipher is HMAC-SHA256 in counter mode, so only the standard library is needed, with a MAC over the
+# nonce and ciphertext so a changed payload is refused rather than sent. The key is OUTBOX_PAYLOAD_KEY.
+def seal(text):
+    nonce = os.urandom(16)
+    data = text.encode()
+    sealed = nonce + xor(data, keystream(nonce, len(data)))
+    return base64.urlsafe_b64encode(sealed + seal_mac(sealed)).decode()
+
+
+# Decrypts what seal returned. Raises a ValueError if it was changed, or sealed with another key.
+def unseal(token):
+    sealed = base64.urlsafe_b64decode(token)
+    sealed, mac = sealed[:-32], sealed[-32:]
+
+    if not hmac.compare_digest(mac, seal_mac(sealed)):
+        raise ValueError("Sealed value has been changed, or was sealed with another key")
+
+    nonce, data = sealed[:16], sealed[16:]
+    return xor(data, keystream(nonce, len(data))).decode()
+
+
+def keystream(nonce, length):
+    key = seal_keys(settings.OUTBOX_PAYLOAD_KEY)[0]
+    blocks = (length + 31) // 32
+    return b''.join(hmac.digest(key, nonce + block.to_bytes(8, 'big'), 'sha256') for block in range(blocks))[:length]
+
+
+def seal_mac(sealed):
+    return hmac.digest(seal_keys(settings.OUTBOX_PAYLOAD_KEY)[1], sealed, 'sha256')
+
+
+def xor(data, stream):
+    return (int.from_bytes(data, 'big') ^ int.from_bytes(stream, 'big')).to_bytes(len(data), 'big')
+
+
+# Separate keys for encrypting and for the MAC, both derived from the one setting
+@lru_cache(maxsize=1)
+def seal_keys(key):
+    return (hmac.digest(key.encode(), b'outbox encryption', 'sha256'),
+            hmac.digest(key.encode(), b'outbox authentication', 'sha256'))
+
+
+# Checks the security code and expiry date given against those of the card found, comparing the security code in
+# constant time so the time taken doesn't give away how much of it was right
+def card_matches(payment_details, security_code, expiry_date):
+    return hmac.compare_digest(payment_details.securityCode.encode(), str(security_code).encode()) \
+        and payment_details.expiryDate == expiry_date
@@ -0,0 +1,56 @@
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+# The JSON encoder and decoder used for request and response bodies. orjson is used when it's installed, as it's several
+# times faster than the json module, otherwise the json module is used. API_JSON_CODEC can force either one.
+
+_django_encoder = DjangoJSONEncoder()
+
+
+def _pick_codec():
+    choice = getattr(settings, 'API_JSON_CODEC', 'auto')
+
+    if choice in ('auto', 'orjson'):
+        try:
+            import orjson
+
+        except ImportError:
+            if choice == 'orjson':
+                raise
+
+        else:
+            # Types orjson can't encode itself (e.g. Decimal) are encoded the same way as Django's JsonResponse would
+            def orjson_dumps(data):
+                return orjson.dumps(data, default=_django_encoder.default)
+
+            return 'orjson', orjson.loads, orjson_dumps
+
+    def json_dumps(data):
+        return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+    return 'json', json.loads, json_dumps
+
+
+# loads takes str or bytes, and raises a ValueError if it isn't valid JSON. dumps returns bytes.
+NAME, loads, dumps = _pick_codec()
+
+
+# Used in place of django.http.JsonResponse, encoding with the codec above
+class JsonResponse(HttpResponse):
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
+
+
+# Returns the parsed JSON body of the request. It's only parsed the first time, and kept on the request for any other
+# function which needs it, so it mustn't be changed. Raises a ValueError if the body isn't valid JSON.
+def parse_body(request):
+    try:
+        return request._parsed_body
+
+    except AttributeError:
+        request._parsed_body = loads(request.body)
+        return request._parsed_body
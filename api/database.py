@@ -0,0 +1,72 @@
+import asyncio
+import contextvars
+from functools import wraps
+
+from django.conf import settings
+
+# Database connection tuning and routing. SQLite connections are given the pragmas in SQLITE_PRAGMAS as they're opened,
+# and views which only read (history, reporting and status lookups) can be sent to a read replica with read_only.
+
+REPLICA = 'replica'
+
+# Set whilst a read_only view is running. It's a context variable, so it follows the request into the threads
+# sync_to_async runs queries in.
+_read_only = contextvars.ContextVar('api_read_only', default=False)
+
+
+# Applies SQLITE_PRAGMAS to each SQLite connection as it's opened (see api.apps). WAL lets reads carry on whilst a
+# payment is being written, and busy_timeout makes writers wait for each other rather than failing straight away.
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute('PRAGMA %s = %s' % (pragma, value))
+
+
+# Sends the reads of the view to the replica, if there is one. Only for views which don't write, and can be a moment
+# behind the primary.
+def read_only(view):
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            token = _read_only.set(True)
+
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _read_only.reset(token)
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = _read_only.set(True)
+
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_only.reset(token)
+
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _read_only.get() and REPLICA in settings.DATABASES:
+            return REPLICA
+
+        return None
+
+    # Every write goes to the primary
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    # The replica holds the same rows as the primary
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    # The replica gets its tables from the primary, so is never migrated itself
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
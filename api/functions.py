@@ -1,6 +1,5 @@
-import json
-
-from django.http import JsonResponse
+from api.codec import JsonResponse, loads, parse_body
+from api.schemas import PAYMENT_SCHEMA, REFUND_SCHEMA, CANCELLATION_SCHEMA
 
 # Stores the generic error messages for each error code
 generic_error_messages = {
@@ -14,6 +13,9 @@ generic_error_messages = {
     107: 'Payee bank account details could not be found',
     108: 'Payer personal account could not be found',
     109: 'Payee business account details could not be found',
+    110: 'Error. A request with this Idempotency-Key is still being processed',
+    111: 'Error. This Idempotency-Key has already been used for a different request',
+    112: 'Error. Too many requests, try again after the number of seconds in the Retry-After header',
     201: 'An error occurred with currency conversion. ',
     301: 'An error occurred with contacting the Payment Network Service. ',
     401: 'Could not access database.',
@@ -28,18 +30,18 @@ def check_valid_request(request, response_data):
         # Returns error code 100 if it is
         return error_response(response_data, 100)
 
-    # Checks if the request can be converted into JSON successfully
+    # Checks if the request can be converted into JSON successfully. The parsed body is kept on the request, so it's
+    # only parsed once however many functions need it.
     try:
-        request_data = json.loads(request.body)
-        return request_data
+        return parse_body(request)
 
-    except json.JSONDecodeError:
+    except ValueError:
         # If it can't, then return error 101
         return error_response(response_data, 101)
 
 
 # Function for creating correct error codes and messages to be sent to the aggregator
-def error_response(response_data, error_code, error_message=None):
+def error_response(response_data, error_code, error_message=None, status=400):
     response_data['ErrorCode'] = error_code
 
     # The generic messages for each error code
@@ -50,17 +52,89 @@ def error_response(response_data, error_code, error_message=None):
         # Keeps the comment provided
         response_data['Comment'] = error_message
 
-    return JsonResponse(response_data, status=400)
+    response = JsonResponse(response_data, status=status)
+    # Lets the metrics middleware count the error codes without reading the body back
+    response.error_code = error_code
+    return response
 
 
-# Returns the error code and comments for any errors coming from another API that's being interacted with.
-def error_response_external(api_response, response_data, error_code):
-    # Get the body of response from the external api
-    response_body = json.loads(api_response.text)
+# Turns the result of a service (see api.services) into the response of its endpoint
+def service_response(result, response_data):
+    if not result.ok:
+        return error_response(response_data, result.error_code, result.comment)
 
-    # Set the error code to the one provided
-    response_data['ErrorCode'] = error_code
-    # Append the generic error message to the start. The following string has the more detailed error message
-    # from the external API.
-    response_data['Comment'] = generic_error_messages.get(error_code) + response_body['Comment']
-    return JsonResponse(response_data, status=400)
+    response_data['Comment'] = result.comment
+    return JsonResponse(response_data, status=200)
+
+
+# Gets the comment from the body of a response from another API, parsed straight from the bytes received. If it isn't
+# JSON (e.g. an error page from a proxy), then the status is used as the comment instead.
+def upstream_comment(api_response):
+    try:
+        return loads(api_response.content)['Comment']
+    except (ValueError, KeyError, TypeError):
+        return "Status %s" % api_response.status_code
+
+
+# Validates the body of a single payment, shared by the single and batch payment endpoints. Returns a dictionary of
+# the cleaned values, or the JSON response of the first error found (response_data is filled in either way).
+def validate_payment_request(request_data, response_data):
+    payment, error = PAYMENT_SCHEMA.validate(request_data)
+
+    if error is not None:
+        return error_response(response_data, *error)
+
+    return payment
+
+
+# Validates the body of a refund, shared by the sync and async refund endpoints. Returns a dictionary of the cleaned
+# values, or the JSON response of the first error found.
+def validate_refund_request(request_data, response_data):
+    refund, error = REFUND_SCHEMA.validate(request_data)
+
+    if error is not None:
+        return error_response(response_data, *error)
+
+    return refund
+
+
+# Validates the body of a cancellation. Returns a dictionary of the cleaned values, or the JSON response of the first
+# error found.
+def validate_cancellation_request(request_data, response_data):
+    cancellation, error = CANCELLATION_SCHEMA.validate(request_data)
+
+    if error is not None:
+        return error_response(response_data, *error)
+
+    return cancellation
+
+
+# Checks a transaction can still be refunded or cancelled, returning the JSON response of the error if it can't
+def check_transaction_open(transaction_status, response_data):
+    if transaction_status == "Refunded" or transaction_status == "Cancelled":
+        return error_response(response_data, 404)
+
+    # When refunding, we create a new transaction detailing how much was refunded. These have a status of
+    # 'Refund Transaction'. We give a more specific error for this.
+    if transaction_status == "Refund Transaction":
+        return error_response(response_data, 404, "Error. The transaction ID provided is for a refund transaction")
+
+    # Payments sent to the PNS in the background can't be changed until they've been sent, and never if they failed
+    if transaction_status == "Pending":
+        return error_response(response_data, 404, "Error. The transaction is still being sent to the Payment "
+                                                  "Network Service")
+
+    if transaction_status == "Failed":
+        return error_response(response_data, 404, "Error. The transaction was rejected by the Payment Network Service")
+
+    # Another request is waiting on the PNS to refund the transaction
+    if transaction_status == "Refunding":
+        return error_response(response_data, 404, "Error. The transaction is already being refunded")
+
+    return None
+
+
+# Whether the client asked for the request to be accepted straight away and carried out in the background, with the
+# Prefer: respond-async header
+def respond_async(request):
+    return 'respond-async' in request.headers.get('Prefer', '')
@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import time
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+from api import caching
+from api.functions import error_response
+from api.models import IdempotencyKey
+
+# Support for the Idempotency-Key header. The first request with a key reserves it, and its response is stored once
+# it's done, so a retry of the same request is answered with the stored response instead of being carried out again.
+# A duplicate which arrives whilst the first is still running waits for it, and is rejected if it's still running
+# after IDEMPOTENCY['WAIT'] seconds.
+
+IN_PROGRESS = "In Progress"
+COMPLETED = "Completed"
+
+# Errors which might not happen on a retry, so the key is released rather than the error being stored. This includes
+# being rate limited.
+RETRYABLE_ERROR_CODES = {112, 201, 301, 401}
+
+
+def request_hash(request):
+    return hashlib.sha256(request.body).hexdigest()
+
+
+# Builds the response to send back from a stored one
+def replay_response(status, body):
+    response = HttpResponse(body, status=status, content_type='application/json')
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+# Tries to reserve the key for this request. Returns None if it has been reserved, otherwise the response to send back
+# (a replay of the stored response, or an error).
+def reserve(key, route, body_hash):
+    response_data = {
+        'ErrorCode': None,
+        'Comment': ""
+    }
+
+    # Replays of completed requests can usually be answered from the cache, without touching the database
+    cached = caching.get_cache('idempotency').get((route, key))
+
+    if cached is not None:
+        if cached[0] != body_hash:
+            return error_response(response_data, 111, status=422)
+
+        return replay_response(cached[1], cached[2])
+
+    config = settings.IDEMPOTENCY
+    deadline = time.monotonic() + config['WAIT']
+
+    while True:
+        now = timezone.now()
+
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(key=key, route=route, requestHash=body_hash, status=IN_PROGRESS,
+                                              createdAt=now, expiresAt=now + timedelta(seconds=config['TTL']))
+            return None
+
+        except IntegrityError:
+            existing = IdempotencyKey.objects.filter(key=key, route=route).first()
+
+        # The reservation was released between the insert and the read, so try again
+        if existing is None:
+            continue
+
+        # Expired keys, and reservations abandoned by a worker which never finished, can be taken over. The delete
+        # only matches the row we read, so only one request takes it over.
+        abandoned = existing.status == IN_PROGRESS \
+            and existing.createdAt <= now - timedelta(seconds=config['LOCK_TIMEOUT'])
+
+        if existing.expiresAt <= now or abandoned:
+            IdempotencyKey.objects.filter(pk=existing.pk, createdAt=existing.createdAt).delete()
+            continue
+
+        if existing.requestHash != body_hash:
+            return error_response(response_data, 111, status=422)
+
+        if existing.status == COMPLETED:
+            remember(route, key, existing.requestHash, existing.responseStatus, existing.responseBody)
+            return replay_response(existing.responseStatus, existing.responseBody)
+
+        # The first request is still running, so wait for it to finish, up to a limit
+        if time.monotonic() >= deadline:
+            return error_response(response_data, 110, status=409)
+
+        time.sleep(config['POLL_INTERVAL'])
+
+
+# Stores the response of the request which reserved the key, or releases the key if the request should be retried
+def complete(key, route, body_hash, response):
+    # Set on error responses by error_response, so the body doesn't need to be parsed again
+    error_code = getattr(response, 'error_code', None)
+
+    if response.status_code >= 500 or error_code in RETRYABLE_ERROR_CODES:
+        release(key, route)
+        return
+
+    body = response.content.decode()
+    IdempotencyKey.objects.filter(key=key, route=route).update(status=COMPLETED, responseStatus=response.status_code,
+                                                               responseBody=body)
+    remember(route, key, body_hash, response.status_code, body)
+
+
+def remember(route, key, body_hash, status, body):
+    caching.get_cache('idempotency').set((route, key), (body_hash, status, body))
+
+
+# Makes a view honour the Idempotency-Key header. Requests without the header are passed straight through.
+def idempotent(view):
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            key = request.headers.get('Idempotency-Key', '')[:255]
+
+            if not key:
+                return await view(request, *args, **kwargs)
+
+            body_hash = request_hash(request)
+            # Waiting on a duplicate blocks, so it's done outside the thread shared by the other sync calls
+            response = await sync_to_async(reserve, thread_sensitive=False)(key, request.path, body_hash)
+
+            if response is not None:
+                return response
+
+            try:
+                response = await view(request, *args, **kwargs)
+            except BaseException:
+                await sync_to_async(release)(key, request.path)
+                raise
+
+            await sync_to_async(complete)(key, request.path, body_hash, response)
+            return response
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key', '')[:255]
+
+        if not key:
+            return view(request, *args, **kwargs)
+
+        body_hash = request_hash(request)
+        response = reserve(key, request.path, body_hash)
+
+        if response is not None:
+            return response
+
+        try:
+            response = view(request, *args, **kwargs)
+        except BaseException:
+            release(key, request.path)
+            raise
+
+        complete(key, request.path, body_hash, response)
+        return response
+
+    return wrapper
+
+
+# Releases a reservation whose request failed with an exception, so it can be retried
+def release(key, route):
+    IdempotencyKey.objects.filter(key=key, route=route, status=IN_PROGRESS).delete()
@@ -0,0 +1,282 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+
+from api import caching, metrics
+from api.bloom import BloomFilter
+from api.cards import card_fingerprint, keyed_hash
+from api.models import BankDetails, BusinessAccount, KnownAccountsVersion, PaymentDetails, PersonalAccount
+
+# Turns away payments from unknown cards, and to unknown payee accounts, without looking up the accounts. Bloom filters
+# of every card fingerprint and payee (account number, sort code) say when a card or account is unknown, and lookups
+# which failed recently are kept for a short time in the negative_lookups cache.
+#
+# The filters are built in the background the first time they're needed, with lookups going to the database as before
+# until they're ready. Cards and bank details saved in this process are added to them straight away. Every save also
+# changes the version in KnownAccountsVersion, which each worker checks every VERSION_CHECK_INTERVAL seconds, rebuilding
+# its filters when it has changed, so cards and accounts saved by other processes are known soon after. A card or
+# account missing from the filters is turned away without going to the database, so traffic probing for cards costs
+# no queries, whether or not the cards are ones it has tried before. Cards and accounts added without a save (e.g. with
+# bulk_create) are picked up by the rebuild every REBUILD_INTERVAL seconds, or straight away if accounts_changed is
+# called after adding them.
+#
+# The keys of the cached failures include a generation, which is changed whenever an account is saved, so every failure
+# cached before then is forgotten. This works with either backend, as Django's caches can't be cleared by prefix.
+
+# The account models whose saves are watched (see account_saved)
+WATCHED_MODELS = (PaymentDetails, BankDetails, PersonalAccount, BusinessAccount)
+
+_state_lock = threading.Lock()
+_filters = None
+_built_at = None
+_build_seconds = None
+_building = False
+
+# The version the filters were built from, and when this worker last checked whether it has changed since
+_version = None
+_checked_at = None
+_outdated = False
+
+# Cards and bank details saved whilst the filters are being rebuilt, which the new filters might have missed
+_saved_during_build = []
+
+
+def payee_key(account_number, sort_code):
+    return '%d:%s' % (int(account_number), sort_code)
+
+
+def read_version():
+    return KnownAccountsVersion.objects.values_list('version', flat=True).first()
+
+
+def build_filters():
+    config = settings.KNOWN_ACCOUNTS
+    started = time.perf_counter()
+
+    # Read first, so anything saved whilst building changes it again and the filters are built once more
+    version = read_version()
+
+    # Sized with room to grow, so cards added before the next rebuild don't push up the false positive rate
+    card_count = PaymentDetails.objects.count()
+    payee_count = BankDetails.objects.count()
+
+    cards = BloomFilter(max(config['MIN_CAPACITY'], int(card_count * config['HEADROOM'])), config['ERROR_RATE'],
+                        config['MAX_BYTES'])
+    payees = BloomFilter(max(config['MIN_CAPACITY'], int(payee_count * config['HEADROOM'])), config['ERROR_RATE'],
+                         config['MAX_BYTES'])
+
+    for fingerprint in PaymentDetails.objects.exclude(cardFingerprint=None).values_list(
+            'cardFingerprint', flat=True).iterator(chunk_size=config['CHUNK_SIZE']):
+        cards.add(fingerprint)
+
+    for account_number, sort_code in BankDetails.objects.values_list('accountNumber', 'sortCode').iterator(
+            chunk_size=config['CHUNK_SIZE']):
+        payees.add(payee_key(account_number, sort_code))
+
+    return {'cards': cards, 'payees': payees}, version, time.perf_counter() - started
+
+
+def rebuild():
+    global _filters, _built_at, _build_seconds, _building, _version, _checked_at, _outdated
+
+    try:
+        filters, version, seconds = build_filters()
+
+    except DatabaseError:
+        # The old filters are kept, and the rebuild is tried again on the next lookup
+        with _state_lock:
+            _building = False
+            _saved_during_build.clear()
+
+        return
+
+    with _state_lock:
+        for name, item in _saved_during_build:
+            filters[name].add(item)
+
+        _saved_during_build.clear()
+        _filters, _built_at, _build_seconds, _building = filters, time.monotonic(), seconds, False
+        _version, _checked_at, _outdated = version, _built_at, False
+
+
+def rebuild_in_background():
+    try:
+        rebuild()
+    finally:
+        # The thread's own connection
+        connection.close()
+
+
+# Returns the filters, building them if they haven't been yet, or None if they couldn't be built
+def get_filters():
+    global _building
+
+    if not settings.KNOWN_ACCOUNTS['ENABLED']:
+        return None
+
+    check_version()
+
+    with _state_lock:
+        filters = _filters
+        stale = _built_at is None or _outdated \
+            or time.monotonic() - _built_at > settings.KNOWN_ACCOUNTS['REBUILD_INTERVAL']
+        start_build = stale and not _building
+
+        if start_build:
+            _building = True
+
+    # Until the first build is ready there are no filters, so lookups aren't filtered. After that the old filters are
+    # used until the new ones are ready.
+    if start_build:
+        threading.Thread(target=rebuild_in_background, daemon=True).start()
+
+    return filters
+
+
+# Checks whether the cards and bank details have been saved to by any process since the filters were built, at most
+# once every VERSION_CHECK_INTERVAL seconds
+def check_version():
+    global _checked_at, _outdated
+
+    with _state_lock:
+        now = time.monotonic()
+        due = _filters is not None and not _building and not _outdated \
+            and now - _checked_at > settings.KNOWN_ACCOUNTS['VERSION_CHECK_INTERVAL']
+
+        if due:
+            # Only one thread checks
+            _checked_at = now
+
+    if not due:
+        return
+
+    try:
+        version = read_version()
+
+    # Checked again next time
+    except DatabaseError:
+        return
+
+    with _state_lock:
+        if version != _version:
+            _outdated = True
+
+
+def add(name, item):
+    with _state_lock:
+        if _filters is not None:
+            _filters[name].add(item)
+
+        if _building:
+            _saved_during_build.append((name, item))
+
+
+# Connected to post_save of the account models (see api.apps). New cards and bank details are added to the filters, and
+# any saved account could be one a cached lookup failed to find, so the failures are forgotten once it's committed.
+def account_saved(sender, instance, **kwargs):
+    if sender is PaymentDetails and instance.cardFingerprint is not None:
+        add('cards', instance.cardFingerprint)
+
+    elif sender is BankDetails:
+        add('payees', payee_key(instance.accountNumber, instance.sortCode))
+
+    # Only cards and bank details are in the filters, so the other accounts don't need them rebuilt
+    if sender in (PaymentDetails, BankDetails):
+        transaction.on_commit(accounts_changed)
+    else:
+        transaction.on_commit(new_generation)
+
+
+# Tells every worker the accounts have changed, so they rebuild their filters and forget their cached failures. Called
+# once the save is committed, and by the commands which add accounts without saving them one at a time.
+def accounts_changed():
+    new_generation()
+
+    # The workers' filters are rebuilt every REBUILD_INTERVAL seconds anyway, so a failure here isn't passed on
+    try:
+        KnownAccountsVersion.objects.update_or_create(id=1, defaults={'version': uuid.uuid4().hex})
+
+    except DatabaseError:
+        pass
+
+
+# The generation of the cached failures, which starts a new one if there isn't one (or it was evicted), so failures
+# cached under an older one are never seen again
+def current_generation():
+    generation = caching.get_cache('negative_lookups').get('generation')
+
+    if generation is None:
+        generation = new_generation()
+
+    return generation
+
+
+def new_generation():
+    generation = uuid.uuid4().hex
+    caching.get_cache('negative_lookups').set('generation', generation)
+    return generation
+
+
+# Raises BankDetails.DoesNotExist if the payee's bank details aren't in the filter, or the error of the same lookup if
+# it failed recently. Returns the key to remember a failure of this lookup under.
+def check_payee(payment):
+    filters = get_filters()
+
+    if filters is not None \
+            and payee_key(payment['payee_account_number'], payment['payee_sort_code']) not in filters['payees']:
+        metrics.increment('api_known_accounts_rejected_total', (('reason', 'unknown_payee'),))
+        raise BankDetails.DoesNotExist
+
+    lookup_key = ('payee', current_generation(), int(payment['payee_account_number']), payment['payee_sort_code'],
+                  payment['payee_name'])
+    check_cached(lookup_key)
+    return lookup_key
+
+
+# The same for the payer, raising PaymentDetails.DoesNotExist if the card isn't in the filter. The cached failures are
+# keyed on a hash, so the card details aren't kept in memory.
+def check_payer(payment):
+    fingerprint = card_fingerprint(payment['card_number'])
+    filters = get_filters()
+
+    if filters is not None and fingerprint not in filters['cards']:
+        metrics.increment('api_known_accounts_rejected_total', (('reason', 'unknown_card'),))
+        raise PaymentDetails.DoesNotExist
+
+    lookup_key = ('payer', current_generation(), keyed_hash(fingerprint, payment['cvv'], payment['expiry'].isoformat(),
+                                                            payment['payer_name'], payment['email']))
+    check_cached(lookup_key)
+    return lookup_key
+
+
+def check_cached(lookup_key):
+    error = caching.get_cache('negative_lookups').get(lookup_key)
+
+    if error is not None:
+        metrics.increment('api_known_accounts_rejected_total', (('reason', 'recent_failure'),))
+        raise error
+
+
+# Remembers that the lookup failed with the error, one of the DoesNotExist exceptions of the account models
+def remember_failure(lookup_key, error):
+    caching.get_cache('negative_lookups').set(lookup_key, type(error))
+
+
+def stats():
+    with _state_lock:
+        filters, built_at, build_seconds = _filters, _built_at, _build_seconds
+
+    if filters is None:
+        return {'enabled': settings.KNOWN_ACCOUNTS['ENABLED'], 'built': False}
+
+    return {
+        'enabled': settings.KNOWN_ACCOUNTS['ENABLED'],
+        'built': True,
+        'age_seconds': round(time.monotonic() - built_at, 1),
+        'build_seconds': round(build_seconds, 3),
+        'cards': filters['cards'].stats(),
+        'payees': filters['payees'].stats(),
+    }
@@ -0,0 +1,292 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from api import status_cache
+from api.cards import seal
+from api.functions import error_response, check_transaction_open
+from api.models import Transaction, ArchivedTransaction, SettlementSummary, PNSOutbox
+
+# Writes to transactions. Each change of status is a single conditional UPDATE, so two requests racing to refund or
+# cancel the same transaction can't both succeed. The settlement summary is updated in the same database transaction as
+# the transactions it totals. The cached status of a transaction (see api/status_cache.py) is updated along with it.
+#
+# Old transactions are moved to ArchivedTransaction by archive_transactions. Reads and changes of status by ID look in
+# Transaction first, then the archive, so the archive is only read for transactions which have been moved.
+
+# Transactions with these statuses can't be refunded or cancelled. Pending payments haven't been sent to the PNS yet,
+# and Refunding ones are having a refund sent to the PNS.
+CLOSED_STATUSES = ("Refunded", "Cancelled", "Refund Transaction", "Pending", "Failed", "Refunding")
+
+# The statuses of payments in the PNS outbox. Payments which have been sent are removed from it.
+OUTBOX_QUEUED = "Queued"
+OUTBOX_SENDING = "Sending"
+OUTBOX_FAILED = "Failed"
+
+# Payments which count towards the settlement summary. Refunded payments still count, with their refunds counted
+# separately.
+PAID_STATUSES = ("Completed", "Refunded", "Refunding")
+
+# The tables a transaction can be in, in the order they're looked in. A transaction is moved between them in one
+# database transaction, so it's always in exactly one.
+TRANSACTION_TABLES = (Transaction, ArchivedTransaction)
+
+# Transactions with these statuses are archived once they're old enough, and Completed ones once they're older still.
+# Pending and Failed payments are kept, as they're in the outbox.
+ARCHIVED_STATUSES = ("Refunded", "Cancelled", "Refund Transaction")
+
+
+# Saves a completed payment
+def record_payment(new_transaction):
+    with transaction.atomic():
+        new_transaction.save()
+        add_to_settlement(new_transaction.payee_id, new_transaction.currency, new_transaction.date,
+                          payment_count=1, payment_total=new_transaction.amount)
+        status_cache.changed(new_transaction.id, "Completed", new_transaction.amount, new_transaction.currency,
+                             new_transaction.date)
+
+
+# Saves a batch of completed payments in one go, adding them to the summary one business, currency and day at a time
+def record_payments(new_transactions):
+    totals = {}
+
+    for new_transaction in new_transactions:
+        key = (new_transaction.payee_id, new_transaction.currency, new_transaction.date)
+        count, total = totals.get(key, (0, 0.0))
+        totals[key] = (count + 1, total + new_transaction.amount)
+
+    with transaction.atomic():
+        Transaction.objects.bulk_create(new_transactions)
+
+        for (payee_id, currency, day), (count, total) in totals.items():
+            add_to_settlement(payee_id, currency, day, payment_count=count, payment_total=total)
+
+        # The IDs are only known on databases which return them from a bulk insert, the rest are read when polled
+        for new_transaction in new_transactions:
+            if new_transaction.id is not None:
+                status_cache.changed(new_transaction.id, "Completed", new_transaction.amount,
+                                     new_transaction.currency, new_transaction.date)
+
+
+# Saves a payment to be sent to the PNS in the background, along with its place in the outbox. It isn't added to the
+# settlement summary until it has been sent. The body for the PNS holds the card details, so it's kept encrypted (see
+# api/cards.py), and only until the payment has been sent or has failed.
+def record_pending_payment(new_transaction, pns_payload, now):
+    with transaction.atomic():
+        new_transaction.save()
+        PNSOutbox.objects.create(transaction=new_transaction, payload=seal(pns_payload), status=OUTBOX_QUEUED,
+                                 nextAttemptAt=now, createdAt=now)
+        status_cache.changed(new_transaction.id, "Pending", new_transaction.amount, new_transaction.currency,
+                             new_transaction.date)
+
+
+# Marks a payment the PNS has accepted as completed, and removes it from the outbox. Returns False if the outbox row
+# was claimed by another worker in the meantime.
+def complete_pending_payment(outbox_id, claim_token):
+    with transaction.atomic():
+        claimed = PNSOutbox.objects.filter(id=outbox_id, claimToken=claim_token)
+        transaction_id = claimed.values_list('transaction_id', flat=True).first()
+
+        if transaction_id is None or claimed.delete()[0] == 0:
+            return False
+
+        if Transaction.objects.filter(id=transaction_id, transactionStatus="Pending") \
+                .update(transactionStatus="Completed") > 0:
+            completed = Transaction.objects.filter(id=transaction_id) \
+                .values('payee_id', 'currency', 'date', 'amount').get()
+            add_to_settlement(completed['payee_id'], completed['currency'], completed['date'],
+                              payment_count=1, payment_total=completed['amount'])
+            status_cache.changed(transaction_id, "Completed", completed['amount'], completed['currency'],
+                                 completed['date'])
+
+    return True
+
+
+# Marks a payment the PNS rejected (or which ran out of attempts) as failed. The outbox row is kept, with the error, but
+# not the card details, which are no longer needed.
+def fail_pending_payment(outbox_id, claim_token, error):
+    with transaction.atomic():
+        claimed = PNSOutbox.objects.filter(id=outbox_id, claimToken=claim_token)
+        transaction_id = claimed.values_list('transaction_id', flat=True).first()
+
+        if transaction_id is None or claimed.update(status=OUTBOX_FAILED, claimToken=None, lockedUntil=None,
+                                                    lastError=error, payload="") == 0:
+            return False
+
+        Transaction.objects.filter(id=transaction_id, transactionStatus="Pending").update(transactionStatus="Failed")
+        status_cache.forget(transaction_id)
+
+    return True
+
+
+# Returns the fields given of a transaction, from whichever table it's in, or None if it doesn't exist
+def find_transaction(transaction_id, *fields):
+    for model in TRANSACTION_TABLES:
+        found = model.objects.filter(id=transaction_id).values(*fields).first()
+
+        if found is not None:
+            return found
+
+    return None
+
+
+# Returns the fields of a transaction needed to refund it, without building a model instance, or None if it doesn't
+# exist
+def get_transaction(transaction_id):
+    return find_transaction(transaction_id, 'id', 'payer_id', 'payee_id', 'amount', 'currency', 'date',
+                            'transactionStatus')
+
+
+# Sets the status of a transaction which is still open, in whichever table it's in. Returns the table it was in, or None
+# if it doesn't exist or is already closed. Must be called inside transaction.atomic.
+def close_transaction(transaction_id, status):
+    for model in TRANSACTION_TABLES:
+        if model.objects.filter(id=transaction_id).exclude(transactionStatus__in=CLOSED_STATUSES) \
+                .update(transactionStatus=status) > 0:
+            return model
+
+    return None
+
+
+# Changes the status of a transaction from one status to another, in whichever table it's in. Returns the table it was
+# in, or None if it doesn't exist or has a different status. Must be called inside transaction.atomic.
+def change_status(transaction_id, current_status, status):
+    for model in TRANSACTION_TABLES:
+        if model.objects.filter(id=transaction_id, transactionStatus=current_status) \
+                .update(transactionStatus=status) > 0:
+            return model
+
+    return None
+
+
+# Marks the transaction as Refunding before its refund is sent to the PNS, so only one refund of it can be sent at a
+# time. Returns False if the transaction was closed (or deleted) since it was read.
+def claim_refund(original):
+    with transaction.atomic():
+        if close_transaction(original['id'], "Refunding") is None:
+            return False
+
+        status_cache.changed(original['id'], "Refunding", original['amount'], original['currency'], original['date'])
+
+    return True
+
+
+# Puts a transaction claimed by claim_refund back to the status it had before, once the PNS has turned the refund down
+def release_refund(original):
+    with transaction.atomic():
+        status = original['transactionStatus']
+
+        if change_status(original['id'], "Refunding", status) is not None:
+            status_cache.changed(original['id'], status, original['amount'], original['currency'], original['date'])
+
+
+# Marks a transaction claimed by claim_refund as refunded, once the PNS has accepted the refund, and records how much
+# was refunded (as a negative amount), in one database transaction. Returns False if the transaction was deleted since
+# it was claimed.
+def refund_transaction(original, amount):
+    with transaction.atomic():
+        if change_status(original['id'], "Refunding", "Refunded") is None:
+            return False
+
+        # Refunds of archived payments are still written to Transaction, and archived with the rest later
+        Transaction.objects.create(payer_id=original['payer_id'], payee_id=original['payee_id'], amount=-amount,
+                                   currency=original['currency'], date=original['date'],
+                                   transactionStatus="Refund Transaction")
+
+        # The refund is counted on the day of the payment it refunds, like the refund transaction itself
+        add_to_settlement(original['payee_id'], original['currency'], original['date'],
+                          refund_count=1, refund_total=amount)
+        status_cache.changed(original['id'], "Refunded", original['amount'], original['currency'], original['date'])
+
+    return True
+
+
+# Marks the transaction as cancelled, and takes it off the settlement summary. Returns False if it doesn't exist or is
+# already closed.
+def cancel_transaction(transaction_id):
+    with transaction.atomic():
+        model = close_transaction(transaction_id, "Cancelled")
+
+        if model is None:
+            return False
+
+        # The row can't change again before the transaction commits, as it's now closed
+        cancelled = model.objects.filter(id=transaction_id).values('payee_id', 'currency', 'date', 'amount').get()
+        add_to_settlement(cancelled['payee_id'], cancelled['currency'], cancelled['date'],
+                          payment_count=-1, payment_total=-cancelled['amount'])
+        status_cache.changed(transaction_id, "Cancelled", cancelled['amount'], cancelled['currency'],
+                             cancelled['date'])
+
+    return True
+
+
+# Adds to the totals of a business for a currency and day, creating the row if it's the first transaction of the day.
+# Must be called inside transaction.atomic, along with the write being totalled.
+def add_to_settlement(payee_id, currency, day, payment_count=0, payment_total=0.0, refund_count=0, refund_total=0.0):
+    summary = SettlementSummary.objects.filter(payee_id=payee_id, currency=currency, date=day)
+    changes = {
+        'paymentCount': F('paymentCount') + payment_count,
+        'paymentTotal': F('paymentTotal') + payment_total,
+        'refundCount': F('refundCount') + refund_count,
+        'refundTotal': F('refundTotal') + refund_total
+    }
+
+    if summary.update(**changes) > 0:
+        return
+
+    try:
+        # A savepoint, so a failed insert doesn't undo the rest of the transaction
+        with transaction.atomic():
+            SettlementSummary.objects.create(payee_id=payee_id, currency=currency, date=day,
+                                             paymentCount=payment_count, paymentTotal=payment_total,
+                                             refundCount=refund_count, refundTotal=refund_total)
+
+    # Another request created the row first, so it's added to instead
+    except IntegrityError:
+        summary.update(**changes)
+
+
+# Moves a batch of old transactions with IDs after after_id to the archive, in one database transaction. Returns how
+# many were moved and the last ID moved, which the next batch starts after.
+def archive_batch(closed_before, completed_before, batch_size, after_id=0):
+    old = Q(transactionStatus__in=ARCHIVED_STATUSES, date__lt=closed_before) | \
+        Q(transactionStatus="Completed", date__lt=completed_before)
+    archived_at = timezone.now()
+
+    with transaction.atomic():
+        # Any transaction can be moved, the newest included. Django creates the ID column with AUTOINCREMENT on SQLite
+        # (and as an identity or auto-increment column on the other databases), so an ID is never given out again
+        # once its row has been deleted, and a new transaction can't take the ID of an archived one.
+        #
+        # Locked, so a refund or cancellation can't change them between being copied and deleted
+        rows = list(Transaction.objects.select_for_update().filter(old, id__gt=after_id)
+                    .order_by('id').values_list('id', 'payer_id', 'payee_id', 'amount', 'currency', 'date',
+                                                'transactionStatus')[:batch_size])
+
+        if not rows:
+            return 0, after_id
+
+        ArchivedTransaction.objects.bulk_create([
+            ArchivedTransaction(id=transaction_id, payer_id=payer, payee_id=payee, amount=amount, currency=currency,
+                                date=day, transactionStatus=status, archivedAt=archived_at)
+            for transaction_id, payer, payee, amount, currency, day, status in rows])
+        Transaction.objects.filter(id__in=[row[0] for row in rows]).delete()
+
+    return len(rows), rows[-1][0]
+
+
+# Works out why a refund or cancellation didn't change anything, returning the JSON response of the error. This is the
+# only time the transaction needs to be read again.
+def transition_error(transaction_id, response_data):
+    found = find_transaction(transaction_id, 'transactionStatus')
+
+    # Will produce the appropriate error code if we can't find the transaction
+    if found is None:
+        return error_response(response_data, 402)
+
+    transaction_error = check_transaction_open(found['transactionStatus'], response_data)
+
+    if transaction_error is not None:
+        return transaction_error
+
+    return error_response(response_data, 404)
@@ -0,0 +1,126 @@
+from api import known_accounts
+from api.cards import card_fingerprint, card_matches
+from api.models import PaymentDetails, BankDetails, BusinessAccount, PersonalAccount
+
+
+# Finds the business account being paid, from the cleaned values of a payment. Payee accounts which aren't in the
+# filter of known accounts, or which couldn't be found a moment ago, are turned away without being looked up (see
+# api/known_accounts.py). Raises BankDetails.DoesNotExist if the bank details don't exist, or
+# BusinessAccount.DoesNotExist if they do but there isn't a business account for them.
+def find_payee(payment):
+    lookup_key = known_accounts.check_payee(payment)
+
+    try:
+        return lookup_payee(payment)
+
+    except (BankDetails.DoesNotExist, BusinessAccount.DoesNotExist) as error:
+        known_accounts.remember_failure(lookup_key, error)
+        raise
+
+
+# Looks up the business account being paid, joined to its bank details in one query
+def lookup_payee(payment):
+    try:
+        return BusinessAccount.objects.select_related('bankDetails').get(
+            bankDetails__accountNumber=payment['payee_account_number'],
+            bankDetails__sortCode=payment['payee_sort_code'],
+            bankDetails__accountName=payment['payee_name'])
+
+    except BusinessAccount.DoesNotExist:
+        # Only when the lookup fails do we check which of the two was missing
+        if not BankDetails.objects.filter(accountNumber=payment['payee_account_number'],
+                                          sortCode=payment['payee_sort_code'],
+                                          accountName=payment['payee_name']).exists():
+            raise BankDetails.DoesNotExist
+
+        raise
+
+
+# Finds the personal account paying, from the cleaned values of a payment, turning away unknown cards in the same way.
+# Raises PaymentDetails.DoesNotExist if the card details don't exist, or PersonalAccount.DoesNotExist if there isn't an
+# account linked to them.
+def find_payer(payment):
+    lookup_key = known_accounts.check_payer(payment)
+
+    try:
+        return lookup_payer(payment)
+
+    except (PaymentDetails.DoesNotExist, PersonalAccount.DoesNotExist) as error:
+        known_accounts.remember_failure(lookup_key, error)
+        raise
+
+
+# Looks up the personal account paying, joined to its card details in one query. The card is found by its fingerprint
+# alone, and its security code and expiry date are then checked on the row found.
+def lookup_payer(payment):
+    fingerprint = card_fingerprint(payment['card_number'])
+
+    payer = PersonalAccount.objects.select_related('paymentDetails').filter(
+        paymentDetails__cardFingerprint=fingerprint, fullName=payment['payer_name'], email=payment['email']).first()
+
+    if payer is not None and card_matches(payer.paymentDetails, payment['cvv'], payment['expiry']):
+        return payer
+
+    # Only when the lookup fails do we check which of the two was missing
+    card = PaymentDetails.objects.filter(cardFingerprint=fingerprint).first()
+
+    if card is None or not card_matches(card, payment['cvv'], payment['expiry']):
+        raise PaymentDetails.DoesNotExist
+
+    raise PersonalAccount.DoesNotExist
+
+
+# Finds the payee and payer of every payment in a batch, given as a dictionary of cleaned values. Returns a dictionary
+# with the same keys, holding either the (payee, payer) of each payment or the error code of the lookup which failed.
+# Two queries are made, with a third and fourth only if some accounts couldn't be found.
+def find_batch_accounts(payments):
+    payee_objects = {
+        (business.bankDetails.accountNumber, business.bankDetails.sortCode, business.bankDetails.accountName): business
+        for business in BusinessAccount.objects.select_related('bankDetails').filter(
+            bankDetails__accountNumber__in={payment['payee_account_number'] for payment in payments.values()})
+    }
+
+    fingerprints = {key: card_fingerprint(payment['card_number']) for key, payment in payments.items()}
+
+    # Keyed on the fingerprint, name and email, as the security code and expiry date are checked on the card found
+    payer_objects = {
+        (personal.paymentDetails.cardFingerprint, personal.fullName, personal.email): personal
+        for personal in PersonalAccount.objects.select_related('paymentDetails').filter(
+            paymentDetails__cardFingerprint__in=set(fingerprints.values()))
+    }
+
+    accounts = {}
+    missing_payees = {}
+    missing_payers = {}
+
+    for key, payment in payments.items():
+        payee_key = (int(payment['payee_account_number']), payment['payee_sort_code'], payment['payee_name'])
+        payer = payer_objects.get((fingerprints[key], payment['payer_name'], payment['email']))
+
+        # The payee is checked first, in the same order as a single payment
+        if payee_key not in payee_objects:
+            missing_payees[key] = payee_key
+        elif payer is None or not card_matches(payer.paymentDetails, payment['cvv'], payment['expiry']):
+            missing_payers[key] = payment
+        else:
+            accounts[key] = (payee_objects[payee_key], payer)
+
+    # Only when lookups fail do we check whether it was the bank details or the business account that was missing
+    if missing_payees:
+        bank_details = set(BankDetails.objects.filter(
+            accountNumber__in={payee_key[0] for payee_key in missing_payees.values()}
+        ).values_list('accountNumber', 'sortCode', 'accountName'))
+
+        for key, payee_key in missing_payees.items():
+            accounts[key] = 109 if payee_key in bank_details else 107
+
+    # And the same for the card details and the personal account
+    if missing_payers:
+        cards = {card.cardFingerprint: card for card in PaymentDetails.objects.filter(
+            cardFingerprint__in={fingerprints[key] for key in missing_payers})}
+
+        for key, payment in missing_payers.items():
+            card = cards.get(fingerprints[key])
+            accounts[key] = 108 if card is not None and card_matches(card, payment['cvv'], payment['expiry']) else 106
+
+    return accounts
@@ -0,0 +1,47 @@
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import ledger
+
+
+class Command(BaseCommand):
+    help = "Moves old refunded, cancelled and completed transactions to the archive table, a batch at a time"
+
+    def add_arguments(self, parser):
+        config = settings.TRANSACTION_ARCHIVE
+
+        parser.add_argument('--closed-after-days', type=int, default=config['CLOSED_AFTER_DAYS'],
+                            help="Age in days at which refunded and cancelled transactions are archived")
+        parser.add_argument('--completed-after-days', type=int, default=config['COMPLETED_AFTER_DAYS'],
+                            help="Age in days at which completed payments are archived")
+        parser.add_argument('--batch-size', type=int, default=config['BATCH_SIZE'],
+                            help="Transactions moved in each database transaction")
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help="Stops after this many batches, the next run carries on from there")
+        parser.add_argument('--pause', type=float, default=0,
+                            help="Seconds to wait between batches, to leave room for payments on a busy database")
+
+    def handle(self, *args, **options):
+        today = date.today()
+        closed_before = today - timedelta(days=options['closed_after_days'])
+        completed_before = today - timedelta(days=options['completed_after_days'])
+
+        # Each batch is committed on its own, so the command can be stopped at any point and run again later
+        archived = batches = last_id = 0
+
+        while options['max_batches'] is None or batches < options['max_batches']:
+            moved, last_id = ledger.archive_batch(closed_before, completed_before, options['batch_size'], last_id)
+
+            if moved == 0:
+                break
+
+            archived += moved
+            batches += 1
+
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write("Archived %d transactions in %d batches" % (archived, batches))
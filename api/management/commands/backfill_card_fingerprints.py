@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from api import known_accounts
+from api.cards import card_fingerprint
+from api.models import PaymentDetails
+
+
+class Command(BaseCommand):
+    help = "Sets the fingerprint of every card without one, a batch at a time"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Cards updated per transaction")
+        parser.add_argument('--all', action='store_true',
+                            help="Sets the fingerprint of every card, e.g. after changing CARD_FINGERPRINT_KEY")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        cards = PaymentDetails.objects.order_by('paymentId')
+
+        if not options['all']:
+            cards = cards.filter(cardFingerprint__isnull=True)
+
+        updated = 0
+        last_id = None
+
+        # Each batch starts after the last card of the previous one, so earlier cards aren't read again
+        while True:
+            batch = cards if last_id is None else cards.filter(paymentId__gt=last_id)
+            batch = list(batch.only('paymentId', 'cardNumber')[:batch_size])
+
+            if not batch:
+                break
+
+            for card in batch:
+                card.cardFingerprint = card_fingerprint(card.cardNumber)
+
+            try:
+                with transaction.atomic():
+                    PaymentDetails.objects.bulk_update(batch, ['cardFingerprint'])
+
+            except IntegrityError:
+                raise CommandError("A card with an ID from %d to %d has the same card number as another card, which "
+                                   "needs fixing before its fingerprint can be set"
+                                   % (batch[0].paymentId, batch[-1].paymentId))
+
+            updated += len(batch)
+            last_id = batch[-1].paymentId
+
+        # bulk_update doesn't send post_save, so the workers are told the cards have changed here
+        if updated:
+            known_accounts.accounts_changed()
+
+        self.stdout.write("Set the fingerprint of %d cards" % updated)
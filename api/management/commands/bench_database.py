@@ -0,0 +1,101 @@
+import json
+import logging
+import os
+import random
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api.management.commands.load_test import payment_body, run_phase, seed_accounts
+from api.stubs import StubServer, pns_response
+
+# Measures concurrent payment throughput on SQLite with the database settings from before the production profile (a
+# rollback journal, no pragmas, a new connection per request and deferred transactions), and with the profile in
+# settings.py. Each is run against its own new database file, with a local stub of the PNS.
+
+PROFILES = {
+    'before': {'pragmas': {}, 'options': {}, 'conn_max_age': 0},
+    'after': {'pragmas': settings.SQLITE_PRAGMAS, 'options': settings.DATABASES['default'].get('OPTIONS', {}),
+              'conn_max_age': settings.DATABASES['default'].get('CONN_MAX_AGE', 0)},
+}
+
+
+class Command(BaseCommand):
+    help = "Compares concurrent payment throughput on SQLite before and after the production database profile"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help="Payments made with each profile")
+        parser.add_argument('--concurrency', type=int, default=16, help="Payments in flight at once")
+        parser.add_argument('--accounts', type=int, default=100, help="Personal accounts the payments are made from")
+        parser.add_argument('--pns-latency', type=float, default=0.0, help="Seconds the PNS stub takes to answer")
+        parser.add_argument('--seed', type=int, default=None, help="Seed for the random amounts and accounts")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("The database profile benchmark is only for SQLite")
+
+        pns = StubServer(pns_response, options['pns_latency'])
+        services = {name: dict(service) for name, service in settings.OUTBOUND_SERVICES.items()}
+        services['pns']['URL'] = pns.start()
+
+        # Only the syntax of emails is checked, as in load_test
+        syntax_only = override_settings(EMAIL_VALIDATION={'MODE': 'syntax'})
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+
+        # Turned off for the same reason as in load_test
+        no_rate_limit = override_settings(RATE_LIMIT=dict(settings.RATE_LIMIT, ENABLED=False))
+
+        report = {}
+        setup_test_environment()
+
+        try:
+            with override_settings(OUTBOUND_SERVICES=services), syntax_only, no_rate_limit:
+                for name, profile in PROFILES.items():
+                    random.seed(options['seed'])
+                    report[name] = self.run_profile(profile, options)
+
+        finally:
+            teardown_test_environment()
+            pns.stop()
+
+        before, after = report['before']['throughput_rps'], report['after']['throughput_rps']
+        report['speedup'] = round(after / before, 2) if before and after else None
+
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run_profile(self, profile, options):
+        database_directory = tempfile.mkdtemp()
+        settings_dict = connection.settings_dict
+        old_options, old_conn_max_age = settings_dict['OPTIONS'], settings_dict['CONN_MAX_AGE']
+
+        settings_dict['TEST']['NAME'] = os.path.join(database_directory, 'bench_database.sqlite3')
+        settings_dict['OPTIONS'] = dict(profile['options'])
+        settings_dict['CONN_MAX_AGE'] = profile['conn_max_age']
+
+        try:
+            # Set before the database is created, as WAL is kept in the database file once it's turned on
+            with override_settings(SQLITE_PRAGMAS=profile['pragmas']):
+                old_database_name = connection.creation.create_test_db(verbosity=0, serialize=False)
+
+                try:
+                    expiry = seed_accounts(options['accounts'])
+                    payments = [payment_body(random.randint(1, options['accounts']), expiry)
+                                for _ in range(options['requests'])]
+
+                    return run_phase('/initiatePayment', payments, options['concurrency'])
+
+                finally:
+                    connection.creation.destroy_test_db(old_database_name, verbosity=0)
+
+        finally:
+            settings_dict['OPTIONS'], settings_dict['CONN_MAX_AGE'] = old_options, old_conn_max_age
+
+            # WAL leaves its -wal and -shm files behind if a connection was still open
+            for file_name in os.listdir(database_directory):
+                os.remove(os.path.join(database_directory, file_name))
+
+            os.rmdir(database_directory)
@@ -0,0 +1,65 @@
+import json
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from api import codec
+from api.management.commands.bench_validation import VALID_PAYMENT
+
+PAYMENT_BODY = json.dumps(VALID_PAYMENT).encode()
+RESPONSE = {'ErrorCode': None, 'Comment': "Payment Successfully Completed"}
+UPSTREAM_ERROR = json.dumps({'ErrorCode': 3, 'Comment': "Error. The card was declined by the issuer"}).encode()
+
+
+# The JSON work done for one payment before api/codec.py: the body was parsed by initiate_payment and again by
+# request_transaction_pns, the response was encoded by Django's JsonResponse, and parsed again by the idempotency check
+def legacy_payment_json():
+    json.loads(PAYMENT_BODY)
+    json.loads(PAYMENT_BODY)
+    content = json.dumps(RESPONSE, cls=DjangoJSONEncoder).encode()
+    json.loads(content)
+
+
+# The same payment now, with the given loads and dumps: the body is parsed once and the response encoded once
+def payment_json(loads, dumps):
+    loads(PAYMENT_BODY)
+    dumps(RESPONSE)
+
+
+def legacy_upstream_error():
+    # requests decodes the bytes to .text first, which json.loads then parses
+    json.loads(UPSTREAM_ERROR.decode())
+
+
+def stdlib_dumps(data):
+    return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+class Command(BaseCommand):
+    help = "Times the JSON encoding and decoding done per request, before and after the parse-once codec"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=50000, help="Runs timed for each case")
+
+    def handle(self, *args, **options):
+        number = options['number']
+
+        # (name, before, after) for each case. The codec in use is compared against the old code, and the json module
+        # on its own shows how much comes from only parsing once.
+        cases = [
+            ('payment, json module', legacy_payment_json, lambda: payment_json(json.loads, stdlib_dumps)),
+            ('payment, %s' % codec.NAME, legacy_payment_json, lambda: payment_json(codec.loads, codec.dumps)),
+            ('decode payment body', lambda: json.loads(PAYMENT_BODY), lambda: codec.loads(PAYMENT_BODY)),
+            ('encode response', lambda: stdlib_dumps(RESPONSE), lambda: codec.dumps(RESPONSE)),
+            ('decode upstream error', legacy_upstream_error, lambda: codec.loads(UPSTREAM_ERROR)),
+        ]
+
+        self.stdout.write("Codec: %s" % codec.NAME)
+        self.stdout.write("%-26s %12s %12s %8s" % ('case', 'before (us)', 'after (us)', 'speedup'))
+
+        for name, before_case, after_case in cases:
+            before = min(timeit.repeat(before_case, number=number, repeat=3)) / number * 1e6
+            after = min(timeit.repeat(after_case, number=number, repeat=3)) / number * 1e6
+
+            self.stdout.write("%-26s %12.2f %12.2f %7.1fx" % (name, before, after, before / after))
@@ -0,0 +1,100 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Compares the full and API only settings profiles (see djangoProject/wsgi.py). For each profile a number of new
+# worker processes are started, and each one is timed from being started to answering its first request, then times
+# the same request many more times to find the cost of each request through the middleware. The request is a
+# currency conversion with an empty body, which is answered with an error without any database or network calls, so
+# what's measured is the startup and the middleware rather than the view.
+
+WORKER = '''
+import io, json, logging, sys, time
+
+started = time.perf_counter()
+from djangoProject.wsgi import application
+loaded = time.perf_counter()
+
+# Each error response would otherwise be logged, which would be timed too
+logging.getLogger('django.request').setLevel(logging.ERROR)
+
+
+def environ():
+    return {'REQUEST_METHOD': 'POST', 'PATH_INFO': '/convertCurrency', 'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80', 'REMOTE_ADDR': '127.0.0.1', 'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': '0', 'wsgi.input': io.BytesIO(b''), 'wsgi.url_scheme': 'http'}
+
+
+def request():
+    return b''.join(application(environ(), lambda status, headers: None))
+
+
+body = request()
+answered = time.perf_counter()
+print(json.dumps({'import_ms': (loaded - started) * 1000, 'first_request_ms': (answered - loaded) * 1000,
+                  'response': body.decode()}), flush=True)
+
+requests = int(sys.argv[1])
+started = time.perf_counter()
+
+for _ in range(requests):
+    request()
+
+print(json.dumps({'per_request_us': (time.perf_counter() - started) / requests * 1e6}), flush=True)
+'''
+
+
+def median(values):
+    return round(statistics.median(values), 2)
+
+
+class Command(BaseCommand):
+    help = "Times worker startup to first response, and the cost of each request, with the full and API only profiles"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help="Workers started with each profile")
+        parser.add_argument('--requests', type=int, default=5000, help="Requests timed in each worker")
+
+    def handle(self, *args, **options):
+        report = {}
+
+        for profile in ('full', 'api'):
+            runs = [self.run_worker(profile, options['requests']) for _ in range(options['runs'])]
+
+            report[profile] = {
+                'cold_start_ms': median([run['cold_start_ms'] for run in runs]),
+                'import_ms': median([run['import_ms'] for run in runs]),
+                'first_request_ms': median([run['first_request_ms'] for run in runs]),
+                'per_request_us': median([run['per_request_us'] for run in runs]),
+                'response': runs[0]['response'],
+            }
+
+        report['cold_start_speedup'] = round(report['full']['cold_start_ms'] / report['api']['cold_start_ms'], 2)
+        report['per_request_speedup'] = round(report['full']['per_request_us'] / report['api']['per_request_us'], 2)
+
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run_worker(self, profile, requests):
+        environment = dict(os.environ, DJANGO_PROFILE=profile, PYTHONPATH=str(settings.BASE_DIR))
+
+        # Set by manage.py, and would be used instead of the profile
+        environment.pop('DJANGO_SETTINGS_MODULE', None)
+
+        started = time.perf_counter()
+        worker = subprocess.Popen([sys.executable, '-c', WORKER, str(requests)], stdout=subprocess.PIPE,
+                                  cwd=settings.BASE_DIR, env=environment)
+
+        # The time from starting the process includes starting Python itself, as it would for a new worker
+        first = json.loads(worker.stdout.readline())
+        first['cold_start_ms'] = (time.perf_counter() - started) * 1000
+
+        first.update(json.loads(worker.stdout.readline()))
+        worker.wait()
+
+        return first
@@ -0,0 +1,175 @@
+import re
+import timeit
+from functools import partial
+from datetime import date, datetime
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from email_validator import validate_email, EmailNotValidError
+
+from api import schemas
+
+
+# The payment and refund validation as it was before api/schemas.py, kept here as the baseline to compare against (and
+# for the tests, to check the schemas give the same errors). Returns the (error code, comment) of the first error, or
+# the cleaned values.
+def legacy_payment(request_data):
+    card_regex = "^[0-9]{16}$"
+    three_digit_regex = "^[0-9]{3}$"
+    sort_code_regex = "^[0-9]{6}$"
+    account_number_regex = "^[0-9]{1,8}$"
+
+    card_number = request_data.get('CardNumber', None)
+    cvv = request_data.get('CVV', None)
+    payer_currency_code = request_data.get('PayerCurrencyCode', None)
+    payee_currency_code = request_data.get('PayeeCurrencyCode', None)
+    amount = request_data.get('Amount', None)
+    expiry = request_data.get('Expiry', None)
+    payee_account_number = request_data.get('PayeeBankAccNum', None)
+    payee_sort_code = request_data.get('PayeeBankSortCode', None)
+
+    compiled_three_digit_regex = re.compile(three_digit_regex)
+    compiled_card_regex = re.compile(card_regex)
+    compiled_sort_code_regex = re.compile(sort_code_regex)
+    compiled_account_number_regex = re.compile(account_number_regex)
+
+    if not isinstance(card_number, str):
+        return 102, "Error. Card number is not present."
+
+    card_number = re.sub('[^0-9a-zA-Z]+', '', card_number)
+
+    if not re.search(compiled_card_regex, card_number):
+        return 104, "Error. Card number is not in the correct format"
+
+    if not isinstance(payer_currency_code, str) or not isinstance(payee_currency_code, str):
+        return 102, "Error. A Currency code for the payer and payee need to be supplied"
+
+    if not re.search(compiled_three_digit_regex, payer_currency_code) \
+            or not re.search(compiled_three_digit_regex, payee_currency_code):
+        return 104, "Error. One or more of the currency codes provided are not in the correct format"
+
+    if not isinstance(cvv, str) or not re.search(compiled_three_digit_regex, cvv):
+        return 104, "Error. CVV is either not present or not in the correct format."
+
+    if not isinstance(payee_account_number, str) \
+            or not re.search(compiled_account_number_regex, payee_account_number):
+        return 104, "Error. Account number is either not present or not in the correct format."
+
+    if not isinstance(payee_sort_code, str):
+        return 102, "Error. Payee Sort Code is not present."
+
+    payee_sort_code = re.sub('[^0-9a-zA-Z]+', '', payee_sort_code)
+
+    if not re.search(compiled_sort_code_regex, payee_sort_code):
+        return 104, "Error. Sort Code is not in the correct format"
+
+    if not isinstance(amount, float) or amount <= 0:
+        return 104, "Error. Amount must be a float value larger than 0"
+
+    payer_name = request_data.get('CardHolderName', None)
+    address = request_data.get('CardHolderAddress', None)
+    email = request_data.get('Email', None)
+    payee_name = request_data.get('RecipientName', None)
+
+    if not all(value is not None for value in
+               [expiry, payer_name, address, email, payee_account_number, payee_sort_code, payee_name]):
+        return 102, None
+
+    try:
+        validate_email(email)
+        expiry = datetime.strptime(expiry, '%Y-%m-%d').date()
+
+    except EmailNotValidError:
+        return 104, "Error. Email provided is not in the correct format."
+
+    except ValueError:
+        return 104, "Error. Date is not valid. (Needs to be a real date in YYYY-MM-DD Format)"
+
+    if expiry <= date.today():
+        return 104, "Error. Card has expired."
+
+    return {'card_number': card_number, 'cvv': cvv, 'expiry': expiry, 'amount': amount,
+            'payee_sort_code': payee_sort_code}
+
+
+def legacy_refund(request_data):
+    currency_code_regex = "^[0-9]{3}$"
+    compiled_currency_code_regex = re.compile(currency_code_regex)
+
+    transaction_id = request_data.get('TransactionUUID', None)
+    amount = request_data.get('Amount', None)
+    currency_code = request_data.get('CurrencyCode', None)
+
+    if any(value is None for value in (transaction_id, amount, currency_code)):
+        return 102, None
+
+    if not isinstance(transaction_id, int) or transaction_id < 0:
+        return 103, "Error. Transaction ID needs to be a positive integer"
+
+    if not isinstance(amount, float) or amount <= 0:
+        return 104, "Error. Amount must be a float value larger than 0"
+
+    if not re.search(compiled_currency_code_regex, currency_code):
+        return 104, "Error. The currency code provided is not in the correct format"
+
+    return {'transaction_id': transaction_id, 'amount': amount, 'currency_code': currency_code}
+
+
+VALID_PAYMENT = {
+    'CardNumber': '1234-5678-1234-5678',
+    'CVV': '123',
+    'PayerCurrencyCode': '826',
+    'PayeeCurrencyCode': '826',
+    'Amount': 10.0,
+    'Expiry': '2099-01-01',
+    'PayeeBankAccNum': '12345678',
+    'PayeeBankSortCode': '11-22-33',
+    'CardHolderName': 'Jo Bloggs',
+    'CardHolderAddress': '1 High Street',
+    'Email': 'jo@example.com',
+    'RecipientName': 'Shop Ltd'
+}
+
+VALID_REFUND = {
+    'TransactionUUID': 1,
+    'Amount': 5.0,
+    'CurrencyCode': '826'
+}
+
+# The bodies timed, as (name, legacy function, schema, body). The rejected bodies fail at different points, as
+# malformed traffic doesn't all fail on the first field.
+CASES = [
+    ('payment valid', legacy_payment, schemas.PAYMENT_SCHEMA, VALID_PAYMENT),
+    ('payment reject card', legacy_payment, schemas.PAYMENT_SCHEMA, dict(VALID_PAYMENT, CardNumber='1234')),
+    ('payment reject sort code', legacy_payment, schemas.PAYMENT_SCHEMA, dict(VALID_PAYMENT, PayeeBankSortCode='1')),
+    ('payment reject amount', legacy_payment, schemas.PAYMENT_SCHEMA, dict(VALID_PAYMENT, Amount=-1.0)),
+    ('payment reject expiry', legacy_payment, schemas.PAYMENT_SCHEMA, dict(VALID_PAYMENT, Expiry='2000-01-01')),
+    ('refund valid', legacy_refund, schemas.REFUND_SCHEMA, VALID_REFUND),
+    ('refund reject id', legacy_refund, schemas.REFUND_SCHEMA, dict(VALID_REFUND, TransactionUUID=-1)),
+]
+
+
+class Command(BaseCommand):
+    help = "Times the request validation of each endpoint, before and after the schemas in api/schemas.py"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=20000, help="Validations timed for each case")
+
+    def handle(self, *args, **options):
+        number = options['number']
+
+        # The email check makes a DNS lookup by default, which would drown out everything else, so only its syntax
+        # check is timed here
+        syntax_only = override_settings(EMAIL_VALIDATION={'MODE': 'syntax'})
+        check_syntax = partial(validate_email, check_deliverability=False)
+        legacy_syntax_only = mock.patch(__name__ + '.validate_email', check_syntax)
+
+        with syntax_only, legacy_syntax_only:
+            self.stdout.write("%-26s %12s %12s %8s" % ('case', 'before (us)', 'after (us)', 'speedup'))
+
+            for name, legacy, schema, body in CASES:
+                before = min(timeit.repeat(lambda: legacy(body), number=number, repeat=3)) / number * 1e6
+                after = min(timeit.repeat(lambda: schema.validate(body), number=number, repeat=3)) / number * 1e6
+
+                self.stdout.write("%-26s %12.2f %12.2f %7.1fx" % (name, before, after, before / after))
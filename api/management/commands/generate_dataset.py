@@ -0,0 +1,313 @@
+import json
+import random
+from datetime import date, timedelta
+from itertools import islice
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+
+from api import known_accounts
+from api.cards import card_fingerprint
+from api.models import BankDetails, BusinessAccount, PaymentDetails, PersonalAccount, Transaction
+
+# Fills the database with made up accounts and transactions for testing at scale, and can write a matching corpus of
+# payment and refund requests to replay against the API. Everything is worked out from the seed, so the same options
+# always give the same data.
+#
+# Rows are made as they're needed and inserted a batch at a time, so memory use stays the same however many are asked
+# for. The details of each account (its card, security code, names, email and so on) are worked out from its number
+# rather than being kept, so the accounts can be made again when writing the corpus.
+
+FIRST_NAMES = ['Olivia', 'Amelia', 'Isla', 'Ava', 'Mia', 'Ivy', 'Lily', 'Isabella', 'Rosie', 'Sophia', 'Grace',
+               'Freya', 'Noah', 'Oliver', 'George', 'Arthur', 'Muhammad', 'Leo', 'Harry', 'Oscar', 'Archie', 'Henry',
+               'Theodore', 'Jack', 'Charlie', 'Thomas', 'Priya', 'Wei', 'Sofia', 'Mateo', 'Aisha', 'Yusuf']
+LAST_NAMES = ['Smith', 'Jones', 'Taylor', 'Brown', 'Williams', 'Wilson', 'Johnson', 'Davies', 'Patel', 'Robinson',
+              'Wright', 'Thompson', 'Evans', 'Walker', 'White', 'Roberts', 'Green', 'Hall', 'Thomas', 'Clarke',
+              'Jackson', 'Wood', 'Harris', 'Edwards', 'Turner', 'Khan', 'Chen', 'Singh', 'Murphy', 'Kelly']
+EMAIL_DOMAINS = ['gmail.com', 'outlook.com', 'yahoo.co.uk', 'hotmail.co.uk', 'icloud.com', 'btinternet.com']
+BUSINESS_WORDS = ['Northern', 'Royal', 'Green', 'City', 'Harbour', 'Oak', 'Bright', 'Union', 'Crown', 'Valley',
+                  'Trading', 'Supplies', 'Foods', 'Books', 'Garage', 'Bakery', 'Studio', 'Hardware', 'Pharmacy', 'Cafe']
+
+# (value, weight) of the currencies and statuses of the payments made. A refunded payment also has a refund
+# transaction, so Refund Transaction isn't picked itself.
+CURRENCIES = [('826', 70), ('978', 15), ('840', 10), ('392', 2), ('756', 2), ('124', 1)]
+STATUSES = [("Completed", 88), ("Refunded", 6), ("Cancelled", 6)]
+
+# Account numbers have at most eight digits
+MAX_ACCOUNT_NUMBER = 99999999
+
+
+def weighted(choices):
+    values = [value for value, _ in choices]
+    cumulative = []
+    total = 0
+
+    for _, weight in choices:
+        total += weight
+        cumulative.append(total)
+
+    return values, cumulative
+
+
+# Mixes the number with the seed, so each detail of an account looks random but can always be worked out again
+def mix(number, seed, salt):
+    return (number * 2654435761 + seed * 40503 + salt * 97) % 4294967296
+
+
+class Accounts:
+    def __init__(self, seed, first_number, personal_count, business_count, start_date):
+        self.seed = seed
+        self.first_personal = first_number
+        self.first_business = first_number + personal_count
+        self.personal_count = personal_count
+        self.business_count = business_count
+        self.start_date = start_date
+
+    def card_number(self, number):
+        return '4%03d%012d' % (self.seed % 1000, number)
+
+    def security_code(self, number):
+        return '%03d' % (mix(number, self.seed, 1) % 1000)
+
+    # Every card expires between five and nine years after the first transaction, so none have expired when replayed
+    def expiry_date(self, number):
+        return date(self.start_date.year + 5 + mix(number, self.seed, 2) % 5, 1 + mix(number, self.seed, 3) % 12, 1)
+
+    def sort_code(self, number):
+        return '%06d' % (mix(number, self.seed, 4) % 1000000)
+
+    def full_name(self, number):
+        return '%s %s' % (FIRST_NAMES[mix(number, self.seed, 5) % len(FIRST_NAMES)],
+                          LAST_NAMES[mix(number, self.seed, 6) % len(LAST_NAMES)])
+
+    def email(self, number):
+        return '%s.%d@%s' % (self.full_name(number).replace(' ', '.').lower(), number,
+                             EMAIL_DOMAINS[mix(number, self.seed, 7) % len(EMAIL_DOMAINS)])
+
+    def phone_number(self, number):
+        return '07%09d' % (mix(number, self.seed, 8) % 1000000000)
+
+    def business_name(self, number):
+        return '%s %s %d Ltd' % (BUSINESS_WORDS[mix(number, self.seed, 9) % 10],
+                                 BUSINESS_WORDS[10 + mix(number, self.seed, 10) % 10], number)
+
+    def personal_numbers(self):
+        return range(self.first_personal, self.first_personal + self.personal_count)
+
+    def business_numbers(self):
+        return range(self.first_business, self.first_business + self.business_count)
+
+    # The card details of every account, personal then business, with the same number as the account
+    def payment_details(self):
+        for number in range(self.first_personal, self.first_business + self.business_count):
+            card_number = self.card_number(number)
+
+            # bulk_create doesn't call save(), so the fingerprint is set here
+            yield PaymentDetails(paymentId=number, cardNumber=card_number, securityCode=self.security_code(number),
+                                 expiryDate=self.expiry_date(number), cardFingerprint=card_fingerprint(card_number))
+
+    def bank_details(self):
+        for number in self.personal_numbers():
+            yield BankDetails(accountNumber=number, sortCode=self.sort_code(number),
+                              accountName=self.full_name(number))
+
+        # Payments are found by the payee's account name, which is the business name
+        for number in self.business_numbers():
+            yield BankDetails(accountNumber=number, sortCode=self.sort_code(number),
+                              accountName=self.business_name(number))
+
+    def personal_accounts(self):
+        for number in self.personal_numbers():
+            yield PersonalAccount(accountNumber=number, paymentDetails_id=number, bankDetails_id=number,
+                                  email=self.email(number), password='!', phoneNumber=self.phone_number(number),
+                                  fullName=self.full_name(number))
+
+    def business_accounts(self):
+        for number in self.business_numbers():
+            name = self.business_name(number)
+            yield BusinessAccount(accountNumber=number, paymentDetails_id=number, bankDetails_id=number,
+                                  businessNumber=number, businessName=name,
+                                  businessEmail='accounts@%s.example.com' % name.split()[1].lower(),
+                                  businessPhoneNumber=self.phone_number(number))
+
+    # A random payer, and a payee where a few businesses take most of the payments, as they would for real
+    def pick_payer(self, rng):
+        return self.first_personal + rng.randrange(self.personal_count)
+
+    def pick_payee(self, rng):
+        return self.first_business + int(self.business_count * rng.random() ** 3)
+
+
+# Yields count transactions. Refunded payments are followed by their refund transaction, and both count towards the
+# total. Completed payments are passed to on_completed, so some can be picked for the corpus.
+def transactions(accounts, rng, count, days, on_completed=None):
+    currencies, currency_weights = weighted(CURRENCIES)
+    statuses, status_weights = weighted(STATUSES)
+    made = 0
+
+    while made < count:
+        status = rng.choices(statuses, cum_weights=status_weights)[0]
+
+        # There's no room left for the refund transaction
+        if status == "Refunded" and made == count - 1:
+            status = "Completed"
+
+        payment = Transaction(payer_id=accounts.pick_payer(rng), payee_id=accounts.pick_payee(rng),
+                              amount=round(min(rng.lognormvariate(3.5, 1.0), 5000), 2),
+                              currency=rng.choices(currencies, cum_weights=currency_weights)[0],
+                              date=accounts.start_date + timedelta(days=rng.randrange(days)),
+                              transactionStatus=status)
+        yield payment
+        made += 1
+
+        if status == "Completed" and on_completed is not None:
+            on_completed(payment)
+
+        if status == "Refunded":
+            yield Transaction(payer_id=payment.payer_id, payee_id=payment.payee_id,
+                              amount=-round(payment.amount * rng.uniform(0.1, 1.0), 2), currency=payment.currency,
+                              date=payment.date, transactionStatus="Refund Transaction")
+            made += 1
+
+
+# Inserts the rows a batch at a time, committing every few batches. Returns the number inserted.
+def bulk_load(model, rows, batch_size, batches_per_transaction):
+    rows = iter(rows)
+    loaded = 0
+
+    while True:
+        with transaction.atomic():
+            for _ in range(batches_per_transaction):
+                batch = list(islice(rows, batch_size))
+
+                if not batch:
+                    return loaded
+
+                model.objects.bulk_create(batch)
+                loaded += len(batch)
+
+
+# Keeps a fixed size random sample of the completed payments (reservoir sampling), to be refunded in the corpus
+class Reservoir:
+    def __init__(self, size, rng):
+        self.size = size
+        self.rng = rng
+        self.seen = 0
+        self.items = []
+
+    def add(self, payment):
+        self.seen += 1
+
+        if len(self.items) < self.size:
+            self.items.append(payment)
+        else:
+            index = self.rng.randrange(self.seen)
+
+            if index < self.size:
+                self.items[index] = payment
+
+
+class Command(BaseCommand):
+    help = "Fills the database with generated accounts and transactions, and can write a request corpus to replay"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=10000, help="Personal accounts made")
+        parser.add_argument('--businesses', type=int, default=None,
+                            help="Business accounts made, one for every 100 personal accounts if not given")
+        parser.add_argument('--transactions', type=int, default=100000, help="Transactions made")
+        parser.add_argument('--seed', type=int, default=0, help="Seed the data is made from")
+        parser.add_argument('--start-date', type=date.fromisoformat, default=date(2023, 1, 1),
+                            help="Date of the first transactions, as YYYY-MM-DD")
+        parser.add_argument('--days', type=int, default=365, help="Days the transactions are spread over")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows inserted per query")
+        parser.add_argument('--batches-per-transaction', type=int, default=20,
+                            help="Batches inserted before each commit")
+        parser.add_argument('--corpus', default=None, help="File to write a request corpus to, one JSON request a line")
+        parser.add_argument('--corpus-payments', type=int, default=10000, help="Payment requests in the corpus")
+        parser.add_argument('--corpus-refunds', type=int, default=1000, help="Refund requests in the corpus")
+        parser.add_argument('--skip-settlement', action='store_true',
+                            help="Doesn't rebuild the settlement summary afterwards")
+
+    def handle(self, *args, **options):
+        personal_count = options['accounts']
+        business_count = options['businesses'] or max(1, personal_count // 100)
+
+        if personal_count < 1 or options['transactions'] < 0 or options['days'] < 1:
+            raise CommandError("There must be at least one account and one day, and no fewer than 0 transactions")
+
+        # The accounts are numbered after any already in the database
+        first_number = 1 + max(value or 0 for value in (
+            PersonalAccount.objects.aggregate(Max('accountNumber'))['accountNumber__max'],
+            BusinessAccount.objects.aggregate(Max('accountNumber'))['accountNumber__max'],
+            BankDetails.objects.aggregate(Max('accountNumber'))['accountNumber__max'],
+            PaymentDetails.objects.aggregate(Max('paymentId'))['paymentId__max'],
+        ))
+
+        if first_number + personal_count + business_count - 1 > MAX_ACCOUNT_NUMBER:
+            raise CommandError("Account numbers can't be longer than eight digits, so there isn't room for this many "
+                               "accounts")
+
+        accounts = Accounts(options['seed'], first_number, personal_count, business_count, options['start_date'])
+        load = {'batch_size': options['batch_size'], 'batches_per_transaction': options['batches_per_transaction']}
+
+        self.stdout.write("Card details: %d" % bulk_load(PaymentDetails, accounts.payment_details(), **load))
+        self.stdout.write("Bank details: %d" % bulk_load(BankDetails, accounts.bank_details(), **load))
+        self.stdout.write("Personal accounts: %d" % bulk_load(PersonalAccount, accounts.personal_accounts(), **load))
+        self.stdout.write("Business accounts: %d" % bulk_load(BusinessAccount, accounts.business_accounts(), **load))
+
+        # bulk_create doesn't send post_save, so the workers are told about the new accounts here
+        known_accounts.accounts_changed()
+
+        # The corpus has its own random numbers, so asking for it doesn't change the data
+        corpus_rng = random.Random(options['seed'] + 1)
+        reservoir = Reservoir(options['corpus_refunds'], corpus_rng) if options['corpus'] else None
+
+        rows = transactions(accounts, random.Random(options['seed']), options['transactions'], options['days'],
+                            reservoir.add if reservoir is not None else None)
+        self.stdout.write("Transactions: %d" % bulk_load(Transaction, rows, **load))
+
+        if not options['skip_settlement']:
+            call_command('rebuild_settlement_summary', batch_size=options['batch_size'], stdout=self.stdout)
+
+        if options['corpus']:
+            self.write_corpus(options['corpus'], accounts, corpus_rng, options['corpus_payments'], reservoir)
+
+    def write_corpus(self, path, accounts, rng, payment_count, reservoir):
+        currencies, currency_weights = weighted(CURRENCIES)
+        refunds = 0
+
+        with open(path, 'w') as corpus:
+            for _ in range(payment_count):
+                payer, payee = accounts.pick_payer(rng), accounts.pick_payee(rng)
+
+                corpus.write(json.dumps({'path': '/initiatePayment', 'body': {
+                    'CardNumber': accounts.card_number(payer),
+                    'CVV': accounts.security_code(payer),
+                    'Expiry': accounts.expiry_date(payer).isoformat(),
+                    'PayerCurrencyCode': rng.choices(currencies, cum_weights=currency_weights)[0],
+                    'PayeeCurrencyCode': '826',
+                    'Amount': round(min(rng.lognormvariate(3.5, 1.0), 5000), 2),
+                    'PayeeBankAccNum': str(payee),
+                    'PayeeBankSortCode': accounts.sort_code(payee),
+                    'RecipientName': accounts.business_name(payee),
+                    'CardHolderName': accounts.full_name(payer),
+                    'CardHolderAddress': '%d High Street' % (1 + payer % 200),
+                    'Email': accounts.email(payer)
+                }}) + "\n")
+
+            # The IDs of inserted rows are only known on databases which can return them from a bulk insert
+            if reservoir.items and reservoir.items[0].id is None:
+                self.stderr.write("The IDs of the transactions weren't returned by the database, so the corpus has "
+                                  "no refunds")
+            else:
+                for payment in reservoir.items:
+                    corpus.write(json.dumps({'path': '/initiateRefund', 'body': {
+                        'TransactionUUID': payment.id,
+                        'Amount': round(payment.amount * rng.uniform(0.1, 1.0), 2),
+                        'CurrencyCode': payment.currency
+                    }}) + "\n")
+                    refunds += 1
+
+        self.stdout.write("Corpus: %d payments and %d refunds written to %s" % (payment_count, refunds, path))
@@ -0,0 +1,64 @@
+import csv
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from api.models import ExchangeRate
+from api.services import rates
+
+
+# Reads the rates from a CSV file with a header row, or a JSON list of objects, each with base, quote, date and rate
+def read_rates(path, file_format):
+    try:
+        with open(path, newline='') as rates_file:
+            if file_format == 'json':
+                records = json.load(rates_file)
+            else:
+                records = list(csv.DictReader(rates_file))
+
+    except (OSError, ValueError, csv.Error) as error:
+        raise CommandError("Couldn't read %s: %s" % (path, error))
+
+    for line, record in enumerate(records, start=1):
+        try:
+            day = parse_date(str(record['date']))
+            rate = float(record['rate'])
+
+            if day is None or rate <= 0:
+                raise ValueError
+
+            yield ExchangeRate(base=str(record['base']), quote=str(record['quote']), date=day, rate=rate)
+
+        except (KeyError, TypeError, ValueError):
+            raise CommandError("Invalid rate in record %d: %r" % (line, record))
+
+
+class Command(BaseCommand):
+    help = "Loads exchange rates from a CSV or JSON file, replacing any already stored for the same pair and day"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File of rates, with base, quote, date and rate for each")
+        parser.add_argument('--format', choices=('csv', 'json'), default=None,
+                            help="Format of the file, taken from its extension if not given")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rates inserted per query")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+
+        if file_format not in ('csv', 'json'):
+            raise CommandError("Can't tell the format of %s, give it with --format" % path)
+
+        exchange_rates = list(read_rates(path, file_format))
+        days = {exchange_rate.date for exchange_rate in exchange_rates}
+
+        # Loaded in one transaction, so a day is never converted with only some of its rates
+        with transaction.atomic():
+            ExchangeRate.objects.bulk_create(exchange_rates, batch_size=options['batch_size'], update_conflicts=True,
+                                             unique_fields=['date', 'base', 'quote'], update_fields=['rate'])
+            rates.new_versions(days)
+
+        self.stdout.write("Imported %d exchange rates for %d days" % (len(exchange_rates), len(days)))
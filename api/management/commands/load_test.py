@@ -0,0 +1,272 @@
+import json
+import logging
+import math
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+
+from api.cards import card_fingerprint
+from api.models import BankDetails, BusinessAccount, PaymentDetails, PersonalAccount, Transaction
+from api.stubs import StubServer, pns_response, currency_response, STUB_RATES
+
+# Drives the payment, refund, cancellation and currency conversion endpoints at a set concurrency, against a throwaway
+# copy of the database and local stubs of the PNS and currency converter, and reports the throughput, latency and
+# database queries of each endpoint as JSON. The requests are made in-process through the Django test client, so what's
+# measured is the API itself, not a web server in front of it.
+
+PAYEE_ACCOUNT_NUMBER = 10000000
+PAYEE_SORT_CODE = '112233'
+PAYEE_NAME = 'Load Test Ltd'
+
+
+# Creates a business to pay and a number of personal accounts to pay it with, each with its own card
+def seed_accounts(accounts):
+    expiry = date.today() + timedelta(days=365 * 3)
+
+    # bulk_create doesn't call save(), so the fingerprints are set here
+    payment_details = [PaymentDetails(paymentId=number, cardNumber='4%015d' % number,
+                                      securityCode='%03d' % (number % 1000), expiryDate=expiry,
+                                      cardFingerprint=card_fingerprint('4%015d' % number))
+                       for number in range(1, accounts + 2)]
+    PaymentDetails.objects.bulk_create(payment_details)
+
+    bank_details = [BankDetails(accountNumber=PAYEE_ACCOUNT_NUMBER, sortCode=PAYEE_SORT_CODE, accountName=PAYEE_NAME)]
+    bank_details += [BankDetails(accountNumber=number, sortCode='000000', accountName='Payer %d' % number)
+                     for number in range(1, accounts + 1)]
+    BankDetails.objects.bulk_create(bank_details)
+
+    BusinessAccount.objects.create(accountNumber=PAYEE_ACCOUNT_NUMBER, paymentDetails=payment_details[-1],
+                                   bankDetails=bank_details[0], businessNumber=1, businessName=PAYEE_NAME,
+                                   businessEmail='payee@example.com', businessPhoneNumber='0')
+
+    PersonalAccount.objects.bulk_create([
+        PersonalAccount(accountNumber=number, paymentDetails=payment_details[number - 1],
+                        bankDetails=bank_details[number], email='payer%d@example.com' % number, password='x',
+                        phoneNumber='0', fullName='Payer %d' % number)
+        for number in range(1, accounts + 1)])
+
+    return expiry
+
+
+def payment_body(number, expiry):
+    return {
+        'CardNumber': '4%015d' % number,
+        'CVV': '%03d' % (number % 1000),
+        'Expiry': expiry.isoformat(),
+        'PayerCurrencyCode': '826',
+        'PayeeCurrencyCode': '826',
+        'Amount': round(random.uniform(5, 500), 2),
+        'PayeeBankAccNum': str(PAYEE_ACCOUNT_NUMBER),
+        'PayeeBankSortCode': PAYEE_SORT_CODE,
+        'RecipientName': PAYEE_NAME,
+        'CardHolderName': 'Payer %d' % number,
+        'CardHolderAddress': '1 High Street',
+        'Email': 'payer%d@example.com' % number
+    }
+
+
+# The latency at the given percentile, using the nearest rank
+def percentile(ordered, percent):
+    if not ordered:
+        return None
+
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+# Sends every body to the endpoint from a number of threads at once, returning the measurements
+def run_phase(path, bodies, concurrency):
+    pending = queue.SimpleQueue()
+
+    for body in bodies:
+        pending.put(body)
+
+    results = []
+    results_lock = threading.Lock()
+
+    def worker():
+        # Errors are measured as 500 responses rather than stopping the test
+        client = Client(raise_request_exception=False)
+
+        try:
+            while True:
+                try:
+                    body = pending.get_nowait()
+                except queue.Empty:
+                    break
+
+                # Each thread has its own connection, so only this request's queries are captured
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = client.post(path, data=json.dumps(body), content_type='application/json')
+                    elapsed = time.perf_counter() - started
+
+                try:
+                    error_code = json.loads(response.content).get('ErrorCode')
+                except ValueError:
+                    error_code = None
+
+                with results_lock:
+                    results.append((elapsed, response.status_code, error_code, len(queries)))
+
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    duration = time.perf_counter() - started
+    latencies = sorted(result[0] * 1000 for result in results)
+    error_codes = {}
+
+    for _, status, error_code, _ in results:
+        if status != 200:
+            error_codes[str(error_code)] = error_codes.get(str(error_code), 0) + 1
+
+    return {
+        'requests': len(results),
+        'errors': sum(error_codes.values()),
+        'error_codes': error_codes,
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(len(results) / duration, 1) if duration else None,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3) if latencies else None,
+            'p50': round(percentile(latencies, 50), 3) if latencies else None,
+            'p95': round(percentile(latencies, 95), 3) if latencies else None,
+            'p99': round(percentile(latencies, 99), 3) if latencies else None,
+            'max': round(latencies[-1], 3) if latencies else None
+        },
+        'queries_per_request': round(sum(result[3] for result in results) / len(results), 2) if results else None
+    }
+
+
+class Command(BaseCommand):
+    help = "Load tests the payment, refund, cancellation and currency endpoints against local upstream stubs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help="Requests sent to each endpoint")
+        parser.add_argument('--concurrency', type=int, default=8, help="Requests in flight at once")
+        parser.add_argument('--accounts', type=int, default=100, help="Personal accounts the payments are made from")
+        parser.add_argument('--pns-latency', type=float, default=0.05, help="Seconds the PNS stub takes to answer")
+        parser.add_argument('--currency-latency', type=float, default=0.05,
+                            help="Seconds the currency converter stub takes to answer")
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help="Fraction of upstream calls the stubs fail with a 500")
+        parser.add_argument('--seed', type=int, default=None, help="Seed for the random amounts, accounts and dates")
+        parser.add_argument('--output', default=None, help="File to write the JSON results to, instead of stdout")
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+
+        pns = StubServer(pns_response, options['pns_latency'], options['error_rate'])
+        currency = StubServer(currency_response, options['currency_latency'], options['error_rate'])
+
+        # Points the API at the stubs instead of the live services
+        services = {name: dict(service) for name, service in settings.OUTBOUND_SERVICES.items()}
+        services['pns']['URL'] = pns.start()
+        services['currency']['URL'] = currency.start()
+
+        # The email check can make DNS lookups, which would be measured instead of the API, so only its syntax is
+        # checked
+        syntax_only = override_settings(EMAIL_VALIDATION={'MODE': 'syntax'})
+
+        # Every request comes from the same address, and many of the payments from the same cards, so the rate limits
+        # would turn most of them away
+        no_rate_limit = override_settings(RATE_LIMIT=dict(settings.RATE_LIMIT, ENABLED=False))
+
+        # The errors the stubs cause are counted in the results, rather than each one being logged
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+
+        # SQLite test databases are kept in memory unless given a file, which the threads couldn't share
+        database_directory = tempfile.mkdtemp()
+
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(database_directory, 'load_test.sqlite3')
+
+        setup_test_environment()
+        old_database_name = connection.creation.create_test_db(verbosity=0, serialize=False)
+
+        try:
+            with override_settings(OUTBOUND_SERVICES=services), syntax_only, no_rate_limit:
+                report = self.run_load_test(options)
+
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+            os.rmdir(database_directory)
+            teardown_test_environment()
+            pns.stop()
+            currency.stop()
+
+        report['upstream'] = {
+            'pns': {'requests': pns.requests, 'errors': pns.errors},
+            'currency': {'requests': currency.requests, 'errors': currency.errors}
+        }
+
+        output = json.dumps(report, indent=2)
+
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+    def run_load_test(self, options):
+        requests = options['requests']
+        concurrency = options['concurrency']
+        expiry = seed_accounts(options['accounts'])
+        endpoints = {}
+
+        payments = [payment_body(random.randint(1, options['accounts']), expiry) for _ in range(requests)]
+        endpoints['initiatePayment'] = run_phase('/initiatePayment', payments, concurrency)
+
+        # Half of the completed payments are partly refunded, and the other half cancelled
+        completed = list(Transaction.objects.filter(transactionStatus="Completed").values_list('id', 'amount'))
+        random.shuffle(completed)
+        half = len(completed) // 2
+
+        refunds = [{'TransactionUUID': transaction_id, 'Amount': round(amount / 2, 2), 'CurrencyCode': '826'}
+                   for transaction_id, amount in completed[:half]]
+        endpoints['initiateRefund'] = run_phase('/initiateRefund', refunds, concurrency)
+
+        cancellations = [{'TransactionUUID': transaction_id} for transaction_id, _ in completed[half:]]
+        endpoints['initiateCancellation'] = run_phase('/initiateCancellation', cancellations, concurrency)
+
+        # Spread over a month of dates and a few currencies, so both cached and uncached rates are measured
+        pairs = list(STUB_RATES)
+        conversions = []
+
+        for _ in range(requests):
+            currency_from, currency_to = random.choice(pairs)
+            conversions.append({'CurrencyFrom': currency_from, 'CurrencyTo': currency_to,
+                                'Date': (date.today() - timedelta(days=random.randint(0, 29))).isoformat(),
+                                'Amount': round(random.uniform(5, 500), 2)})
+
+        endpoints['convertCurrency'] = run_phase('/convertCurrency', conversions, concurrency)
+
+        return {
+            'config': {
+                'requests': requests,
+                'concurrency': concurrency,
+                'accounts': options['accounts'],
+                'pns_latency': options['pns_latency'],
+                'currency_latency': options['currency_latency'],
+                'error_rate': options['error_rate'],
+                'database': connection.vendor
+            },
+            'endpoints': endpoints
+        }
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Deletes the stored responses of Idempotency-Keys which have expired"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Keys deleted per query")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        deleted = 0
+
+        # Deletes in batches, so the table isn't locked for long whilst payments are still being made
+        while True:
+            batch = list(IdempotencyKey.objects.filter(expiresAt__lte=now)
+                         .values_list('pk', flat=True)[:options['batch_size']])
+
+            if not batch:
+                break
+
+            deleted += IdempotencyKey.objects.filter(pk__in=batch).delete()[0]
+
+        self.stdout.write("Deleted %d expired idempotency keys" % deleted)
@@ -0,0 +1,63 @@
+from heapq import merge
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from api.ledger import PAID_STATUSES, TRANSACTION_TABLES
+from api.models import SettlementSummary
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the settlement summary from every transaction, e.g. after a backfill"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Summary rows inserted per query")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        paid = Q(transactionStatus__in=PAID_STATUSES)
+        refund = Q(transactionStatus="Refund Transaction")
+
+        # The totals of every business, currency and day in each table, worked out by the database in one pass. Both are
+        # in the same order, so the totals of a day in the hot table and the archive can be added together as they're
+        # read, without holding them all.
+        tables = [model.objects.filter(paid | refund).values_list('payee_id', 'currency', 'date').annotate(
+            payment_count=Count('id', filter=paid),
+            payment_total=Coalesce(Sum('amount', filter=paid), Value(0.0)),
+            refund_count=Count('id', filter=refund),
+            refund_total=Coalesce(Sum('amount', filter=refund), Value(0.0))
+        ).order_by('payee_id', 'currency', 'date').iterator(chunk_size=batch_size) for model in TRANSACTION_TABLES]
+
+        rows = 0
+        batch = []
+
+        # Replaced in one transaction, so reports never see the table half built
+        with transaction.atomic():
+            SettlementSummary.objects.all().delete()
+
+            for (payee_id, currency, day), totals in groupby(merge(*tables), key=lambda total: total[:3]):
+                payment_count = payment_total = refund_count = refund_total = 0
+
+                for total in totals:
+                    payment_count += total[3]
+                    payment_total += total[4]
+                    refund_count += total[5]
+                    refund_total += total[6]
+
+                # Refund transactions are stored as negative amounts
+                batch.append(SettlementSummary(payee_id=payee_id, currency=currency, date=day,
+                                               paymentCount=payment_count, paymentTotal=payment_total,
+                                               refundCount=refund_count, refundTotal=-refund_total))
+
+                if len(batch) == batch_size:
+                    SettlementSummary.objects.bulk_create(batch)
+                    rows += len(batch)
+                    batch = []
+
+            SettlementSummary.objects.bulk_create(batch)
+            rows += len(batch)
+
+        self.stdout.write("Rebuilt %d settlement summary rows" % rows)
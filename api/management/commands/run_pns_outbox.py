@@ -0,0 +1,39 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.outbox import process_batch
+
+
+class Command(BaseCommand):
+    help = "Sends the payments waiting in the outbox to the PNS"
+
+    def add_arguments(self, parser):
+        config = settings.PNS_OUTBOX
+
+        parser.add_argument('--batch-size', type=int, default=config['BATCH_SIZE'], help="Payments claimed at a time")
+        parser.add_argument('--concurrency', type=int, default=config['CONCURRENCY'],
+                            help="Payments sent to the PNS at once")
+        parser.add_argument('--once', action='store_true',
+                            help="Stop once there's nothing left that's due, rather than waiting for more")
+
+    def handle(self, *args, **options):
+        totals = [0, 0, 0]
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            while True:
+                counts = process_batch(executor, options['batch_size'])
+                totals = [total + count for total, count in zip(totals, counts)]
+
+                if any(counts):
+                    self.stdout.write("Sent %d, retrying %d, failed %d" % counts)
+                    continue
+
+                if options['once']:
+                    break
+
+                time.sleep(settings.PNS_OUTBOX['POLL_INTERVAL'])
+
+        self.stdout.write("Finished: sent %d, retrying %d, failed %d" % tuple(totals))
@@ -0,0 +1,303 @@
+import asyncio
+import contextvars
+import itertools
+import threading
+import time
+import weakref
+
+from django.utils.deprecation import MiddlewareMixin
+
+# Request, database and upstream instrumentation, served at /metrics in the Prometheus text format.
+#
+# Every thread records into its own set of counters, so recording never waits on a lock. The only lock is taken when a
+# thread records for the first time. The counters of every thread are added together when /metrics is read. When a
+# thread ends, its counters are added to the retired totals, so threads which come and go don't leave a set behind.
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# The metrics recorded, as name: (type, help)
+METRICS = {
+    'api_requests_total': ('counter', "Requests handled, by route, method and status"),
+    'api_request_duration_seconds': ('histogram', "Time taken to handle a request, by route"),
+    'api_error_codes_total': ('counter', "Error responses, by route and ErrorCode"),
+    'api_db_queries_total': ('counter', "Database queries made, by route"),
+    'api_db_query_duration_seconds_total': ('counter', "Time spent on database queries, by route"),
+    'api_upstream_requests_total': ('counter', "Calls to the PNS and currency converter, by service and status"),
+    'api_upstream_request_duration_seconds': ('histogram', "Time taken by calls to an upstream service, by service"),
+    'api_email_domain_checks_total': ('counter', "Email domain checks, by whether DNS or the cache answered"),
+    'api_known_accounts_rejected_total': ('counter', "Payments turned away without a database lookup, by reason"),
+}
+
+_local = threading.local()
+_shards = {}
+_shards_lock = threading.Lock()
+_shard_ids = itertools.count()
+
+# The counters of threads which have ended, and the IDs of the sets of counters to add to them
+_retired = {}
+_ended = []
+
+# The database stats of the request being handled. It's a context variable, so it follows the request into the
+# threads sync_to_async runs lookups in.
+_request_stats = contextvars.ContextVar('api_request_stats', default=None)
+
+
+# Returns the counters of the current thread, as {(name, labels): value}, where the value of a histogram is a list of
+# its bucket counts followed by its sum and count
+def _shard():
+    shard = getattr(_local, 'shard', None)
+
+    if shard is None:
+        shard = {}
+        owner = ShardOwner()
+
+        with _shards_lock:
+            _retire_ended()
+            shard_id = next(_shard_ids)
+            _shards[shard_id] = shard
+
+        # The owner is only kept in the thread's locals, which are dropped when the thread ends
+        weakref.finalize(owner, _ended.append, shard_id)
+        _local.shard = shard
+        _local.owner = owner
+
+    return shard
+
+
+class ShardOwner:
+    pass
+
+
+# Adds the counters of threads which have ended to the retired totals. The finalizers only queue their IDs, as they can
+# run whilst this thread holds the lock. Must be called with _shards_lock held.
+def _retire_ended():
+    while _ended:
+        _add(_retired, _shards.pop(_ended.pop()))
+
+
+# Adds a set of counters to the totals given
+def _add(totals, shard):
+    # Copied first, as the thread it belongs to may be adding to it
+    for key, value in list(shard.items()):
+        if isinstance(value, list):
+            total = totals.setdefault(key, [0] * len(value))
+
+            for index, part in enumerate(value):
+                total[index] += part
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+
+def increment(name, labels, amount=1):
+    shard = _shard()
+    key = (name, labels)
+    shard[key] = shard.get(key, 0) + amount
+
+
+def observe(name, labels, value):
+    shard = _shard()
+    key = (name, labels)
+    histogram = shard.get(key)
+
+    if histogram is None:
+        histogram = shard[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+
+    for index, bound in enumerate(LATENCY_BUCKETS):
+        if value <= bound:
+            histogram[index] += 1
+            break
+
+    histogram[-2] += value
+    histogram[-1] += 1
+
+
+# Records an outbound call. status is the HTTP status, or the reason there wasn't one. Calls refused by the circuit
+# breaker have no duration.
+def record_upstream(service, status, seconds=None):
+    increment('api_upstream_requests_total', (('service', service), ('status', str(status))))
+
+    if seconds is not None:
+        observe('api_upstream_request_duration_seconds', (('service', service),), seconds)
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+
+
+# Added to every database connection as it's opened (see api.apps), so the queries of each request are counted
+def install_query_wrapper(sender, connection, **kwargs):
+    connection.execute_wrappers.append(time_query)
+
+
+def time_query(execute, sql, params, many, context):
+    stats = _request_stats.get()
+
+    # Queries made outside a request, e.g. by management commands
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_time += time.perf_counter() - started
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+
+        finish(request, response, stats, started)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+
+        finish(request, response, stats, started)
+        return response
+
+
+# Records the request, or for a streaming response, records it once its content has been sent, as the work of
+# generating the content (and its queries) is done whilst it's sent
+def finish(request, response, stats, started):
+    if not response.streaming:
+        record_request(request, response, stats, time.perf_counter() - started)
+        return
+
+    content_class = AsyncStreamedContent if getattr(response, 'is_async', False) else StreamedContent
+    response.streaming_content = content_class(response.streaming_content, request, response, stats, started)
+
+
+# Wraps the content of a streaming response, counting the queries made whilst each part is generated, and recording the
+# request when the response is closed. Django closes a response once it has been sent, or when the client goes away.
+class RecordedContent:
+    def __init__(self, content, request, response, stats, started):
+        self.content = content
+        self.request = request
+        self.response = response
+        self.stats = stats
+        self.started = started
+
+    def close(self):
+        # Only recorded once, as the response can be closed more than once
+        if self.request is not None:
+            record_request(self.request, self.response, self.stats, time.perf_counter() - self.started)
+            self.request = self.response = None
+
+
+class StreamedContent(RecordedContent):
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        token = _request_stats.set(self.stats)
+
+        try:
+            return next(self.content)
+        finally:
+            _request_stats.reset(token)
+
+
+class AsyncStreamedContent(RecordedContent):
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        token = _request_stats.set(self.stats)
+
+        try:
+            return await self.content.__anext__()
+        finally:
+            _request_stats.reset(token)
+
+
+def record_request(request, response, stats, seconds):
+    # Labelled by the route in urls.py rather than the path, so the number of labels can't grow without limit
+    match = request.resolver_match
+    route = match.route if match is not None else 'unmatched'
+
+    increment('api_requests_total', (('route', route), ('method', request.method),
+                                     ('status', str(response.status_code))))
+    observe('api_request_duration_seconds', (('route', route),), seconds)
+    increment('api_db_queries_total', (('route', route),), stats.queries)
+    increment('api_db_query_duration_seconds_total', (('route', route),), stats.query_time)
+
+    # Set by error_response in api.functions
+    error_code = getattr(response, 'error_code', None)
+
+    if error_code is not None:
+        increment('api_error_codes_total', (('route', route), ('code', str(error_code))))
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+
+    return '{' + ','.join('%s="%s"' % (name, escape(value)) for name, value in labels) + '}'
+
+
+# Adds up the counters of every thread, along with those of threads which have ended, and returns them in the
+# Prometheus text format
+def render():
+    totals = {}
+
+    with _shards_lock:
+        _retire_ended()
+        _add(totals, _retired)
+        shards = list(_shards.values())
+
+    for shard in shards:
+        _add(totals, shard)
+
+    lines = []
+
+    for name, (metric_type, help_text) in METRICS.items():
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s %s' % (name, metric_type))
+
+        for (metric_name, labels), value in sorted(totals.items()):
+            if metric_name != name:
+                continue
+
+            if metric_type != 'histogram':
+                lines.append('%s%s %s' % (name, format_labels(labels), value))
+                continue
+
+            # Prometheus buckets are cumulative
+            cumulative = 0
+
+            for bound, count in zip(LATENCY_BUCKETS, value):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (name, format_labels(labels + (('le', repr(bound)),)), cumulative))
+
+            lines.append('%s_bucket%s %d' % (name, format_labels(labels + (('le', '+Inf'),)), value[-1]))
+            lines.append('%s_sum%s %s' % (name, format_labels(labels), value[-2]))
+            lines.append('%s_count%s %d' % (name, format_labels(labels), value[-1]))
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankDetails',
+            fields=[
+                ('accountNumber', models.IntegerField(primary_key=True, serialize=False)),
+                ('sortCode', models.TextField()),
+                ('accountName', models.TextField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PaymentDetails',
+            fields=[
+                ('paymentId', models.IntegerField(primary_key=True, serialize=False)),
+                ('cardNumber', models.TextField()),
+                ('securityCode', models.TextField()),
+                ('expiryDate', models.DateField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BusinessAccount',
+            fields=[
+                ('accountNumber', models.IntegerField(primary_key=True, serialize=False)),
+                ('businessNumber', models.IntegerField()),
+                ('businessName', models.TextField(max_length=40)),
+                ('businessEmail', models.TextField(max_length=50)),
+                ('businessPhoneNumber', models.TextField(max_length=13)),
+                ('bankDetails', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='api.bankdetails')),
+                ('paymentDetails', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.paymentdetails')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PersonalAccount',
+            fields=[
+                ('accountNumber', models.IntegerField(primary_key=True, serialize=False)),
+                ('email', models.TextField(max_length=60)),
+                ('password', models.TextField(max_length=256)),
+                ('phoneNumber', models.TextField(max_length=13)),
+                ('fullName', models.TextField(max_length=80)),
+                ('bankDetails', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='api.bankdetails')),
+                ('paymentDetails', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.paymentdetails')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Transaction',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('amount', models.FloatField()),
+                ('currency', models.TextField()),
+                ('date', models.DateField()),
+                ('transactionStatus', models.TextField()),
+                ('payee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.businessaccount')),
+                ('payer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.personalaccount')),
+            ],
+        ),
+    ]
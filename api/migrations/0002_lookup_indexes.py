@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bankdetails',
+            index=models.Index(fields=['sortCode', 'accountName'], name='bank_sort_code_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentdetails',
+            index=models.Index(fields=['cardNumber', 'securityCode', 'expiryDate'], name='card_details_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='personalaccount',
+            index=models.Index(fields=['email', 'fullName'], name='personal_email_name_idx'),
+        ),
+    ]
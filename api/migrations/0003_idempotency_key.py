@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255)),
+                ('route', models.CharField(max_length=100)),
+                ('requestHash', models.CharField(max_length=64)),
+                ('status', models.TextField()),
+                ('responseStatus', models.IntegerField(null=True)),
+                ('responseBody', models.TextField(null=True)),
+                ('createdAt', models.DateTimeField()),
+                ('expiresAt', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('key', 'route'), name='idempotency_key_route_unique')],
+            },
+        ),
+    ]
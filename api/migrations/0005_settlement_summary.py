@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SettlementSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.TextField()),
+                ('date', models.DateField()),
+                ('paymentCount', models.IntegerField(default=0)),
+                ('paymentTotal', models.FloatField(default=0)),
+                ('refundCount', models.IntegerField(default=0)),
+                ('refundTotal', models.FloatField(default=0)),
+                ('payee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.businessaccount')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('payee', 'date', 'currency'), name='settlement_payee_date_currency_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_settlement_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PNSOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.TextField()),
+                ('status', models.TextField()),
+                ('attempts', models.IntegerField(default=0)),
+                ('nextAttemptAt', models.DateTimeField()),
+                ('claimToken', models.CharField(max_length=32, null=True)),
+                ('lockedUntil', models.DateTimeField(null=True)),
+                ('lastError', models.TextField(null=True)),
+                ('createdAt', models.DateTimeField()),
+                ('transaction', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='api.transaction')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'nextAttemptAt'], name='outbox_status_next_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_pns_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base', models.TextField()),
+                ('quote', models.TextField()),
+                ('date', models.DateField()),
+                ('rate', models.FloatField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'base', 'quote'), name='exchange_rate_date_pair_unique')],
+            },
+        ),
+    ]
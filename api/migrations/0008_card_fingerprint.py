@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_exchange_rate'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='paymentdetails',
+            name='card_details_idx',
+        ),
+        migrations.AddField(
+            model_name='paymentdetails',
+            name='cardFingerprint',
+            field=models.CharField(max_length=64, null=True, unique=True),
+        ),
+    ]
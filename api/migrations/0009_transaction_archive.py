@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_card_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('amount', models.FloatField()),
+                ('currency', models.TextField()),
+                ('date', models.DateField()),
+                ('transactionStatus', models.TextField()),
+                ('archivedAt', models.DateTimeField()),
+                ('payee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.businessaccount')),
+                ('payer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.personalaccount')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['payee', 'date', 'id'], name='archived_payee_date_id_idx'), models.Index(fields=['payer', 'date', 'id'], name='archived_payer_date_id_idx')],
+            },
+        ),
+    ]
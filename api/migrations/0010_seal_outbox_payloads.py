@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from api.cards import seal
+
+
+# The card details of payments already waiting in the outbox are encrypted, and those of failed payments removed
+def seal_payloads(apps, schema_editor):
+    PNSOutbox = apps.get_model('api', 'PNSOutbox')
+    PNSOutbox.objects.filter(status="Failed").update(payload="")
+
+    for outbox in PNSOutbox.objects.exclude(status="Failed").only('id', 'payload'):
+        PNSOutbox.objects.filter(id=outbox.id).update(payload=seal(outbox.payload))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_transaction_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(seal_payloads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_seal_outbox_payloads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRateDay',
+            fields=[
+                ('date', models.DateField(primary_key=True, serialize=False)),
+                ('version', models.CharField(max_length=32)),
+            ],
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 
+from api.cards import card_fingerprint
+
 
 # PAYMENT PROVIDERS
 
@@ -12,6 +14,12 @@ class PersonalAccount(models.Model):
     phoneNumber = models.TextField(max_length=13)
     fullName = models.TextField(max_length=80)
 
+    class Meta:
+        indexes = [
+            # Used when finding the payer of a payment
+            models.Index(fields=['email', 'fullName'], name='personal_email_name_idx'),
+        ]
+
 
 class BusinessAccount(models.Model):
     accountNumber = models.IntegerField(primary_key=True)
@@ -24,6 +32,26 @@ class BusinessAccount(models.Model):
 
 
 class Transaction(models.Model):
+    id = models.AutoField(primary_key=True)
+    payer = models.ForeignKey('PersonalAccount', on_delete=models.CASCADE)
+    payee = models.ForeignKey('BusinessAccount', on_delete=models.CASCADE)
+    amount = models.FloatField()
+    currency = models.TextField()
+    date = models.DateField()
+    transactionStatus = models.TextField()
+
+    class Meta:
+        indexes = [
+            # Used when paging through the history of an account, in date order
+            models.Index(fields=['payee', 'date', 'id'], name='payee_date_id_idx'),
+            models.Index(fields=['payer', 'date', 'id'], name='payer_date_id_idx'),
+        ]
+
+
+# Old transactions which can no longer change much, moved out of Transaction by archive_transactions so its table and
+# indexes stay small. Rows keep the ID they had, and refunds, cancellations and lookups by ID fall back to this table
+# when a transaction isn't in Transaction (see api/ledger.py).
+class ArchivedTransaction(models.Model):
     id = models.IntegerField(primary_key=True)
     payer = models.ForeignKey('PersonalAccount', on_delete=models.CASCADE)
     payee = models.ForeignKey('BusinessAccount', on_delete=models.CASCADE)
@@ -31,6 +59,14 @@ class Transaction(models.Model):
     currency = models.TextField()
     date = models.DateField()
     transactionStatus = models.TextField()
+    archivedAt = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Used when paging through the history of an account, along with the same indexes of Transaction
+            models.Index(fields=['payee', 'date', 'id'], name='archived_payee_date_id_idx'),
+            models.Index(fields=['payer', 'date', 'id'], name='archived_payer_date_id_idx'),
+        ]
 
 
 class PaymentDetails(models.Model):
@@ -38,9 +74,120 @@ class PaymentDetails(models.Model):
     cardNumber = models.TextField()
     securityCode = models.TextField()
     expiryDate = models.DateField()
+    # A keyed hash of the card number, which cards are found by (see api/cards.py). Set whenever the card is saved, and
+    # by backfill_card_fingerprints for cards saved before it existed or written with bulk_create.
+    cardFingerprint = models.CharField(max_length=64, unique=True, null=True)
+
+    def save(self, *args, **kwargs):
+        self.cardFingerprint = card_fingerprint(self.cardNumber)
+
+        # Saves which only update some fields also need to update the fingerprint if the card number changed
+        update_fields = kwargs.get('update_fields')
+
+        if update_fields is not None and 'cardNumber' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'cardFingerprint'}
+
+        super().save(*args, **kwargs)
 
 
 class BankDetails(models.Model):
     accountNumber = models.IntegerField(primary_key=True)
     sortCode = models.TextField()
     accountName = models.TextField()
+
+    class Meta:
+        indexes = [
+            # Used when finding the bank details of the payee of a payment
+            models.Index(fields=['sortCode', 'accountName'], name='bank_sort_code_name_idx'),
+        ]
+
+
+# The version of the cards and bank details, changed whenever one is saved, so every worker knows to rebuild its
+# filters of them (see api/known_accounts.py). There's only ever the one row.
+class KnownAccountsVersion(models.Model):
+    version = models.CharField(max_length=32)
+
+
+# SETTLEMENT
+
+# The totals of the payments each business received, and the refunds it gave, in each currency on each day. Kept up
+# to date as transactions are written (see api/ledger.py), and can be rebuilt with rebuild_settlement_summary.
+class SettlementSummary(models.Model):
+    payee = models.ForeignKey('BusinessAccount', on_delete=models.CASCADE)
+    currency = models.TextField()
+    date = models.DateField()
+    paymentCount = models.IntegerField(default=0)
+    paymentTotal = models.FloatField(default=0)
+    refundCount = models.IntegerField(default=0)
+    refundTotal = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also used when reading a business's totals over a range of days
+            models.UniqueConstraint(fields=['payee', 'date', 'currency'], name='settlement_payee_date_currency_unique'),
+        ]
+
+
+# EXCHANGE RATES
+
+# The rate to convert from the base currency to the quote currency on each day, loaded with import_exchange_rates.
+# Conversions are worked out from these where possible (see api/services/rates.py), and only sent to the currency
+# converter when no rate for the day can be found.
+class ExchangeRate(models.Model):
+    base = models.TextField()
+    quote = models.TextField()
+    date = models.DateField()
+    rate = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # Date first, as the rates are read a whole day at a time
+            models.UniqueConstraint(fields=['date', 'base', 'quote'], name='exchange_rate_date_pair_unique'),
+        ]
+
+
+# The version of each day's rates, changed by import_exchange_rates every time it loads rates for the day. Workers
+# keep the rates of a day in their own cache, and rebuild them when its version changes.
+class ExchangeRateDay(models.Model):
+    date = models.DateField(primary_key=True)
+    version = models.CharField(max_length=32)
+
+
+# PNS OUTBOX
+
+# Payments waiting to be sent to the PNS by the run_pns_outbox worker (see api/outbox.py), each for a Pending
+# transaction. Rows are deleted once the payment has been sent, so only queued, in flight and failed payments are kept.
+class PNSOutbox(models.Model):
+    transaction = models.OneToOneField('Transaction', on_delete=models.CASCADE, related_name='outbox')
+    payload = models.TextField()
+    status = models.TextField()
+    attempts = models.IntegerField(default=0)
+    nextAttemptAt = models.DateTimeField()
+    claimToken = models.CharField(max_length=32, null=True)
+    lockedUntil = models.DateTimeField(null=True)
+    lastError = models.TextField(null=True)
+    createdAt = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Used by the worker to find the payments due to be sent
+            models.Index(fields=['status', 'nextAttemptAt'], name='outbox_status_next_idx'),
+        ]
+
+
+# IDEMPOTENCY
+
+class IdempotencyKey(models.Model):
+    key = models.CharField(max_length=255)
+    route = models.CharField(max_length=100)
+    requestHash = models.CharField(max_length=64)
+    status = models.TextField()
+    responseStatus = models.IntegerField(null=True)
+    responseBody = models.TextField(null=True)
+    createdAt = models.DateTimeField()
+    expiresAt = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'route'], name='idempotency_key_route_unique'),
+        ]
@@ -0,0 +1,236 @@
+import asyncio
+import random
+import threading
+import time
+import weakref
+
+from django.conf import settings
+
+from api import metrics
+
+
+# Raised when an upstream service can't be used, either because its circuit is open or because it could not be
+# reached at all
+class UpstreamUnavailable(Exception):
+    pass
+
+
+# Stops calls to an upstream service after it has failed a number of times in a row. Once the reset timeout has
+# passed, a single trial call is let through, which either closes the circuit again or keeps it open.
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            # The circuit is closed, so everything goes through
+            if self.opened_at is None:
+                return True
+
+            # The circuit is open, so only one trial call is allowed once the timeout has passed
+            if not self.trial_running and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.trial_running = True
+                return True
+
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_running = False
+
+            # Opens (or re-opens, after a failed trial) the circuit
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+
+        return 'half-open' if self.trial_running else 'open'
+
+
+_session = None
+_async_clients = weakref.WeakKeyDictionary()
+_breakers = {}
+_lock = threading.Lock()
+
+
+# Returns the session shared by every outbound call, so connections to the upstream services are kept alive and
+# reused instead of a new one being opened for every payment. requests is imported the first time it's needed, like
+# httpx below, so workers start faster.
+def get_session():
+    global _session
+
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    if _session is None:
+        with _lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=settings.OUTBOUND_POOL_CONNECTIONS,
+                                      pool_maxsize=settings.OUTBOUND_POOL_MAXSIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+
+    return _session
+
+
+# Returns the async client for the running event loop, which keeps its own pool of connections. httpx is only needed
+# by the async views, so it's imported the first time one is used.
+async def get_async_client():
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    entry = _async_clients.get(loop)
+
+    if entry is None:
+        limits = httpx.Limits(max_connections=settings.OUTBOUND_POOL_MAXSIZE,
+                              max_keepalive_connections=settings.OUTBOUND_POOL_MAXSIZE)
+        client = httpx.AsyncClient(limits=limits)
+
+        # Under WSGI, each async request runs in an event loop of its own, which is closed once the request is done,
+        # so the client is closed along with it. Kept here, as the loop only holds a weak reference to it.
+        closer = close_with_loop(client)
+        await closer.__anext__()
+        entry = _async_clients[loop] = (client, closer)
+
+    return entry[0]
+
+
+# An async generator which is left waiting, so that its finally block is run when the event loop shuts down its async
+# generators, as asyncio.run does before closing the loop. The generator holds a reference to its loop, so the entry is
+# removed here too, otherwise the loop would never be freed.
+async def close_with_loop(client):
+    try:
+        yield
+    finally:
+        _async_clients.pop(asyncio.get_running_loop(), None)
+        await client.aclose()
+
+
+def get_breaker(service):
+    breaker = _breakers.get(service)
+
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.get(service)
+
+            if breaker is None:
+                config = settings.OUTBOUND_SERVICES[service]
+                breaker = CircuitBreaker(config['FAILURE_THRESHOLD'], config['RESET_TIMEOUT'])
+                _breakers[service] = breaker
+
+    return breaker
+
+
+# Sends a POST request to one of the services in OUTBOUND_SERVICES. Idempotent calls are retried on connection
+# errors and 5xx responses, waiting a random (jittered) amount of time between attempts so that retries from
+# different workers don't all arrive at once.
+def post(service, data=None, idempotent=False):
+    import requests
+
+    config = settings.OUTBOUND_SERVICES[service]
+    breaker = get_breaker(service)
+
+    # Fails straight away rather than waiting on a service we know is down
+    if not breaker.allow():
+        metrics.record_upstream(service, 'circuit_open')
+        raise UpstreamUnavailable("The service is currently unavailable.")
+
+    attempts = 1 + (config['RETRIES'] if idempotent else 0)
+    response = None
+    error = None
+
+    for attempt in range(attempts):
+        if attempt > 0:
+            time.sleep(random.uniform(0, config['BACKOFF'] * 2 ** attempt))
+
+        started = time.perf_counter()
+
+        try:
+            response = get_session().post(config['URL'], data=data,
+                                          timeout=(config['CONNECT_TIMEOUT'], config['READ_TIMEOUT']))
+        except requests.RequestException as request_error:
+            metrics.record_upstream(service, type(request_error).__name__, time.perf_counter() - started)
+            response = None
+            error = request_error
+            continue
+
+        metrics.record_upstream(service, response.status_code, time.perf_counter() - started)
+
+        # Errors in the request we sent are still answers, so only server errors count as failures
+        if response.status_code < 500:
+            breaker.record_success()
+            return response
+
+    breaker.record_failure()
+
+    # Passes back the last error response, so its comment can be shown, or raises if it couldn't be reached
+    if response is not None:
+        return response
+
+    raise UpstreamUnavailable("The service could not be reached. (%s)" % type(error).__name__)
+
+
+# The same as post, but awaits the response instead of blocking the worker
+async def async_post(service, data=None, idempotent=False):
+    import httpx
+
+    config = settings.OUTBOUND_SERVICES[service]
+    breaker = get_breaker(service)
+
+    # Fails straight away rather than waiting on a service we know is down
+    if not breaker.allow():
+        metrics.record_upstream(service, 'circuit_open')
+        raise UpstreamUnavailable("The service is currently unavailable.")
+
+    # httpx sends raw bodies and form data through different arguments
+    body = {'content': data} if isinstance(data, (str, bytes)) else {'data': data}
+    timeout = httpx.Timeout(config['READ_TIMEOUT'], connect=config['CONNECT_TIMEOUT'])
+    attempts = 1 + (config['RETRIES'] if idempotent else 0)
+    response = None
+    error = None
+
+    for attempt in range(attempts):
+        if attempt > 0:
+            await asyncio.sleep(random.uniform(0, config['BACKOFF'] * 2 ** attempt))
+
+        started = time.perf_counter()
+
+        try:
+            response = await (await get_async_client()).post(config['URL'], timeout=timeout, **body)
+        except httpx.HTTPError as request_error:
+            metrics.record_upstream(service, type(request_error).__name__, time.perf_counter() - started)
+            response = None
+            error = request_error
+            continue
+
+        metrics.record_upstream(service, response.status_code, time.perf_counter() - started)
+
+        # Errors in the request we sent are still answers, so only server errors count as failures
+        if response.status_code < 500:
+            breaker.record_success()
+            return response
+
+    breaker.record_failure()
+
+    # Passes back the last error response, so its comment can be shown, or raises if it couldn't be reached
+    if response is not None:
+        return response
+
+    raise UpstreamUnavailable("The service could not be reached. (%s)" % type(error).__name__)
@@ -0,0 +1,80 @@
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from api import ledger
+from api.cards import unseal
+from api.codec import loads
+from api.ledger import OUTBOX_QUEUED, OUTBOX_SENDING
+from api.models import PNSOutbox
+from api.services import failure, pns
+
+# Sending payments to the PNS in the background. A payment made with Prefer: respond-async is saved as a Pending
+# transaction with a row in the outbox, and the client is answered straight away. The run_pns_outbox worker then
+# claims the payments due in batches, sends them to the PNS a number at a time, and marks each one completed, failed, or
+# to be retried later. The outbox is a normal table, so no message broker is needed.
+
+
+# Claims a batch of the payments due to be sent, returning the token they were claimed with and their (id, payload,
+# attempts). Payments claimed by a worker which has since stopped are claimed again once their lock has run out.
+def claim_batch(batch_size):
+    now = timezone.now()
+    due = Q(status=OUTBOX_QUEUED, nextAttemptAt__lte=now) | Q(status=OUTBOX_SENDING, lockedUntil__lte=now)
+    ids = list(PNSOutbox.objects.filter(due).order_by('nextAttemptAt').values_list('id', flat=True)[:batch_size])
+
+    if not ids:
+        return None, []
+
+    # The update only matches payments which are still due, so if two workers pick the same ones, only one claims each
+    token = uuid.uuid4().hex
+    PNSOutbox.objects.filter(due, id__in=ids).update(
+        status=OUTBOX_SENDING, claimToken=token, attempts=F('attempts') + 1,
+        lockedUntil=now + timedelta(seconds=settings.PNS_OUTBOX['LOCK_TIMEOUT']))
+
+    return token, list(PNSOutbox.objects.filter(claimToken=token).values_list('id', 'payload', 'attempts'))
+
+
+def send_claimed(claimed):
+    try:
+        payload = loads(unseal(claimed[1]))
+
+    # Sealed with another key, so it can never be sent
+    except ValueError:
+        return failure(301, "Error. The payment could not be decrypted")
+
+    return pns.send_payment_payload(payload)
+
+
+# Puts a payment back in the outbox, to be tried again after a delay which doubles with every attempt
+def retry_later(outbox_id, claim_token, attempts, error):
+    config = settings.PNS_OUTBOX
+    delay = min(config['RETRY_DELAY'] * 2 ** (attempts - 1), config['MAX_RETRY_DELAY'])
+
+    PNSOutbox.objects.filter(id=outbox_id, claimToken=claim_token).update(
+        status=OUTBOX_QUEUED, claimToken=None, lockedUntil=None, lastError=error,
+        nextAttemptAt=timezone.now() + timedelta(seconds=delay))
+
+
+# Claims and sends one batch, using the executor to send a number of payments at once. Returns how many were sent,
+# put back to be retried, and failed.
+def process_batch(executor, batch_size):
+    claim_token, claimed = claim_batch(batch_size)
+    sent = retried = failed = 0
+
+    # Only the calls to the PNS are made from the executor's threads, the database is updated from this one
+    for (outbox_id, payload, attempts), result in zip(claimed, executor.map(send_claimed, claimed)):
+        if result.ok:
+            sent += ledger.complete_pending_payment(outbox_id, claim_token)
+
+        # The PNS couldn't be reached, or had an error of its own, so it's worth trying again
+        elif result.retryable and attempts < settings.PNS_OUTBOX['MAX_ATTEMPTS']:
+            retry_later(outbox_id, claim_token, attempts, result.comment)
+            retried += 1
+
+        else:
+            failed += ledger.fail_pending_payment(outbox_id, claim_token, result.comment)
+
+    return sent, retried, failed
@@ -0,0 +1,240 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+
+from api.cards import card_fingerprint
+from api.codec import parse_body
+from api.functions import error_response
+from api.schemas import strip_separators
+
+# Token bucket rate limiting, set up for each view with rate_limited. Every client IP has a bucket of tokens for each
+# route, and every card and payee account a bucket shared by all the payment routes, so a card can't be tried more often
+# by spreading its payments across them. Buckets refill at a steady rate up to their burst size, and each request takes
+# a token from each of its buckets. A request which finds any of them empty is turned away with ErrorCode 112 before
+# it's validated, looked up or sent to the PNS.
+#
+# A batch only takes its IP token up front. Each payment in it then takes from its own card and payee buckets (see
+# take_payment_tokens), so a card or payee over its limit only has its own payments turned away, in their Results.
+#
+# The limits are checked inside @idempotent, so replays of a stored response don't use up tokens, and a request which
+# was turned away can be retried with the same Idempotency-Key.
+
+
+# A bucket refilling at rate tokens per second, holding at most burst tokens
+class Limit:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+
+
+def per_second(rate, burst=None):
+    return Limit(rate, burst or rate)
+
+
+def per_minute(rate, burst=None):
+    return Limit(rate / 60, burst or rate)
+
+
+# Each card can only be tried a few times a minute, which stops card testing, whilst the limits on client IPs and payee
+# accounts are high enough for an aggregator or busy business, and only stop floods. The card and payee limits have to
+# be the same on every route, as their buckets are shared.
+PAYMENT_LIMITS = {'ip': per_second(50, burst=100), 'card': per_minute(10, burst=5), 'payee': per_second(50, burst=100)}
+BATCH_PAYMENT_LIMITS = {'ip': per_second(5, burst=10)}
+REFUND_LIMITS = {'ip': per_second(20, burst=50)}
+CANCELLATION_LIMITS = {'ip': per_second(20, burst=50)}
+
+
+# Works out how many tokens a bucket has now, from how many it had when it was last used. Returns the tokens left after
+# taking one, and how many seconds until there's a token if there wasn't one to take.
+def take_token(tokens, last_used, limit, now):
+    tokens = min(limit.burst, tokens + (now - last_used) * limit.rate)
+
+    if tokens < 1:
+        return tokens, (1 - tokens) / limit.rate
+
+    return tokens - 1, 0
+
+
+# The buckets of this worker, as {key: (tokens, time last used)}. Only MAX_KEYS buckets are kept, dropping the least
+# recently used, which is the same as it refilling.
+class LocalBuckets:
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, limit):
+        now = time.monotonic()
+
+        with self._lock:
+            tokens, last_used = self._buckets.get(key, (limit.burst, now))
+            tokens, wait = take_token(tokens, last_used, limit, now)
+
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+        return wait
+
+
+# The buckets kept in one of Django's caches, so they're shared by every worker. Reading and writing a bucket aren't
+# atomic, so workers taking from the same bucket at the same moment can let a few more requests through than the limit.
+class DjangoBuckets:
+    def __init__(self, alias):
+        self.alias = alias
+
+    def take(self, key, limit):
+        cache = caches[self.alias]
+        now = time.time()
+        tokens, last_used = cache.get('ratelimit:%s' % key, (limit.burst, now))
+        tokens, wait = take_token(tokens, last_used, limit, now)
+
+        # Once a bucket would have refilled it can be forgotten
+        cache.set('ratelimit:%s' % key, (tokens, now), timeout=int(limit.burst / limit.rate) + 1)
+
+        return wait
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = settings.RATE_LIMIT
+
+                if config['BACKEND'] == 'django':
+                    _backend = DjangoBuckets(config['ALIAS'])
+                else:
+                    _backend = LocalBuckets(config['MAX_KEYS'])
+
+    return _backend
+
+
+def client_ip(request):
+    if settings.RATE_LIMIT['TRUST_X_FORWARDED_FOR']:
+        forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+
+        # The address the nearest proxy was connected from
+        if forwarded_for:
+            return forwarded_for.rsplit(',', 1)[-1].strip()
+
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def payee_bucket(account_number, sort_code):
+    return '%s:%s' % (strip_separators(str(account_number)), strip_separators(sort_code))
+
+
+# The keys of the buckets for the request, as (kind, value). The card and payee account are only known for requests
+# with a valid JSON body which has them, and the card is keyed on its fingerprint so the card number isn't kept.
+def bucket_keys(request, kinds):
+    if 'ip' in kinds:
+        yield 'ip', client_ip(request)
+
+    if 'card' not in kinds and 'payee' not in kinds:
+        return
+
+    try:
+        body = parse_body(request)
+
+    except ValueError:
+        return
+
+    if not isinstance(body, dict):
+        return
+
+    if 'card' in kinds and isinstance(body.get('CardNumber'), str):
+        yield 'card', card_fingerprint(body['CardNumber'])
+
+    if 'payee' in kinds and body.get('PayeeBankAccNum') is not None and isinstance(body.get('PayeeBankSortCode'), str):
+        yield 'payee', payee_bucket(body['PayeeBankAccNum'], body['PayeeBankSortCode'])
+
+
+# Takes a token from each of the request's buckets, returning the error response if one was empty
+def check(request, route, limits):
+    if not settings.RATE_LIMIT['ENABLED']:
+        return None
+
+    backend = get_backend()
+
+    for kind, value in bucket_keys(request, limits):
+        # Only the IP buckets are kept for each route
+        key = '%s:%s:%s' % (route, kind, value) if kind == 'ip' else '%s:%s' % (kind, value)
+        wait = backend.take(key, limits[kind])
+
+        if wait:
+            response_data = {
+                'ErrorCode': None,
+                'Comment': ""
+            }
+
+            response = error_response(response_data, 112, status=429)
+            response['Retry-After'] = str(int(wait) + 1)
+            return response
+
+    return None
+
+
+# Takes a token from the card and payee buckets of one payment in a batch, given its cleaned values, with the same
+# limits as a single payment. Returns how many seconds until there's a token if one was empty, else 0.
+def take_payment_tokens(payment):
+    if not settings.RATE_LIMIT['ENABLED']:
+        return 0
+
+    backend = get_backend()
+    buckets = [('card:%s' % card_fingerprint(payment['card_number']), PAYMENT_LIMITS['card']),
+               ('payee:%s' % payee_bucket(payment['payee_account_number'], payment['payee_sort_code']),
+                PAYMENT_LIMITS['payee'])]
+
+    for key, limit in buckets:
+        wait = backend.take(key, limit)
+
+        if wait:
+            return wait
+
+    return 0
+
+
+# Wraps a view with the limits given for each kind of bucket, e.g. rate_limit(view, ip=per_second(50, burst=100))
+def rate_limit(view, **limits):
+    route = view.__name__
+
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            limited = check(request, route, limits)
+
+            if limited is not None:
+                return limited
+
+            return await view(request, *args, **kwargs)
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        limited = check(request, route, limits)
+
+        if limited is not None:
+            return limited
+
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+# The same as rate_limit, as a decorator, e.g. @rate_limited(**PAYMENT_LIMITS)
+def rate_limited(**limits):
+    return lambda view: rate_limit(view, **limits)
@@ -0,0 +1,38 @@
+from api.functions import generic_error_messages, upstream_comment
+
+# The work behind the PNS and currency converter endpoints, as plain functions. The payment and refund views call these
+# directly, rather than going through the views of those endpoints, and the endpoints themselves are thin wrappers
+# which turn the result into a response.
+
+
+# The outcome of a service call. error_code is None if it succeeded, in which case value holds what it returned.
+# retryable is set on failures which might not happen if the call is made again later.
+class Result:
+    def __init__(self, value=None, error_code=None, comment="", retryable=False):
+        self.value = value
+        self.error_code = error_code
+        self.comment = comment
+        self.retryable = retryable
+
+    @property
+    def ok(self):
+        return self.error_code is None
+
+
+def failure(error_code, comment=None, retryable=False):
+    if comment is None:
+        comment = generic_error_messages.get(error_code)
+
+    return Result(error_code=error_code, comment=comment, retryable=retryable)
+
+
+# A failure with our error code, followed by the comment from the other API's response. Server errors might not
+# happen again, whereas anything else is the other API's answer to the request.
+def upstream_failure(api_response, error_code):
+    return failure(error_code, generic_error_messages.get(error_code) + upstream_comment(api_response),
+                   retryable=api_response.status_code >= 500)
+
+
+# A failure because the other API couldn't be used at all
+def unavailable(error, error_code):
+    return failure(error_code, generic_error_messages.get(error_code) + str(error), retryable=True)
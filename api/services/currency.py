@@ -0,0 +1,152 @@
+from datetime import date
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError
+
+from api import caching, outbound
+from api.codec import dumps, loads
+from api.outbound import UpstreamUnavailable
+from api.services import Result, rates, unavailable, upstream_failure
+
+# Currency conversion. Rates are taken from the exchange rates stored in the database where possible (see
+# api/services/rates.py). Otherwise they're cached for each currency pair and date, so the same rate is used for every
+# amount converted that day, and the currency converter is only called for rates that aren't stored or cached.
+
+
+# Creates the currency converter request for a rate. A large reference amount is converted instead of the one
+# requested, so the rate isn't affected by rounding.
+def rate_request_body(key):
+    currency_converter_request = {
+        'CurrencyFrom': key[0],
+        'CurrencyTo': key[1],
+        'Date': key[2],
+        'Amount': settings.CURRENCY_RATE_REFERENCE_AMOUNT
+    }
+
+    return dumps(currency_converter_request)
+
+
+# We get the converted amount from the response body, and work out the rate from it
+def rate_from_response(currency_response):
+    response_body = loads(currency_response.content)
+    return response_body['Amount'] / settings.CURRENCY_RATE_REFERENCE_AMOUNT
+
+
+# Returns the stored rate for the pair on the day, or None if there isn't one
+def local_rate(currency_from, currency_to, day):
+    day = rates.rate_day(day)
+
+    if day is None:
+        return None
+
+    # If the database can't be read, the currency converter is asked instead
+    try:
+        return rates.load_matrix(day).get((currency_from, currency_to))
+
+    except DatabaseError:
+        return None
+
+
+async def local_rate_async(currency_from, currency_to, day):
+    day = rates.rate_day(day)
+
+    if day is None:
+        return None
+
+    # Only goes to the database the first time the day is needed, or to check its version every few seconds
+    matrix = rates.cached_matrix(day)
+
+    if matrix is None:
+        try:
+            matrix = await sync_to_async(rates.load_matrix)(day)
+
+        except DatabaseError:
+            return None
+
+    return matrix.get((currency_from, currency_to))
+
+
+# The key a rate is cached under, which is also what the currency converter is asked for. Conversions without a date
+# are for today, so the rate isn't cached under None and used on every day after.
+def rate_key(currency_from, currency_to, day):
+    return currency_from, currency_to, date.today().isoformat() if day is None else str(day)
+
+
+def get_rate(currency_from, currency_to, day):
+    rate = local_rate(currency_from, currency_to, day)
+
+    if rate is not None:
+        return Result(rate)
+
+    key = rate_key(currency_from, currency_to, day)
+    rate_cache = caching.get_cache('currency_rates')
+    rate = rate_cache.get(key)
+
+    if rate is not None:
+        return Result(rate)
+
+    # Sends a POST request to the currency converter, which can be retried as converting is idempotent
+    try:
+        currency_response = outbound.post('currency', data=rate_request_body(key), idempotent=True)
+
+    # If the currency converter is down or couldn't be reached
+    except UpstreamUnavailable as error:
+        return unavailable(error, 201)
+
+    if currency_response.status_code != 200:
+        return upstream_failure(currency_response, 201)
+
+    rate = rate_from_response(currency_response)
+    rate_cache.set(key, rate)
+    return Result(rate)
+
+
+# The same as get_rate, but awaits the currency converter instead of blocking the worker
+async def get_rate_async(currency_from, currency_to, day):
+    rate = await local_rate_async(currency_from, currency_to, day)
+
+    if rate is not None:
+        return Result(rate)
+
+    key = rate_key(currency_from, currency_to, day)
+    rate_cache = caching.get_cache('currency_rates')
+    rate = rate_cache.get(key)
+
+    if rate is not None:
+        return Result(rate)
+
+    try:
+        currency_response = await outbound.async_post('currency', data=rate_request_body(key), idempotent=True)
+
+    # If the currency converter is down or couldn't be reached
+    except UpstreamUnavailable as error:
+        return unavailable(error, 201)
+
+    if currency_response.status_code != 200:
+        return upstream_failure(currency_response, 201)
+
+    rate = rate_from_response(currency_response)
+    rate_cache.set(key, rate)
+    return Result(rate)
+
+
+# Converts the amount using the rate on the day given, returning the converted amount
+def convert(amount, currency_from, currency_to, day):
+    result = get_rate(currency_from, currency_to, day)
+
+    if result.ok:
+        result.value = round(amount * result.value, 2)
+        result.comment = "Conversion Successful"
+
+    return result
+
+
+async def convert_async(amount, currency_from, currency_to, day):
+    result = await get_rate_async(currency_from, currency_to, day)
+
+    if result.ok:
+        result.value = round(amount * result.value, 2)
+        result.comment = "Conversion Successful"
+
+    return result
@@ -0,0 +1,78 @@
+from api import outbound
+from api.outbound import UpstreamUnavailable
+from api.services import Result, unavailable, upstream_failure
+
+# Sending payments and refunds to the Payment Network Service
+
+
+# Changes a payment request into the body the PNS expects. A copy is changed, as the request is shared with the
+# other functions handling it.
+def pns_payment_data(request_data):
+    request_data = dict(request_data)
+
+    # Remove the arguments the PNS doesn't need
+    request_data.pop('PayerCurrencyCode')
+    request_data.pop('RecipientName')
+    request_data.pop('Email')
+
+    # Change the name of some keys to match what the PNS expects
+    request_data['HolderName'] = request_data.pop('CardHolderName')
+    request_data['BillingAddress'] = request_data.pop('CardHolderAddress')
+    request_data['CurrencyCode'] = request_data.pop('PayeeCurrencyCode')
+    request_data['AccountNumber'] = request_data.pop('PayeeBankAccNum')
+    request_data['Sort-Code'] = request_data.pop('PayeeBankSortCode')
+
+    return request_data
+
+
+# Sends an already parsed payment to the PNS
+def send_payment(request_data):
+    return send_payment_payload(pns_payment_data(request_data))
+
+
+# Sends a payment already changed into the body the PNS expects, e.g. one queued in the outbox
+def send_payment_payload(payload):
+    return send(payload, "PNS Payment Successful")
+
+
+# Sends a refund to the PNS. We don't alter any data, and have already checked it, so the body is passed on as it was
+# sent to us.
+def send_refund(body):
+    return send(body, "PNS Refund Successful")
+
+
+async def send_payment_async(request_data):
+    return await send_async(pns_payment_data(request_data), "PNS Payment Successful")
+
+
+async def send_refund_async(body):
+    return await send_async(body, "PNS Refund Successful")
+
+
+def send(data, comment):
+    try:
+        pns_response = outbound.post('pns', data=data)
+
+    # If the PNS is down or couldn't be reached
+    except UpstreamUnavailable as error:
+        return unavailable(error, 301)
+
+    # Return our error code and their comment if the request was not OK
+    if pns_response.status_code != 200:
+        return upstream_failure(pns_response, 301)
+
+    return Result(comment=comment)
+
+
+async def send_async(data, comment):
+    try:
+        pns_response = await outbound.async_post('pns', data=data)
+
+    # If the PNS is down or couldn't be reached
+    except UpstreamUnavailable as error:
+        return unavailable(error, 301)
+
+    if pns_response.status_code != 200:
+        return upstream_failure(pns_response, 301)
+
+    return Result(comment=comment)
@@ -0,0 +1,96 @@
+import time
+import uuid
+from datetime import date
+
+from django.conf import settings
+from django.utils.dateparse import parse_date
+
+from api import caching
+from api.models import ExchangeRate, ExchangeRateDay
+
+# The exchange rates stored in the database, as a matrix of every pair of currencies which can be converted on a day.
+# A day's matrix is built the first time a rate for that day is needed, and kept in the exchange_rates cache, so
+# converting is a dictionary lookup. import_exchange_rates gives each day it loads rates for a new version in the
+# database, and every VERSION_CHECK_INTERVAL seconds a worker checks the version of the matrix it has, rebuilding it if
+# it has changed. This reaches every worker, whichever backend the cache has.
+
+
+# Returns the day of a conversion as a date, or None if it isn't one. Conversions without a date use today's rates.
+def rate_day(day):
+    if day is None:
+        return date.today()
+
+    if isinstance(day, date):
+        return day
+
+    try:
+        return parse_date(str(day))
+
+    except ValueError:
+        return None
+
+
+# Builds the matrix of {(from, to): rate} from the (base, quote, rate) rows of a day. Pairs without a rate of their
+# own are converted the other way round, or through the base currency if both currencies have a rate with it.
+def build_matrix(rows, base_currency):
+    matrix = {}
+
+    for base, quote, rate in rows:
+        matrix[(base, quote)] = rate
+
+    for (base, quote), rate in list(matrix.items()):
+        if rate:
+            matrix.setdefault((quote, base), 1 / rate)
+
+    to_base = {currency_from: rate for (currency_from, currency_to), rate in matrix.items()
+               if currency_to == base_currency}
+    from_base = {currency_to: rate for (currency_from, currency_to), rate in matrix.items()
+                 if currency_from == base_currency}
+
+    for currency_from, rate_to_base in to_base.items():
+        for currency_to, rate_from_base in from_base.items():
+            if currency_from != currency_to:
+                matrix.setdefault((currency_from, currency_to), rate_to_base * rate_from_base)
+
+    return matrix
+
+
+# Returns the matrix of the day if it's been built and its version checked recently, else None, without going to the
+# database. Entries are (version, matrix, time checked), with the wall clock time as the cache can be shared.
+def cached_matrix(day):
+    entry = caching.get_cache('exchange_rates').get(day.isoformat())
+
+    if entry is None or time.time() - entry[2] > settings.EXCHANGE_RATES['VERSION_CHECK_INTERVAL']:
+        return None
+
+    return entry[1]
+
+
+def load_matrix(day):
+    matrix = cached_matrix(day)
+
+    if matrix is not None:
+        return matrix
+
+    exchange_rates = caching.get_cache('exchange_rates')
+    entry = exchange_rates.get(day.isoformat())
+    version = ExchangeRateDay.objects.filter(date=day).values_list('version', flat=True).first()
+
+    # Only built again if rates have been imported for the day since
+    if entry is not None and entry[0] == version:
+        matrix = entry[1]
+
+    else:
+        rows = ExchangeRate.objects.filter(date=day).values_list('base', 'quote', 'rate')
+        matrix = build_matrix(rows, settings.EXCHANGE_RATES['BASE_CURRENCY'])
+
+    # Days without any rates are cached too, so they don't go to the database for every conversion
+    exchange_rates.set(day.isoformat(), (version, matrix, time.time()))
+    return matrix
+
+
+# Gives each of the days a new version, so every worker builds its matrix again with the rates just loaded. Called in
+# the same database transaction as the rates are loaded in.
+def new_versions(days):
+    ExchangeRateDay.objects.bulk_create([ExchangeRateDay(date=day, version=uuid.uuid4().hex) for day in days],
+                                        update_conflicts=True, unique_fields=['date'], update_fields=['version'])
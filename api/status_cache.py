@@ -0,0 +1,77 @@
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
+
+from api import caching
+from api.models import ArchivedTransaction, Transaction
+
+# The status of each transaction polled with transactionStatus, kept in the transaction_status cache as a compact
+# record of (status, amount, currency, date, error) along with its ETag. Lookups only go to the database on a miss, and
+# api/ledger.py writes the new record of a transaction to the cache whenever it changes one, once the change commits.
+#
+# Refunded, cancelled and failed transactions can't change again, so their records are kept for the cache's TTL.
+# Completed, pending and refunding ones can still be changed by another process (e.g. run_pns_outbox), which only
+# reaches this worker's cache with the django backend, so they're kept for TRANSACTION_STATUS['OPEN_TTL'] instead. This
+# also limits how long a record read just before a change was written can be kept.
+
+FINAL_STATUSES = ("Refunded", "Cancelled", "Refund Transaction", "Failed")
+
+
+def make_etag(transaction_id, record):
+    return '"%s"' % hashlib.blake2b(repr((transaction_id,) + record).encode(), digest_size=8).hexdigest()
+
+
+def store(transaction_id, record):
+    ttl = None if record[0] in FINAL_STATUSES else settings.TRANSACTION_STATUS['OPEN_TTL']
+    entry = (record, make_etag(transaction_id, record))
+
+    caching.get_cache('transaction_status').set(transaction_id, entry, ttl=ttl)
+    return entry
+
+
+# Reads the record of a transaction from whichever table it's in, or None if it doesn't exist
+def load(transaction_id):
+    # The error of a payment the PNS rejected is kept in the outbox
+    found = Transaction.objects.filter(id=transaction_id).values_list(
+        'transactionStatus', 'amount', 'currency', 'date', 'outbox__lastError').first()
+
+    # Failed payments are never archived, so there's no error to read from the archive
+    if found is None:
+        found = ArchivedTransaction.objects.filter(id=transaction_id).values_list(
+            'transactionStatus', 'amount', 'currency', 'date').first()
+
+        if found is None:
+            return None
+
+        found += (None,)
+
+    status, amount, currency, day, error = found
+    return status, amount, currency, day.isoformat(), error if status == "Failed" else None
+
+
+# Returns the (record, ETag) of a transaction, from the cache if it's there, or None if it doesn't exist
+def get_status(transaction_id):
+    entry = caching.get_cache('transaction_status').get(transaction_id)
+
+    if entry is not None:
+        return entry
+
+    record = load(transaction_id)
+
+    if record is None:
+        return None
+
+    return store(transaction_id, record)
+
+
+# Called by api/ledger.py inside the database transaction which changed a transaction. The cache is only updated once
+# it commits, so a change which is rolled back is never seen.
+def changed(transaction_id, status, amount, currency, day, error=None):
+    record = (status, amount, currency, day.isoformat(), error)
+    transaction.on_commit(lambda: store(transaction_id, record))
+
+
+# For changes where the rest of the record isn't to hand, it's dropped from the cache and read again when next polled
+def forget(transaction_id):
+    transaction.on_commit(lambda: caching.get_cache('transaction_status').delete(transaction_id))
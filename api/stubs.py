@@ -0,0 +1,94 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-ins for the PNS and currency converter, used by the load_test command so the API can be measured without
+# calling the live services. Each stub waits for a set latency before answering, and fails a set fraction of requests
+# with a 500, so the effect of slow or failing upstream services can be measured too.
+
+# The rates the currency converter stub converts with, any other pair of currencies is converted at 1.0
+STUB_RATES = {
+    ('826', '840'): 1.25,
+    ('840', '826'): 0.8,
+    ('826', '978'): 1.15,
+    ('978', '826'): 0.87,
+    ('840', '978'): 0.92,
+    ('978', '840'): 1.09,
+}
+
+
+class StubServer:
+    # respond is given the body of each request, and returns the status and JSON body of the response
+    def __init__(self, respond, latency=0.0, error_rate=0.0):
+        self.respond = respond
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    # Starts serving on a free port on localhost, in a background thread, returning the URL to send requests to
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                status, response_body = stub.handle(body)
+                content = json.dumps(response_body).encode()
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            # Keeps the output of the load test readable
+            def log_message(self, *args):
+                pass
+
+        # HTTP/1.1, so the API's connection pool can keep connections to the stub alive
+        Handler.protocol_version = 'HTTP/1.1'
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+        return 'http://127.0.0.1:%d/' % self._server.server_address[1]
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle(self, body):
+        time.sleep(self.latency)
+        failed = random.random() < self.error_rate
+
+        with self._lock:
+            self.requests += 1
+            self.errors += failed
+
+        if failed:
+            return 500, {'ErrorCode': 500, 'Comment': "Stub error"}
+
+        return self.respond(body)
+
+
+# Accepts every payment and refund
+def pns_response(body):
+    return 200, {'ErrorCode': None, 'Comment': "Transaction Successful"}
+
+
+def currency_response(body):
+    try:
+        conversion = json.loads(body)
+        rate = STUB_RATES.get((conversion['CurrencyFrom'], conversion['CurrencyTo']), 1.0)
+        amount = round(conversion['Amount'] * rate, 2)
+
+    except (ValueError, KeyError, TypeError):
+        return 400, {'ErrorCode': 400, 'Comment': "Error. Invalid conversion request"}
+
+    return 200, {'ErrorCode': None, 'Comment': "Conversion Successful", 'Amount': amount}
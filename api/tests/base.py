@@ -0,0 +1,84 @@
+import json
+from datetime import date
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from api import caching, outbound, ratelimit
+from api.models import BankDetails, BusinessAccount, PaymentDetails, PersonalAccount, Transaction
+
+# What the tests of the API share: a business and a personal account to make payments between, and stand-ins for the
+# PNS and currency converter
+
+NO_RATE_LIMIT = dict(settings.RATE_LIMIT, ENABLED=False)
+NO_KNOWN_ACCOUNTS = dict(settings.KNOWN_ACCOUNTS, ENABLED=False)
+
+
+# A response from the PNS or currency converter
+class UpstreamResponse:
+    def __init__(self, status_code=200, body=None):
+        self.status_code = status_code
+        self.text = json.dumps(body or {'Comment': "OK"})
+        self.content = self.text.encode()
+
+    def json(self):
+        return json.loads(self.text)
+
+
+# Answers every outbound call with a successful response, or with what respond returns
+def upstream(respond=None):
+    session = mock.Mock()
+    session.post.side_effect = respond or (lambda url, data=None, **kwargs: UpstreamResponse())
+    return mock.patch.object(outbound, 'get_session', return_value=session)
+
+
+# The API's caches, rate limits and Bloom filters are kept in memory between requests, so each test starts with none.
+# The rate limits and Bloom filters are turned off, except in the tests of them, and emails are only checked for syntax,
+# so no DNS lookups are made.
+@override_settings(RATE_LIMIT=NO_RATE_LIMIT, KNOWN_ACCOUNTS=NO_KNOWN_ACCOUNTS, EMAIL_VALIDATION={'MODE': 'syntax'})
+class APITestCase(TestCase):
+    def setUp(self):
+        caching._caches.clear()
+        ratelimit._backend = None
+
+        self.card = PaymentDetails.objects.create(paymentId=1, cardNumber='1234567812345678', securityCode='123',
+                                                  expiryDate=date(2030, 1, 1))
+        payee_bank = BankDetails.objects.create(accountNumber=12345678, sortCode='112233', accountName='Shop Ltd')
+        payer_bank = BankDetails.objects.create(accountNumber=555, sortCode='000000', accountName='Jo')
+
+        self.payee = BusinessAccount.objects.create(accountNumber=12345678, paymentDetails=self.card,
+                                                    bankDetails=payee_bank, businessNumber=1, businessName='Shop',
+                                                    businessEmail='a@b.com', businessPhoneNumber='1')
+        self.payer = PersonalAccount.objects.create(accountNumber=1, paymentDetails=self.card, bankDetails=payer_bank,
+                                                    email='jo@gmail.com', password='x', phoneNumber='1',
+                                                    fullName='Jo Bloggs')
+
+    def post(self, path, body, **headers):
+        response = self.client.post(path, data=json.dumps(body), content_type='application/json', **headers)
+        return response.status_code, json.loads(response.content)
+
+    def payment(self, **changes):
+        body = {
+            'CardNumber': '1234-5678-1234-5678',
+            'CVV': '123',
+            'PayerCurrencyCode': '826',
+            'PayeeCurrencyCode': '826',
+            'Amount': 10.0,
+            'Expiry': '2030-01-01',
+            'PayeeBankAccNum': '12345678',
+            'PayeeBankSortCode': '11-22-33',
+            'CardHolderName': 'Jo Bloggs',
+            'CardHolderAddress': '1 High Street',
+            'Email': 'jo@gmail.com',
+            'RecipientName': 'Shop Ltd'
+        }
+        body.update(changes)
+        return body
+
+    def make_transaction(self, day, status="Completed", amount=10.0):
+        return Transaction.objects.create(payer=self.payer, payee=self.payee, amount=amount, currency='826', date=day,
+                                          transactionStatus=status)
+
+    def refund(self, transaction_id, amount=5.0, path='/initiateRefund'):
+        return self.post(path, {'TransactionUUID': transaction_id, 'Amount': amount, 'CurrencyCode': '826'})
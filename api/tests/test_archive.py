@@ -0,0 +1,25 @@
+import json
+from datetime import date, timedelta
+
+from api import ledger
+from api.models import Transaction
+from api.tests.base import APITestCase
+
+
+class ArchiveTests(APITestCase):
+    def test_newest_transaction_is_archived_and_its_id_never_reused(self):
+        old = self.make_transaction(date.today() - timedelta(days=400))
+
+        self.assertEqual(ledger.archive_batch(date.today(), date.today(), batch_size=10), (1, old.id))
+        self.assertFalse(Transaction.objects.exists())
+        self.assertGreater(self.make_transaction(date.today()).id, old.id)
+
+    def test_archived_transactions_are_still_found_by_id(self):
+        old = self.make_transaction(date.today() - timedelta(days=400))
+        ledger.archive_batch(date.today(), date.today(), batch_size=10)
+
+        response = self.client.get('/transactionStatus', {'TransactionUUID': old.id})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['TransactionStatus'], "Completed")
+        self.assertEqual(ledger.get_transaction(old.id)['amount'], 10.0)
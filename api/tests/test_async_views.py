@@ -0,0 +1,53 @@
+import asyncio
+from unittest import mock
+
+from api import outbound
+from api.tests.base import APITestCase, UpstreamResponse, upstream
+
+
+# Answers every call made through the async client with a successful response, or with what respond returns
+def async_upstream(respond=None):
+    client = mock.Mock()
+    client.post = mock.AsyncMock(side_effect=respond or (lambda url, **kwargs: UpstreamResponse()))
+    return mock.patch.object(outbound, 'get_async_client', mock.AsyncMock(return_value=client))
+
+
+def converter(url, **kwargs):
+    return UpstreamResponse(body={'Amount': 1250000.0})
+
+
+class AsyncViewTests(APITestCase):
+    def test_conversion_matches_the_sync_endpoint(self):
+        conversion = {'CurrencyFrom': '826', 'CurrencyTo': '840', 'Amount': 10.0}
+
+        with upstream(lambda url, data=None, **kwargs: converter(url)):
+            sync = self.post('/convertCurrency', conversion)
+
+        with async_upstream(converter):
+            self.assertEqual(self.post('/convertCurrencyAsync', conversion), sync)
+
+        self.assertEqual(sync[1]['Amount'], 12.5)
+
+    def test_currency_codes_are_checked_before_converting(self):
+        bodies = [({'CurrencyFrom': ['826'], 'CurrencyTo': '840', 'Amount': 10.0}, 103),
+                  ({'CurrencyFrom': '826', 'CurrencyTo': 840, 'Amount': 10.0}, 103),
+                  ({'CurrencyFrom': '82', 'CurrencyTo': '840', 'Amount': 10.0}, 104),
+                  ({'CurrencyFrom': '826', 'Amount': 10.0}, 102)]
+
+        with upstream() as session, async_upstream() as get_client:
+            for path in ('/convertCurrency', '/convertCurrencyAsync'):
+                for body, error_code in bodies:
+                    status, response = self.post(path, body)
+                    self.assertEqual((path, status, response['ErrorCode']), (path, 400, error_code))
+
+        session.return_value.post.assert_not_called()
+        get_client.assert_not_called()
+
+    def test_async_client_is_closed_with_its_event_loop(self):
+        async def get_client():
+            return await outbound.get_async_client()
+
+        client = asyncio.run(get_client())
+
+        self.assertTrue(client.is_closed)
+        self.assertEqual(len(outbound._async_clients), 0)
@@ -0,0 +1,55 @@
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from api.models import SettlementSummary, Transaction
+from api.tests.base import APITestCase, UpstreamResponse, upstream
+
+
+class BatchPaymentTests(APITestCase):
+    def test_every_payment_gets_its_own_result_in_order(self):
+        declined_amount = 66.0
+
+        # The PNS turns down one of the payments
+        def respond(url, data=None, **kwargs):
+            if data['Amount'] == declined_amount:
+                return UpstreamResponse(400, {'Comment': "Declined"})
+
+            return UpstreamResponse()
+
+        batch = [self.payment(), self.payment(Amount=-1.0), "not a payment", self.payment(PayeeBankAccNum='999'),
+                 self.payment(Amount=declined_amount), self.payment(Amount=20.0)]
+
+        with upstream(respond):
+            status, body = self.post('/initiateBatchPayment', batch)
+
+        self.assertEqual(status, 200)
+        self.assertEqual([result['ErrorCode'] for result in body['Results']], [None, 104, 103, 107, 301, None])
+        self.assertEqual(body['Results'][0]['Comment'], "Payment Successfully Completed")
+        self.assertEqual(sorted(Transaction.objects.values_list('amount', flat=True)), [10.0, 20.0])
+        self.assertEqual(SettlementSummary.objects.values_list('paymentCount', 'paymentTotal').get(), (2, 30.0))
+
+    def test_queries_do_not_grow_with_the_batch(self):
+        counts = []
+
+        # The first batch of the day also creates the day's settlement row
+        for size in (1, 2, 6):
+            with upstream(), CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.post('/initiateBatchPayment', [self.payment()] * size)[0], 200)
+
+            counts.append(len(queries))
+
+        self.assertEqual(counts[1], counts[2])
+        self.assertEqual(Transaction.objects.count(), 9)
+
+    def test_body_must_be_a_non_empty_array(self):
+        self.assertEqual(self.post('/initiateBatchPayment', self.payment())[1]['ErrorCode'], 103)
+        self.assertEqual(self.post('/initiateBatchPayment', [])[1]['ErrorCode'], 102)
+
+    @override_settings(BATCH_PAYMENT={'MAX_PAYMENTS': 3})
+    def test_batches_over_the_maximum_are_turned_away(self):
+        with upstream() as session:
+            status, body = self.post('/initiateBatchPayment', [self.payment()] * 4)
+
+        self.assertEqual((status, body['ErrorCode']), (400, 104))
+        session.return_value.post.assert_not_called()
@@ -0,0 +1,44 @@
+import io
+from datetime import date
+
+from django.core.management import call_command
+from django.test import override_settings
+
+from api.cards import card_fingerprint, card_matches
+from api.functions import validate_payment_request
+from api.lookups import lookup_payer
+from api.models import PaymentDetails
+from api.tests.base import APITestCase, upstream
+
+
+class CardFingerprintTests(APITestCase):
+    def test_fingerprint_ignores_separators_and_depends_on_the_key(self):
+        self.assertEqual(card_fingerprint('1234-5678 1234-5678'), self.card.cardFingerprint)
+        self.assertNotIn('1234', self.card.cardFingerprint)
+
+        with override_settings(CARD_FINGERPRINT_KEY='another key'):
+            self.assertNotEqual(card_fingerprint('1234567812345678'), self.card.cardFingerprint)
+
+    def test_payer_is_found_by_the_fingerprint(self):
+        payment = validate_payment_request(self.payment(CardNumber='1234 5678 1234 5678'), {})
+
+        with self.assertNumQueries(1):
+            self.assertEqual(lookup_payer(payment), self.payer)
+
+    def test_wrong_security_code_or_expiry_is_an_unknown_card(self):
+        self.assertTrue(card_matches(self.card, '123', date(2030, 1, 1)))
+        self.assertFalse(card_matches(self.card, '124', date(2030, 1, 1)))
+        self.assertFalse(card_matches(self.card, '123', date(2031, 1, 1)))
+
+        with upstream() as session:
+            self.assertEqual(self.post('/initiatePayment', self.payment(CVV='999'))[1]['ErrorCode'], 106)
+            self.assertEqual(self.post('/initiatePayment', self.payment(Expiry='2031-01-01'))[1]['ErrorCode'], 106)
+
+        session.return_value.post.assert_not_called()
+
+    def test_backfill_sets_missing_fingerprints(self):
+        PaymentDetails.objects.bulk_create([PaymentDetails(paymentId=2, cardNumber='9999888877776666',
+                                                           securityCode='456', expiryDate=date(2030, 1, 1))])
+        call_command('backfill_card_fingerprints', stdout=io.StringIO())
+
+        self.assertEqual(PaymentDetails.objects.get(paymentId=2).cardFingerprint, card_fingerprint('9999888877776666'))
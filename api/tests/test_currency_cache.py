@@ -0,0 +1,59 @@
+from datetime import date
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from api.caching import LocalCache
+from api.services import currency
+from api.tests.base import APITestCase, UpstreamResponse, upstream
+
+
+class LocalCacheTests(SimpleTestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LocalCache(max_entries=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual([cache.get(key) for key in ('a', 'b', 'c')], [1, None, 3])
+        self.assertEqual(cache.stats(), {'backend': 'local', 'hits': 3, 'misses': 1, 'evictions': 1, 'size': 2,
+                                         'max_entries': 2})
+
+    def test_entries_expire_after_their_ttl(self):
+        cache = LocalCache(ttl=60)
+
+        with mock.patch('api.caching.time.monotonic', return_value=1000.0) as monotonic:
+            cache.set('default', 1)
+            cache.set('short', 2, ttl=5)
+
+            monotonic.return_value = 1010.0
+            self.assertEqual((cache.get('default'), cache.get('short')), (1, None))
+
+            monotonic.return_value = 1060.0
+            self.assertIsNone(cache.get('default'))
+
+        self.assertEqual(cache.stats()['size'], 0)
+
+
+class RateCacheTests(APITestCase):
+    def converter(self):
+        return upstream(lambda url, data=None, **kwargs: UpstreamResponse(body={'Amount': 1250000.0}))
+
+    def test_rate_is_only_fetched_once_for_each_pair_and_day(self):
+        with self.converter() as session:
+            first = currency.convert(10.0, '826', '840', date(2024, 1, 1))
+            second = currency.convert(20.0, '826', '840', date(2024, 1, 1))
+            currency.convert(10.0, '826', '840', date(2024, 1, 2))
+
+        self.assertEqual((first.value, second.value), (12.5, 25.0))
+        self.assertEqual(session.return_value.post.call_count, 2)
+
+    def test_rate_without_a_date_is_cached_for_today(self):
+        self.assertEqual(currency.rate_key('826', '840', None), ('826', '840', date.today().isoformat()))
+
+        with self.converter() as session:
+            currency.convert(10.0, '826', '840', None)
+            currency.convert(10.0, '826', '840', date.today().isoformat())
+
+        self.assertEqual(session.return_value.post.call_count, 1)
@@ -0,0 +1,50 @@
+import asyncio
+from unittest import mock
+
+from django.conf import settings
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from api.database import REPLICA, ReplicaRouter, read_only
+from api.models import Transaction
+
+# The router only checks a replica is configured, so the primary's settings are used for it
+WITH_REPLICA = {REPLICA: settings.DATABASES['default']}
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    router = ReplicaRouter()
+
+    def read_in_view(self):
+        return read_only(lambda request: self.router.db_for_read(Transaction))(None)
+
+    @mock.patch.dict(settings.DATABASES, WITH_REPLICA)
+    def test_only_reads_of_read_only_views_go_to_the_replica(self):
+        self.assertIsNone(self.router.db_for_read(Transaction))
+        self.assertEqual(self.read_in_view(), REPLICA)
+        self.assertIsNone(self.router.db_for_read(Transaction))
+
+        self.assertEqual(read_only(lambda request: self.router.db_for_write(Transaction))(None), 'default')
+
+    @mock.patch.dict(settings.DATABASES, WITH_REPLICA)
+    def test_async_views_are_routed_too(self):
+        @read_only
+        async def view(request):
+            return self.router.db_for_read(Transaction)
+
+        self.assertEqual(asyncio.run(view(None)), REPLICA)
+        self.assertIsNone(self.router.db_for_read(Transaction))
+
+    def test_reads_stay_on_the_primary_without_a_replica(self):
+        self.assertIsNone(self.read_in_view())
+
+    def test_replica_is_never_migrated(self):
+        self.assertFalse(self.router.allow_migrate(REPLICA, 'api'))
+        self.assertTrue(self.router.allow_migrate('default', 'api'))
+
+
+class ConnectionTests(TestCase):
+    def test_pragmas_are_set_on_new_connections(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
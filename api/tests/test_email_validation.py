@@ -0,0 +1,52 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from email_validator import EmailNotValidError, EmailUndeliverableError
+
+from api import caching
+from api.schemas import check_email
+
+
+class EmailValidationTests(SimpleTestCase):
+    def setUp(self):
+        caching._caches.clear()
+        self.addCleanup(caching._caches.clear)
+
+        patcher = mock.patch('email_validator.deliverability.validate_email_deliverability')
+        self.deliverability = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(EMAIL_VALIDATION={'MODE': 'syntax'})
+    def test_syntax_mode_makes_no_lookups(self):
+        self.assertEqual(check_email('jo@gmail.com'), 'jo@gmail.com')
+
+        with self.assertRaises(EmailNotValidError):
+            check_email('jo@')
+
+        self.deliverability.assert_not_called()
+
+    @override_settings(EMAIL_VALIDATION={'MODE': 'cached'})
+    def test_cached_mode_looks_up_each_domain_once(self):
+        check_email('jo@gmail.com')
+        check_email('sam@GMAIL.com')
+        check_email('jo@example.com')
+
+        self.assertEqual([call.args[0] for call in self.deliverability.call_args_list], ['gmail.com', 'example.com'])
+
+    @override_settings(EMAIL_VALIDATION={'MODE': 'cached'})
+    def test_cached_mode_remembers_undeliverable_domains(self):
+        self.deliverability.side_effect = EmailUndeliverableError("The domain name nowhere-at-all.com does not exist.")
+
+        for _ in range(2):
+            with self.assertRaisesMessage(EmailUndeliverableError, "nowhere-at-all.com does not exist"):
+                check_email('jo@nowhere-at-all.com')
+
+        self.assertEqual(self.deliverability.call_count, 1)
+
+    @override_settings(EMAIL_VALIDATION={'MODE': 'full'})
+    def test_full_mode_checks_every_time(self):
+        with mock.patch('email_validator.validate_email') as validate_email:
+            check_email('jo@gmail.com')
+            check_email('jo@gmail.com')
+
+        self.assertEqual(validate_email.call_args_list, [mock.call('jo@gmail.com')] * 2)
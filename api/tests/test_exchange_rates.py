@@ -0,0 +1,69 @@
+import io
+import json
+import os
+import tempfile
+from datetime import date
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from api.services import currency, rates
+from api.tests.base import APITestCase, upstream
+
+DAY = date(2024, 1, 1)
+
+
+class MatrixTests(SimpleTestCase):
+    def test_pairs_are_converted_through_the_base_currency(self):
+        matrix = rates.build_matrix([('826', '840', 1.25), ('826', '978', 1.15)], '826')
+
+        self.assertAlmostEqual(matrix[('840', '826')], 0.8)
+        self.assertAlmostEqual(matrix[('840', '978')], 0.92)
+        self.assertAlmostEqual(matrix[('978', '840')], 1.25 / 1.15)
+        self.assertNotIn(('840', '840'), matrix)
+
+    def test_stored_rates_are_used_over_triangulated_ones(self):
+        matrix = rates.build_matrix([('826', '840', 1.25), ('826', '978', 1.15), ('840', '978', 0.9)], '826')
+
+        self.assertEqual(matrix[('840', '978')], 0.9)
+
+
+class ImportTests(APITestCase):
+    def import_rates(self, *records):
+        handle, path = tempfile.mkstemp(suffix='.json')
+        self.addCleanup(os.remove, path)
+
+        with os.fdopen(handle, 'w') as rates_file:
+            json.dump([{'base': base, 'quote': quote, 'date': DAY.isoformat(), 'rate': rate}
+                       for base, quote, rate in records], rates_file)
+
+        call_command('import_exchange_rates', path, stdout=io.StringIO())
+
+    def test_conversions_use_the_imported_rates(self):
+        self.import_rates(('826', '840', 1.25), ('826', '978', 1.15))
+
+        with upstream() as session:
+            self.assertEqual(currency.convert(100.0, '840', '978', DAY).value, 92.0)
+
+        session.return_value.post.assert_not_called()
+
+    @mock.patch('api.services.rates.time.time', return_value=1000.0)
+    def test_workers_see_imports_once_they_next_check_the_version(self, now):
+        self.import_rates(('826', '840', 1.25))
+        self.assertEqual(rates.load_matrix(DAY)[('826', '840')], 1.25)
+
+        # Imported by another process, which can't reach this worker's cache
+        self.import_rates(('826', '840', 1.5))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(rates.load_matrix(DAY)[('826', '840')], 1.25)
+
+        now.return_value = 1006.0
+        self.assertEqual(rates.load_matrix(DAY)[('826', '840')], 1.5)
+
+        # An unchanged version only needs the one query to check it
+        now.return_value = 1012.0
+
+        with self.assertNumQueries(1):
+            self.assertEqual(rates.load_matrix(DAY)[('826', '840')], 1.5)
@@ -0,0 +1,48 @@
+import io
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from api.models import BankDetails, BusinessAccount, PaymentDetails, PersonalAccount, SettlementSummary, Transaction
+
+
+class GenerateDatasetTests(TestCase):
+    def generate(self, seed):
+        handle, corpus = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        self.addCleanup(os.remove, corpus)
+
+        call_command('generate_dataset', accounts=20, transactions=200, days=30, seed=seed, corpus=corpus,
+                     corpus_payments=20, corpus_refunds=5, stdout=io.StringIO())
+
+        with open(corpus) as lines:
+            requests = [json.loads(line) for line in lines]
+
+        # Transaction IDs aren't reused, so the rows are compared without them
+        data = {
+            'cards': list(PaymentDetails.objects.order_by('paymentId').values_list()),
+            'personal': list(PersonalAccount.objects.order_by('accountNumber').values_list()),
+            'businesses': list(BusinessAccount.objects.order_by('accountNumber').values_list()),
+            'transactions': list(Transaction.objects.order_by('id').values_list(
+                'payer', 'payee', 'amount', 'currency', 'date', 'transactionStatus')),
+            'payments': [request for request in requests if request['path'] == '/initiatePayment'],
+        }
+
+        refunded = [request['body']['TransactionUUID'] for request in requests if request['path'] == '/initiateRefund']
+        self.assertEqual(Transaction.objects.filter(id__in=refunded).count(), len(refunded))
+
+        for model in (SettlementSummary, Transaction, PersonalAccount, BusinessAccount, BankDetails, PaymentDetails):
+            model.objects.all().delete()
+
+        return data
+
+    def test_same_seed_gives_the_same_data(self):
+        first = self.generate(seed=7)
+
+        self.assertEqual(len(first['personal']), 20)
+        self.assertEqual(len(first['transactions']), 200)
+        self.assertEqual(self.generate(seed=7), first)
+        self.assertNotEqual(self.generate(seed=8)['transactions'], first['transactions'])
@@ -0,0 +1,49 @@
+import json
+from datetime import date, timedelta
+
+from api import ledger
+from api.models import ArchivedTransaction
+from api.tests.base import APITestCase
+
+
+class HistoryTests(APITestCase):
+    def history(self, **params):
+        response = self.client.get('/transactionHistory', params)
+
+        if not response.streaming:
+            return response.status_code, json.loads(response.content)
+
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        response.close()
+        return response.status_code, lines
+
+    def test_cursor_pages_through_the_hot_and_archive_tables_in_order(self):
+        today = date.today()
+        made = [self.make_transaction(today - timedelta(days=days)).id for days in (400, 300, 300, 200, 10, 10, 1)]
+
+        # Only the two oldest are archived, so the two transactions on the same day are in different tables
+        self.assertEqual(ledger.archive_batch(today, today - timedelta(days=250), batch_size=2), (2, made[1]))
+        self.assertEqual(ArchivedTransaction.objects.count(), 2)
+
+        seen = []
+        params = {'PayerAccount': '1', 'Limit': '2'}
+
+        while True:
+            status, lines = self.history(**params)
+            self.assertEqual(status, 200)
+            seen += [line['TransactionUUID'] for line in lines[:-1]]
+
+            if lines[-1]['NextCursor'] is None:
+                break
+
+            params['After'] = lines[-1]['NextCursor']
+
+        self.assertEqual(seen, made)
+
+    def test_out_of_range_ids_are_rejected(self):
+        too_large = str(2 ** 63)
+
+        self.assertEqual(self.history(PayerAccount=too_large)[1]['ErrorCode'], 104)
+        self.assertEqual(self.history(PayeeAccount='-1')[1]['ErrorCode'], 104)
+        self.assertEqual(self.history(PayerAccount='1', After='2024-01-01,' + too_large)[1]['ErrorCode'], 104)
+        self.assertEqual(self.history(PayerAccount=str(2 ** 63 - 1))[0], 200)
@@ -0,0 +1,45 @@
+from api import caching
+from api.idempotency import IdempotencyKey
+from api.models import Transaction
+from api.tests.base import APITestCase, UpstreamResponse, upstream
+
+
+class IdempotencyTests(APITestCase):
+    def test_replay_returns_the_stored_response_without_paying_again(self):
+        with upstream() as session:
+            first = self.post('/initiatePayment', self.payment(), HTTP_IDEMPOTENCY_KEY='key-1')
+            second = self.post('/initiatePayment', self.payment(), HTTP_IDEMPOTENCY_KEY='key-1')
+
+        self.assertEqual(first, (200, {'ErrorCode': None, 'Comment': "Payment Successfully Completed"}))
+        self.assertEqual(second, first)
+        self.assertEqual(session.return_value.post.call_count, 1)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_replay_is_also_answered_from_the_database(self):
+        with upstream():
+            first = self.post('/initiatePayment', self.payment(), HTTP_IDEMPOTENCY_KEY='key-1')
+
+        caching._caches.clear()
+
+        with upstream() as session:
+            self.assertEqual(self.post('/initiatePayment', self.payment(), HTTP_IDEMPOTENCY_KEY='key-1'), first)
+
+        session.return_value.post.assert_not_called()
+
+    def test_key_reused_for_a_different_request_is_a_conflict(self):
+        with upstream():
+            self.post('/initiatePayment', self.payment(), HTTP_IDEMPOTENCY_KEY='key-1')
+            status, body = self.post('/initiatePayment', self.payment(Amount=20.0), HTTP_IDEMPOTENCY_KEY='key-1')
+
+        self.assertEqual((status, body['ErrorCode']), (422, 111))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_retryable_errors_release_the_key(self):
+        with upstream(lambda url, data=None, **kwargs: UpstreamResponse(503)):
+            status, body = self.post('/initiatePayment', self.payment(), HTTP_IDEMPOTENCY_KEY='key-1')
+
+        self.assertEqual(body['ErrorCode'], 301)
+        self.assertFalse(IdempotencyKey.objects.filter(key='key-1').exists())
+
+        with upstream():
+            self.assertEqual(self.post('/initiatePayment', self.payment(), HTTP_IDEMPOTENCY_KEY='key-1')[0], 200)
@@ -0,0 +1,94 @@
+from datetime import date
+from unittest import mock
+
+from django.conf import settings
+from django.test import override_settings
+
+from api import known_accounts
+from api.cards import card_fingerprint
+from api.models import BankDetails, KnownAccountsVersion, PaymentDetails, PersonalAccount
+from api.tests.base import APITestCase, upstream
+
+
+@override_settings(KNOWN_ACCOUNTS=dict(settings.KNOWN_ACCOUNTS, ENABLED=True))
+class KnownAccountsTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+
+        # Built now, rather than in the background by the first payment
+        known_accounts.rebuild()
+        self.addCleanup(setattr, known_accounts, '_filters', None)
+        self.addCleanup(setattr, known_accounts, '_built_at', None)
+
+        # Rebuilds are made in the test's thread, as the test's database transaction can't be seen from another
+        thread = mock.Mock(Thread=lambda target, daemon: mock.Mock(start=known_accounts.rebuild))
+        patcher = mock.patch.object(known_accounts, 'threading', thread)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_card(self, card_number, account_number):
+        card = PaymentDetails(paymentId=account_number, cardNumber=card_number, securityCode='123',
+                              expiryDate=date(2030, 1, 1), cardFingerprint=card_fingerprint(card_number))
+        bank = BankDetails(accountNumber=account_number, sortCode='000000', accountName='Jo')
+
+        # Without post_save, as another worker (or bulk_create) would add it
+        PaymentDetails.objects.bulk_create([card])
+        BankDetails.objects.bulk_create([bank])
+        PersonalAccount.objects.bulk_create([PersonalAccount(
+            accountNumber=account_number, paymentDetails=PaymentDetails.objects.get(paymentId=account_number),
+            bankDetails=BankDetails.objects.get(accountNumber=account_number), email='jo@gmail.com', password='x',
+            phoneNumber='1', fullName='Jo Bloggs')])
+
+    def test_unknown_cards_are_turned_away_without_being_looked_up(self):
+        with upstream():
+            for card_number in ('9999888877776666', '9999888877776667', '9999888877776666'):
+                # Only the payee is looked up
+                with self.assertNumQueries(1):
+                    status, body = self.post('/initiatePayment', self.payment(CardNumber=card_number))
+
+                self.assertEqual(body['ErrorCode'], 106)
+
+    def test_unknown_payees_are_turned_away_without_being_looked_up(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.post('/initiatePayment', self.payment(PayeeBankAccNum='999'))[1]['ErrorCode'], 107)
+
+    def test_cards_added_by_other_processes_are_known_once_the_version_changes(self):
+        card = self.payment(CardNumber='1111222233334444')
+        self.add_card('1111222233334444', 7)
+
+        with upstream():
+            self.assertEqual(self.post('/initiatePayment', card)[1]['ErrorCode'], 106)
+
+            # As the other process does once its save is committed
+            known_accounts.accounts_changed()
+            self.assertEqual(self.post('/initiatePayment', card)[1]['ErrorCode'], 106)
+
+            # The version is checked once the interval is up, and the filters rebuilt for the next payment
+            known_accounts._checked_at -= settings.KNOWN_ACCOUNTS['VERSION_CHECK_INTERVAL'] + 1
+            known_accounts.get_filters()
+            self.assertEqual(self.post('/initiatePayment', card)[0], 200)
+
+    def test_saving_an_account_changes_the_version(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            PaymentDetails.objects.create(paymentId=2, cardNumber='9999888877776666', securityCode='456',
+                                          expiryDate=date(2030, 1, 1))
+
+        first = KnownAccountsVersion.objects.get().version
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BankDetails.objects.create(accountNumber=87654321, sortCode='332211', accountName='Stall')
+
+        self.assertNotEqual(KnownAccountsVersion.objects.get().version, first)
+
+        # Saved in this process, so already in its filters
+        self.assertIn(card_fingerprint('9999888877776666'), known_accounts.get_filters()['cards'])
+
+    def test_saving_an_account_forgets_cached_failures(self):
+        with upstream():
+            self.post('/initiatePayment', self.payment(CardHolderName='Sam Smith'))
+
+            with self.captureOnCommitCallbacks(execute=True):
+                PersonalAccount.objects.filter(pk=self.payer.pk).update(fullName='Sam Smith')
+                PersonalAccount.objects.get(pk=self.payer.pk).save()
+
+            self.assertEqual(self.post('/initiatePayment', self.payment(CardHolderName='Sam Smith'))[0], 200)
@@ -0,0 +1,58 @@
+import json
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from api import outbound
+from api.management.commands.load_test import percentile
+from api.stubs import StubServer, currency_response, pns_response
+
+
+class StubServerTests(SimpleTestCase):
+    def serve(self, respond, error_rate=0.0):
+        stub = StubServer(respond, error_rate=error_rate)
+        url = stub.start()
+        self.addCleanup(stub.stop)
+
+        services = {name: dict(service) for name, service in settings.OUTBOUND_SERVICES.items()}
+        services['pns']['URL'] = url
+
+        testing = override_settings(OUTBOUND_SERVICES=services)
+        testing.enable()
+        self.addCleanup(testing.disable)
+
+        # A failure of the stub mustn't leave the circuit open for the rest of the tests
+        outbound._breakers.clear()
+        self.addCleanup(outbound._breakers.clear)
+        return stub
+
+    def test_answers_over_http_and_counts_requests(self):
+        stub = self.serve(pns_response)
+        response = outbound.post('pns', data=json.dumps({'Amount': 1.0}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['Comment'], "Transaction Successful")
+        self.assertEqual((stub.requests, stub.errors), (1, 0))
+
+    def test_fails_the_share_of_requests_given(self):
+        stub = self.serve(pns_response, error_rate=1.0)
+
+        self.assertEqual(outbound.post('pns', data='{}').status_code, 500)
+        self.assertEqual((stub.requests, stub.errors), (1, 1))
+
+    def test_currency_stub_converts_with_its_rates(self):
+        body = json.dumps({'CurrencyFrom': '826', 'CurrencyTo': '840', 'Amount': 10.0})
+
+        self.assertEqual(currency_response(body), (200, {'ErrorCode': None, 'Comment': "Conversion Successful",
+                                                         'Amount': 12.5}))
+        self.assertEqual(currency_response('not json')[0], 400)
+
+
+class PercentileTests(SimpleTestCase):
+    def test_nearest_rank(self):
+        latencies = list(range(1, 101))
+
+        self.assertEqual(percentile(latencies, 50), 50)
+        self.assertEqual(percentile(latencies, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertIsNone(percentile([], 50))
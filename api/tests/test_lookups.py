@@ -0,0 +1,38 @@
+from datetime import date
+
+from api.functions import validate_payment_request
+from api.lookups import find_payee, find_payer
+from api.models import BankDetails, PaymentDetails, Transaction
+from api.tests.base import APITestCase, upstream
+
+
+class AccountLookupTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+
+        # A card without a personal account, and bank details without a business account
+        PaymentDetails.objects.create(paymentId=2, cardNumber='9999888877776666', securityCode='456',
+                                      expiryDate=date(2030, 1, 1))
+        BankDetails.objects.create(accountNumber=87654321, sortCode='332211', accountName='Stall')
+
+    def test_each_missing_record_has_its_own_error_code(self):
+        payments = [
+            (self.payment(CardNumber='1111222233334444'), 106),
+            (self.payment(PayeeBankAccNum='999'), 107),
+            (self.payment(CardNumber='9999888877776666', CVV='456'), 108),
+            (self.payment(PayeeBankAccNum='87654321', PayeeBankSortCode='33-22-11', RecipientName='Stall'), 109),
+        ]
+
+        with upstream() as session:
+            for payment, error_code in payments:
+                status, body = self.post('/initiatePayment', payment)
+                self.assertEqual((status, body['ErrorCode']), (400, error_code))
+
+        session.return_value.post.assert_not_called()
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_accounts_are_found_in_one_query_each(self):
+        payment = validate_payment_request(self.payment(), {})
+
+        with self.assertNumQueries(2):
+            self.assertEqual((find_payee(payment), find_payer(payment)), (self.payee, self.payer))
@@ -0,0 +1,65 @@
+import asyncio
+import gc
+import threading
+from unittest import mock
+
+from django.http import StreamingHttpResponse
+
+from api import metrics
+from api.tests.base import APITestCase
+
+
+class MetricsTests(APITestCase):
+    def total(self, line_start):
+        for line in metrics.render().splitlines():
+            if line.startswith(line_start):
+                return float(line.rsplit(' ', 1)[1])
+
+        return 0
+
+    def test_counters_of_ended_threads_are_kept(self):
+        labels = (('result', 'test'),)
+        line_start = 'api_email_domain_checks_total{result="test"}'
+        before = self.total(line_start)
+        threads = [threading.Thread(target=metrics.increment, args=('api_email_domain_checks_total', labels))
+                   for _ in range(5)]
+
+        for thread in threads:
+            thread.start()
+            thread.join()
+
+        del thread, threads
+        gc.collect()
+
+        self.assertEqual(self.total(line_start), before + 5)
+        self.assertFalse(metrics._ended)
+
+    def test_streamed_response_is_recorded_when_closed(self):
+        line_start = 'api_requests_total{route="transactionHistory",method="GET",status="200"}'
+        before = self.total(line_start)
+
+        response = self.client.get('/transactionHistory', {'PayerAccount': '1'})
+        self.assertEqual(self.total(line_start), before)
+
+        b''.join(response.streaming_content)
+        response.close()
+        response.close()
+        self.assertEqual(self.total(line_start), before + 1)
+
+    def test_async_streamed_response_is_recorded(self):
+        async def content():
+            yield b'a'
+            yield b'b'
+
+        async def read(response):
+            return b''.join([part async for part in response])
+
+        request = mock.Mock(method='GET', resolver_match=None)
+        response = StreamingHttpResponse(content())
+        before = self.total('api_requests_total{route="unmatched"')
+
+        metrics.finish(request, response, metrics.RequestStats(), 0)
+        self.assertEqual(asyncio.run(read(response)), b'ab')
+        response.close()
+
+        self.assertEqual(self.total('api_requests_total{route="unmatched"'), before + 1)
@@ -0,0 +1,81 @@
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase
+
+from api import outbound
+from api.outbound import CircuitBreaker, UpstreamUnavailable
+from api.tests.base import UpstreamResponse, upstream
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_failures_in_a_row(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        self.assertEqual(breaker.state, 'closed')
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        self.assertFalse(breaker.allow())
+
+    def test_lets_one_trial_through_after_the_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+
+        with mock.patch('api.outbound.time.monotonic', return_value=100.0) as monotonic:
+            breaker.record_failure()
+
+            monotonic.return_value = 130.0
+            self.assertEqual((breaker.allow(), breaker.allow(), breaker.state), (True, False, 'half-open'))
+
+            # A failed trial opens it again, for another timeout
+            breaker.record_failure()
+            self.assertFalse(breaker.allow())
+
+            monotonic.return_value = 160.0
+            self.assertTrue(breaker.allow())
+            breaker.record_success()
+
+        self.assertEqual(breaker.state, 'closed')
+
+
+@mock.patch('api.outbound.time.sleep')
+class PostTests(SimpleTestCase):
+    def setUp(self):
+        outbound._breakers.clear()
+        self.addCleanup(outbound._breakers.clear)
+
+    def responses(self, *statuses):
+        responses = iter([UpstreamResponse(status) for status in statuses])
+        return upstream(lambda url, data=None, **kwargs: next(responses))
+
+    def test_idempotent_calls_are_retried_on_server_errors(self, sleep):
+        with self.responses(502, 503, 200) as session:
+            self.assertEqual(outbound.post('currency', idempotent=True).status_code, 200)
+
+        self.assertEqual(session.return_value.post.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_other_calls_are_only_sent_once(self, sleep):
+        with self.responses(503, 200) as session:
+            self.assertEqual(outbound.post('pns').status_code, 503)
+
+        self.assertEqual(session.return_value.post.call_count, 1)
+
+    def test_unreachable_service_raises(self, sleep):
+        with upstream(mock.Mock(side_effect=requests.ConnectionError)):
+            with self.assertRaises(UpstreamUnavailable):
+                outbound.post('currency', idempotent=True)
+
+    def test_open_circuit_fails_without_calling(self, sleep):
+        breaker = outbound.get_breaker('pns')
+
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+
+        with upstream() as session:
+            with self.assertRaises(UpstreamUnavailable):
+                outbound.post('pns')
+
+        session.return_value.post.assert_not_called()
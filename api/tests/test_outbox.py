@@ -0,0 +1,88 @@
+from unittest import mock
+
+from django.conf import settings
+from django.test import override_settings
+from django.utils import timezone
+
+from api.cards import unseal
+from api.ledger import OUTBOX_FAILED, OUTBOX_QUEUED
+from api.models import PNSOutbox, SettlementSummary, Transaction
+from api.outbox import claim_batch, process_batch
+from api.tests.base import APITestCase, UpstreamResponse, upstream
+
+# Sends the payments one at a time, in the test's thread
+EXECUTOR = mock.Mock(map=map)
+
+
+class OutboxTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+
+        with upstream() as session:
+            self.status, self.body = self.post('/initiatePayment', self.payment(), HTTP_PREFER='respond-async')
+
+        session.return_value.post.assert_not_called()
+        self.transaction_id = self.body['TransactionUUID']
+
+    def process(self, respond=None):
+        with upstream(respond) as session:
+            counts = process_batch(EXECUTOR, 10)
+
+        return counts, session.return_value.post
+
+    def outbox(self):
+        return PNSOutbox.objects.get(transaction_id=self.transaction_id)
+
+    def transaction_status(self):
+        return Transaction.objects.get(id=self.transaction_id).transactionStatus
+
+    def test_payment_is_queued_with_its_card_details_encrypted(self):
+        self.assertEqual((self.status, self.transaction_status()), (202, "Pending"))
+
+        payload = self.outbox().payload
+        self.assertNotIn('1234', payload)
+        self.assertIn('"CVV":"123"', unseal(payload).replace(' ', ''))
+
+    def test_sent_payment_is_completed_and_removed(self):
+        counts, pns_post = self.process()
+
+        self.assertEqual(counts, (1, 0, 0))
+        self.assertEqual(pns_post.call_args.kwargs['data']['CardNumber'], '1234-5678-1234-5678')
+        self.assertEqual(self.transaction_status(), "Completed")
+        self.assertFalse(PNSOutbox.objects.exists())
+        self.assertEqual(SettlementSummary.objects.values_list('paymentCount', flat=True).get(), 1)
+
+    def test_server_errors_are_retried_later(self):
+        self.assertEqual(self.process(lambda url, data=None, **kwargs: UpstreamResponse(503))[0], (0, 1, 0))
+
+        outbox = self.outbox()
+        self.assertEqual((outbox.status, outbox.attempts, outbox.claimToken), (OUTBOX_QUEUED, 1, None))
+        self.assertGreater(outbox.nextAttemptAt, timezone.now())
+        self.assertEqual(claim_batch(10), (None, []))
+
+    @override_settings(PNS_OUTBOX=dict(settings.PNS_OUTBOX, MAX_ATTEMPTS=1))
+    def test_payment_fails_when_it_runs_out_of_attempts(self):
+        self.assertEqual(self.process(lambda url, data=None, **kwargs: UpstreamResponse(503))[0], (0, 0, 1))
+        self.assertEqual(self.transaction_status(), "Failed")
+
+    def test_rejected_payment_fails_and_its_card_details_are_removed(self):
+        declined = UpstreamResponse(400, {'Comment': "Declined"})
+        self.assertEqual(self.process(lambda url, data=None, **kwargs: declined)[0], (0, 0, 1))
+
+        outbox = self.outbox()
+        self.assertEqual((outbox.status, outbox.payload), (OUTBOX_FAILED, ""))
+        self.assertTrue(outbox.lastError.endswith("Declined"))
+        self.assertEqual(self.transaction_status(), "Failed")
+
+    def test_payment_is_only_claimed_by_one_worker(self):
+        token, claimed = claim_batch(10)
+
+        self.assertEqual([outbox_id for outbox_id, payload, attempts in claimed], [self.outbox().id])
+        self.assertEqual(claim_batch(10), (None, []))
+
+    def test_changed_payload_fails_without_being_sent(self):
+        PNSOutbox.objects.update(payload=self.outbox().payload[:-4] + 'AAAA')
+        counts, pns_post = self.process()
+
+        self.assertEqual(counts, (0, 0, 1))
+        pns_post.assert_not_called()
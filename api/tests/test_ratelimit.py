@@ -0,0 +1,67 @@
+from unittest import mock
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from api import ratelimit
+from api.idempotency import IdempotencyKey
+from api.models import Transaction
+from api.tests.base import APITestCase, upstream
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_bucket_refills_at_its_rate_up_to_its_burst(self):
+        limit = ratelimit.per_second(2, burst=3)
+
+        self.assertEqual(ratelimit.take_token(0, 0, limit, 0), (0, 0.5))
+        self.assertEqual(ratelimit.take_token(0, 0, limit, 1), (1, 0))
+        self.assertEqual(ratelimit.take_token(0, 0, limit, 100), (2, 0))
+
+    def test_local_buckets_turn_away_requests_once_empty(self):
+        buckets = ratelimit.LocalBuckets(max_keys=10)
+        limit = ratelimit.per_second(1, burst=2)
+
+        with mock.patch('api.ratelimit.time.monotonic', return_value=100.0) as monotonic:
+            self.assertEqual([buckets.take('key', limit) for _ in range(3)], [0, 0, 1.0])
+
+            monotonic.return_value = 101.5
+            self.assertEqual(buckets.take('key', limit), 0)
+
+
+@override_settings(RATE_LIMIT=dict(settings.RATE_LIMIT, ENABLED=True))
+class RateLimitTests(APITestCase):
+    def test_only_the_batch_payments_of_a_limited_card_are_turned_away(self):
+        with upstream():
+            status, body = self.post('/initiateBatchPayment', [self.payment()] * 7)
+
+            # The card's bucket held 5 tokens, and it's shared with the single payment route
+            self.assertEqual(status, 200)
+            self.assertEqual([result['ErrorCode'] for result in body['Results']], [None] * 5 + [112] * 2)
+            self.assertEqual(self.post('/initiatePayment', self.payment())[1]['ErrorCode'], 112)
+
+        self.assertEqual(Transaction.objects.count(), 5)
+
+    def test_batches_take_one_ip_token_each(self):
+        with upstream(), mock.patch('api.ratelimit.time.monotonic', return_value=100.0):
+            statuses = [self.post('/initiateBatchPayment', [self.payment(Amount=-1.0)] * 20)[0] for _ in range(11)]
+
+        self.assertEqual(statuses, [200] * 10 + [429])
+
+    def test_cancellations_are_limited(self):
+        with mock.patch('api.ratelimit.time.monotonic', return_value=100.0):
+            codes = [self.post('/initiateCancellation', {'TransactionUUID': 99})[1]['ErrorCode'] for _ in range(51)]
+
+        self.assertEqual(codes[-2:], [402, 112])
+
+    def test_replays_do_not_take_tokens_and_limited_requests_can_be_retried(self):
+        with upstream():
+            codes = [self.post('/initiatePayment', self.payment(), HTTP_IDEMPOTENCY_KEY='same')[1]['ErrorCode']
+                     for _ in range(8)]
+            codes += [self.post('/initiatePayment', self.payment(), HTTP_IDEMPOTENCY_KEY='key-%d' % number)[1]
+                      ['ErrorCode'] for number in range(5)]
+
+            self.assertEqual(codes, [None] * 12 + [112])
+            self.assertFalse(IdempotencyKey.objects.filter(key='key-4').exists())
+
+            ratelimit._backend = None
+            self.assertEqual(self.post('/initiatePayment', self.payment(), HTTP_IDEMPOTENCY_KEY='key-4')[0], 200)
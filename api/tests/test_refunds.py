@@ -0,0 +1,47 @@
+from datetime import date
+from unittest import mock
+
+from api.models import Transaction
+from api.tests.base import APITestCase, UpstreamResponse, upstream
+
+
+class RefundTests(APITestCase):
+    def test_only_one_of_two_racing_refunds_is_sent(self):
+        transaction = self.make_transaction(date.today())
+        raced = []
+
+        # Another refund, and a cancellation, arrive whilst the PNS is handling the first refund
+        def respond(url, data=None, **kwargs):
+            if not raced:
+                raced.append(self.refund(transaction.id, 1.0))
+                raced.append(self.post('/initiateCancellation', {'TransactionUUID': transaction.id}))
+
+            return UpstreamResponse()
+
+        with upstream(respond) as session:
+            self.assertEqual(self.refund(transaction.id)[0], 200)
+
+        self.assertEqual(session.return_value.post.call_count, 1)
+        self.assertEqual([body['ErrorCode'] for status, body in raced], [404, 404])
+        self.assertEqual(Transaction.objects.get(id=transaction.id).transactionStatus, "Refunded")
+        self.assertEqual(Transaction.objects.filter(transactionStatus="Refund Transaction").count(), 1)
+
+    def test_refund_the_pns_rejects_can_be_tried_again(self):
+        transaction = self.make_transaction(date.today())
+
+        with upstream(lambda url, data=None, **kwargs: UpstreamResponse(400, {'Comment': "Declined"})):
+            self.assertEqual(self.refund(transaction.id)[1]['ErrorCode'], 301)
+
+        self.assertEqual(Transaction.objects.get(id=transaction.id).transactionStatus, "Completed")
+
+        with upstream():
+            self.assertEqual(self.refund(transaction.id)[0], 200)
+
+    def test_async_refund_is_claimed_too(self):
+        transaction = self.make_transaction(date.today())
+
+        with mock.patch('api.services.pns.send_refund_async', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.refund(transaction.id, path='/initiateRefundAsync')
+
+        self.assertEqual(Transaction.objects.get(id=transaction.id).transactionStatus, "Completed")
@@ -0,0 +1,59 @@
+from datetime import date
+from functools import partial
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from email_validator import validate_email
+
+from api.management.commands import bench_validation
+from api.management.commands.bench_validation import VALID_PAYMENT, VALID_REFUND, legacy_payment, legacy_refund
+from api.schemas import PAYMENT_SCHEMA, REFUND_SCHEMA, parse_date
+
+
+@override_settings(EMAIL_VALIDATION={'MODE': 'syntax'})
+class SchemaTests(SimpleTestCase):
+    def setUp(self):
+        # The old payment checks looked up the email's domain, which isn't wanted here
+        patcher = mock.patch.object(bench_validation, 'validate_email',
+                                    partial(validate_email, check_deliverability=False))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertSameAsBefore(self, legacy, schema, body):
+        values, error = schema.validate(body)
+        before = legacy(body)
+
+        if isinstance(before, tuple):
+            self.assertEqual(error, before)
+        else:
+            self.assertIsNone(error)
+            self.assertEqual({name: values[name] for name in before}, before)
+
+    def test_payments_get_the_same_errors_as_before(self):
+        bodies = [{}, {'CardNumber': '1234'}, {'CardNumber': 5}, {'PayerCurrencyCode': None},
+                  {'PayeeCurrencyCode': 'ABC'}, {'CVV': None}, {'PayeeBankAccNum': 'x'}, {'PayeeBankSortCode': None},
+                  {'PayeeBankSortCode': '1'}, {'Amount': 5}, {'Amount': 0.0}, {'Expiry': None}, {'Email': 'bad'},
+                  {'Expiry': '2024-02-30'}, {'Expiry': '2000-01-01'}, {'RecipientName': None}]
+
+        for changes in bodies:
+            with self.subTest(changes):
+                self.assertSameAsBefore(legacy_payment, PAYMENT_SCHEMA, dict(VALID_PAYMENT, **changes))
+
+    def test_refunds_get_the_same_errors_as_before(self):
+        bodies = [{}, {'Amount': None}, {'TransactionUUID': -1}, {'TransactionUUID': '1'}, {'Amount': 0.0},
+                  {'CurrencyCode': '8260'}]
+
+        for changes in bodies:
+            with self.subTest(changes):
+                self.assertSameAsBefore(legacy_refund, REFUND_SCHEMA, dict(VALID_REFUND, **changes))
+
+    def test_body_must_be_an_object(self):
+        self.assertEqual(REFUND_SCHEMA.validate([VALID_REFUND])[1][0], 103)
+
+    def test_dates_are_parsed_as_strptime_would(self):
+        self.assertEqual(parse_date('2024-02-29'), date(2024, 2, 29))
+        self.assertEqual(parse_date('2024-2-9'), date(2024, 2, 9))
+
+        for value in ('2023-02-29', '2024-02-29\n', '24-02-29', '2024-13-01'):
+            with self.subTest(value), self.assertRaises(ValueError):
+                parse_date(value)
@@ -0,0 +1,52 @@
+from unittest import mock
+
+import requests
+
+from api import outbound
+from api.services import pns
+from api.tests.base import APITestCase, UpstreamResponse, upstream
+
+
+class PNSServiceTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        outbound._breakers.clear()
+        self.addCleanup(outbound._breakers.clear)
+
+    def test_payment_is_changed_into_the_body_the_pns_expects(self):
+        payment = self.payment()
+
+        with upstream() as session:
+            self.assertTrue(pns.send_payment(payment).ok)
+
+        sent = session.return_value.post.call_args.kwargs['data']
+        self.assertEqual((sent['HolderName'], sent['CurrencyCode'], sent['Sort-Code']),
+                         ('Jo Bloggs', '826', '11-22-33'))
+        self.assertNotIn('Email', sent)
+        self.assertEqual(payment, self.payment())
+
+    def test_failures_keep_the_pns_comment(self):
+        with upstream(lambda url, data=None, **kwargs: UpstreamResponse(400, {'Comment': "Declined"})):
+            declined = pns.send_refund(b'{}')
+
+        with upstream(lambda url, data=None, **kwargs: UpstreamResponse(503)):
+            failed = pns.send_refund(b'{}')
+
+        self.assertEqual((declined.error_code, declined.retryable), (301, False))
+        self.assertTrue(declined.comment.endswith("Declined"))
+        self.assertEqual((failed.error_code, failed.retryable), (301, True))
+
+    @mock.patch('api.outbound.time.sleep')
+    def test_unreachable_pns_is_a_retryable_failure(self, sleep):
+        with upstream(mock.Mock(side_effect=requests.ConnectionError)):
+            result = pns.send_refund(b'{}')
+
+        self.assertEqual((result.error_code, result.retryable), (301, True))
+
+    def test_endpoint_wraps_the_service(self):
+        with upstream(lambda url, data=None, **kwargs: UpstreamResponse(400, {'Comment': "Declined"})):
+            status, body = self.post('/requestTransactionPNS', self.payment())
+
+        self.assertEqual(status, 400)
+        self.assertEqual(body, {'ErrorCode': 301,
+                                'Comment': "An error occurred with contacting the Payment Network Service. Declined"})
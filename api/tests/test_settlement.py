@@ -0,0 +1,51 @@
+import json
+from datetime import date
+
+from api import ledger
+from api.models import SettlementSummary, Transaction
+from api.tests.base import APITestCase, upstream
+
+
+class SettlementTests(APITestCase):
+    def summary(self):
+        return SettlementSummary.objects.values_list('paymentCount', 'paymentTotal', 'refundCount', 'refundTotal').get()
+
+    def test_totals_are_added_to_in_the_database(self):
+        today = date.today()
+        ledger.add_to_settlement(self.payee.accountNumber, '826', today, payment_count=1, payment_total=10.0)
+
+        # Another request's totals, added after this one read the row, aren't lost
+        SettlementSummary.objects.update(paymentCount=5, paymentTotal=50.0)
+        ledger.add_to_settlement(self.payee.accountNumber, '826', today, payment_count=1, payment_total=2.5,
+                                 refund_count=1, refund_total=1.0)
+
+        self.assertEqual(self.summary(), (6, 52.5, 1, 1.0))
+
+    def test_payments_refunds_and_cancellations_update_the_totals(self):
+        with upstream():
+            self.post('/initiatePayment', self.payment())
+            self.post('/initiatePayment', self.payment(Amount=20.0))
+
+        first, second = Transaction.objects.order_by('id').values_list('id', flat=True)
+
+        with upstream():
+            self.refund(first, 4.0)
+
+        self.post('/initiateCancellation', {'TransactionUUID': second})
+
+        self.assertEqual(self.summary(), (1, 10.0, 1, 4.0))
+
+    def test_summary_is_read_for_the_payee(self):
+        with upstream():
+            self.post('/initiatePayment', self.payment())
+
+        response = self.client.get('/settlementSummary', {'PayeeAccount': str(self.payee.accountNumber)})
+        settlements = json.loads(response.content)['Settlements']
+
+        self.assertEqual([(day['Currency'], day['PaymentCount'], day['PaymentTotal']) for day in settlements],
+                         [('826', 1, 10.0)])
+
+    def test_out_of_range_accounts_are_rejected(self):
+        for account in (str(2 ** 63), '-1', '9' * 30):
+            response = self.client.get('/settlementSummary', {'PayeeAccount': account})
+            self.assertEqual((response.status_code, json.loads(response.content)['ErrorCode']), (400, 104))
@@ -0,0 +1,41 @@
+import json
+from datetime import date
+
+from api.tests.base import APITestCase
+
+
+class StatusTests(APITestCase):
+    def status(self, transaction_id, **headers):
+        return self.client.get('/transactionStatus', {'TransactionUUID': transaction_id}, **headers)
+
+    def test_unchanged_status_is_not_modified(self):
+        transaction = self.make_transaction(date.today())
+        first = self.status(transaction.id)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(json.loads(first.content)['TransactionStatus'], "Completed")
+
+        second = self.status(transaction.id, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_change_of_status_changes_the_etag(self):
+        transaction = self.make_transaction(date.today())
+        etag = self.status(transaction.id)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post('/initiateCancellation', {'TransactionUUID': transaction.id})
+
+        response = self.status(transaction.id, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(json.loads(response.content)['TransactionStatus'], "Cancelled")
+
+    def test_status_is_read_from_the_cache_after_the_first_lookup(self):
+        transaction = self.make_transaction(date.today())
+        self.status(transaction.id)
+
+        with self.assertNumQueries(0):
+            response = self.status(transaction.id)
+
+        self.assertEqual(json.loads(response.content)['TransactionStatus'], "Completed")
@@ -1,16 +1,29 @@
-import json
-import re
-from datetime import date, datetime
+from datetime import date
 
-import requests
+from django.conf import settings
 from django.db import DatabaseError
-from django.http import JsonResponse
-from email_validator import validate_email, EmailNotValidError
-
-from api.functions import check_valid_request, error_response, error_response_external
-from api.models import Transaction, PaymentDetails, BankDetails, BusinessAccount, PersonalAccount
-
-
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import parse_etags
+
+from api import caching, known_accounts, ledger, metrics, status_cache
+from api.database import read_only
+from api.codec import JsonResponse, dumps
+from api.functions import check_valid_request, error_response, service_response, validate_payment_request, \
+    validate_refund_request, validate_cancellation_request, check_transaction_open, respond_async
+from api.idempotency import idempotent
+from api.lookups import find_payee, find_payer, find_batch_accounts
+from api.ratelimit import BATCH_PAYMENT_LIMITS, CANCELLATION_LIMITS, PAYMENT_LIMITS, REFUND_LIMITS, rate_limited, \
+    take_payment_tokens
+from api.schemas import MAX_ID, THREE_DIGITS, parse_date
+from api.services import currency, pns
+from api.models import Transaction, ArchivedTransaction, PaymentDetails, BankDetails, BusinessAccount, \
+    PersonalAccount, SettlementSummary
+
+
+@idempotent
+@rate_limited(**PAYMENT_LIMITS)
 def initiate_payment(request):
     # The JSON default data of the response, stored in a dictionary
     response_data = {
@@ -18,12 +31,6 @@ def initiate_payment(request):
         'Comment': ""
     }
 
-    # Regex for checking the card, cvv and currency code values
-    card_regex = "^[0-9]{16}$"
-    three_digit_regex = "^[0-9]{3}$"
-    sort_code_regex = "^[0-9]{6}$"
-    account_number_regex = "^[0-9]{1,8}$"
-
     # A function which checks if the response is not empty and can be converted to JSON
     request_data = check_valid_request(request, response_data)
 
@@ -34,183 +41,221 @@ def initiate_payment(request):
 
     if request.method == 'POST':
 
-        # Get all the data from the request, the above is all the data we do additional checks on
-        card_number = request_data.get('CardNumber', None)
-        cvv = request_data.get('CVV', None)
-        payer_currency_code = request_data.get('PayerCurrencyCode', None)
-        payee_currency_code = request_data.get('PayeeCurrencyCode', None)
-        amount = request_data.get('Amount', None)
-        expiry = request_data.get('Expiry', None)
-        payee_account_number = request_data.get('PayeeBankAccNum', None)
-        payee_sort_code = request_data.get('PayeeBankSortCode', None)
-
-        # Compiling the regex strings
-        compiled_three_digit_regex = re.compile(three_digit_regex)
-        compiled_card_regex = re.compile(card_regex)
-        compiled_sort_code_regex = re.compile(sort_code_regex)
-        compiled_account_number_regex = re.compile(account_number_regex)
-
-        # Card Number cannot be none when trying to remove whitespaces or hyphens, so we need
-        # To throw this error before
-        if not isinstance(card_number, str):
-            return error_response(response_data, 102, "Error. Card number is not present.")
-
-        # Removes any whitespace or hyphens from a card number if it is present
-        card_number = re.sub('[^0-9a-zA-Z]+', '', card_number)
-
-        # Returns an error response if the card number doesn't comply to the regex
-        if not re.search(compiled_card_regex, card_number):
-            return error_response(response_data, 104, "Error. Card number is not in the correct format")
-
-        # Returns an error response if either currency code is not present
-        if not isinstance(payer_currency_code, str) or not isinstance(payee_currency_code, str):
-            return error_response(response_data, 102, "Error. A Currency code for the payer and payee need to be "
-                                                      "supplied")
-
-        # Returns an error response if either currency code doesn't comply to the regex
-        if not re.search(compiled_three_digit_regex, payer_currency_code) \
-                or not re.search(compiled_three_digit_regex, payee_currency_code):
-            return error_response(response_data, 104, "Error. One or more of the currency codes provided are not in "
-                                                      "the correct format")
-
-        # Returns an error response if the cvv wasn't included or doesn't comply to the regex
-        if not isinstance(cvv, str) or not re.search(compiled_three_digit_regex, cvv):
-            return error_response(response_data, 104, "Error. CVV is either not present or not in the correct "
-                                                      "format.")
-
-        # Returns an error response if the account number was not included or doesn't comply to the regex
-        if not isinstance(payee_account_number, str) \
-                or not re.search(compiled_account_number_regex, payee_account_number):
-            return error_response(response_data, 104, "Error. Account number is either not present or not in the "
-                                                      "correct format.")
-
-        # Sort code cannot be none when trying to remove whitespaces or hyphens, so we need
-        # To throw this error before
-        if not isinstance(payee_sort_code, str):
-            return error_response(response_data, 102, "Error. Payee Sort Code is not present.")
-
-        # Removes any whitespace or hyphens from a sort code if it is present
-        payee_sort_code = re.sub('[^0-9a-zA-Z]+', '', payee_sort_code)
-
-        # Returns an error response if the Sort code doesn't comply to the regex
-        if not re.search(compiled_sort_code_regex, payee_sort_code):
-            return error_response(response_data, 104, "Error. Sort Code is not in the correct format")
-
-        # Checks if the amount is a float and greater than 0
-        if not isinstance(amount, float) or amount <= 0:
-            return error_response(response_data, 104, "Error. Amount must be a float value larger than 0")
-
-        # Gets the rest of the details from the request
-
-        payer_name = request_data.get('CardHolderName', None)
-        address = request_data.get('CardHolderAddress', None)
-        email = request_data.get('Email', None)
-        payee_name = request_data.get('RecipientName', None)
-
-        # Checks if all the other values are in the request ( We've already checked this for the previous
-        # Values)
-        if all(value is not None for value in
-               [expiry, payer_name, address, email, payee_account_number, payee_sort_code, payee_name]):
-
-            try:
-                # Checks if the email is valid using the email-validator library
-                validate_email(email)
-
-                # Attempts to change the expiry to a date format
-                expiry = datetime.strptime(expiry, '%Y-%m-%d').date()
-                curr_date = date.today()
-
-                # Checks if the expiry date is either today or has already passed
-                if expiry <= curr_date:
-                    return error_response(response_data, 104, "Error. Card has expired.")
-
-                # check if the payee account exists, both in the bank details and the business account tables
-                bank_details = BankDetails.objects.get(accountNumber=payee_account_number,
-                                                       sortCode=payee_sort_code,
-                                                       accountName=payee_name)
-
-                payee_object = BusinessAccount.objects.get(accountNumber=bank_details.accountNumber)
-
-                # Check if the both the card details exist in the db, along with the personal account with those
-                # Details
-                payment_id = PaymentDetails.objects.get(cardNumber=card_number, securityCode=cvv,
-                                                        expiryDate=expiry).paymentId
-
-                payer_object = PersonalAccount.objects.get(paymentDetails=payment_id, fullName=payer_name, email=email)
-
-            # If the email is not valid
-            except EmailNotValidError:
-                return error_response(response_data, 104, "Error. Email provided is not in the correct format.")
-
-            # If an error occurs whilst trying to convert the expiry from a string to a date
-            except ValueError:
-                return error_response(response_data, 104, "Error. Date is not valid. (Needs to be a real date in "
-                                                          "YYYY-MM-DD Format)")
-
-            # If the bank details provided do not exist
-            except BankDetails.DoesNotExist:
-                return error_response(response_data, 107)
-
-            # If the bank details provided exist, but there's not a business account with the same account number
-            except BusinessAccount.DoesNotExist:
-                return error_response(response_data, 109)
+        # Checks every field of the payment, returning the cleaned values
+        payment = validate_payment_request(request_data, response_data)
 
-            # If the payment details provided don't exist in the db
-            except PaymentDetails.DoesNotExist:
-                return error_response(response_data, 106)
-
-            # If the payment details exist, but there is not an account linked with those payment details
-            except PersonalAccount.DoesNotExist:
-                return error_response(response_data, 108)
-
-            # If the connection to the database fails
-            except DatabaseError:
-                return error_response(response_data, 401)
+        if isinstance(payment, JsonResponse):
+            return payment  # Will be a JSON response of the error
 
-            # If both currency codes are not the same then we need to convert the amount
-            if payer_currency_code != payee_currency_code:
+        amount = payment['amount']
+        curr_date = date.today()
 
-                # Creates the request body
-                currency_converter_request = {
-                    'CurrencyFrom': payer_currency_code,
-                    'CurrencyTo': payee_currency_code,
-                    'Date': str(curr_date),
-                    'Amount': amount
-                }
-                json_object = json.dumps(currency_converter_request)
-                # Calls the function to get the new currency value (converts the request to JSON too)
-                currency_converter_response = convert_currency(json_object)
+        try:
+            # check if the payee account exists, both in the bank details and the business account tables
+            payee_object = find_payee(payment)
 
-                # If everything is valid, then set the amount to the new value
-                if currency_converter_response.status_code == 200:
-                    request['amount'] = currency_converter_response["Amount"]
-                    amount = request['amount']
+            # Check if the both the card details exist in the db, along with the personal account with those
+            # Details
+            payer_object = find_payer(payment)
 
-                else:
-                    return currency_converter_response
+        # If the bank details provided do not exist
+        except BankDetails.DoesNotExist:
+            return error_response(response_data, 107)
 
-            # Create a new transaction object, will only save once the payment has gone through
+        # If the bank details provided exist, but there's not a business account with the same account number
+        except BusinessAccount.DoesNotExist:
+            return error_response(response_data, 109)
 
-            new_transaction = Transaction(payer=payer_object, payee=payee_object, amount=amount,
-                                          currency=payee_currency_code, date=curr_date, transactionStatus="Completed")
+        # If the payment details provided don't exist in the db
+        except PaymentDetails.DoesNotExist:
+            return error_response(response_data, 106)
 
-            pns_response = request_transaction_pns(request)
+        # If the payment details exist, but there is not an account linked with those payment details
+        except PersonalAccount.DoesNotExist:
+            return error_response(response_data, 108)
 
-            if pns_response.status_code != 200:
-                return pns_response
+        # If the connection to the database fails
+        except DatabaseError:
+            return error_response(response_data, 401)
 
-            # Save the transaction now that it has been completed
-            new_transaction.save()
-            response_data["Comment"] = "Payment Successfully Completed"
+        # If both currency codes are not the same then we need to convert the amount
+        if payment['payer_currency_code'] != payment['payee_currency_code']:
 
-            return JsonResponse(response_data, status=200)
-        else:
-            return error_response(response_data, 102)
+            # Gets the new currency value
+            conversion = currency.convert(amount, payment['payer_currency_code'], payment['payee_currency_code'],
+                                          curr_date)
+
+            # If everything is valid, then set the amount to the new value
+            if conversion.ok:
+                amount = conversion.value
+
+            else:
+                return error_response(response_data, conversion.error_code, conversion.comment)
+
+        # Create a new transaction object, will only save once the payment has gone through
+
+        new_transaction = Transaction(payer=payer_object, payee=payee_object, amount=amount,
+                                      currency=payment['payee_currency_code'], date=curr_date,
+                                      transactionStatus="Completed")
+
+        # If the client asked for it, the payment is saved as pending and sent to the PNS in the background by the
+        # run_pns_outbox worker, rather than the client waiting on the PNS. Its status can be checked with
+        # transactionStatus.
+        if respond_async(request):
+            new_transaction.transactionStatus = "Pending"
+            ledger.record_pending_payment(new_transaction, dumps(pns.pns_payment_data(request_data)).decode(),
+                                          timezone.now())
+
+            response_data["Comment"] = "Payment Accepted"
+            response_data["TransactionUUID"] = new_transaction.id
+            response = JsonResponse(response_data, status=202)
+            response['Location'] = '/transactionStatus?TransactionUUID=%d' % new_transaction.id
+            return response
+
+        pns_result = pns.send_payment(request_data)
+
+        if not pns_result.ok:
+            return error_response(response_data, pns_result.error_code, pns_result.comment)
+
+        # Save the transaction now that it has been completed, along with the settlement totals
+        ledger.record_payment(new_transaction)
+        response_data["Comment"] = "Payment Successfully Completed"
+
+        return JsonResponse(response_data, status=200)
 
     else:
         return error_response(response_data, 105)
 
 
+@rate_limited(**BATCH_PAYMENT_LIMITS)
+def initiate_batch_payment(request):
+    # The JSON default data of the response, stored in a dictionary. Each payment gets its own result in 'Results',
+    # in the same order as the payments were sent
+    response_data = {
+        'ErrorCode': None,
+        'Comment': "",
+        'Results': []
+    }
+
+    # A function which checks if the response is not empty and can be converted to JSON
+    request_data = check_valid_request(request, response_data)
+
+    if isinstance(request_data, JsonResponse):
+        return request_data  # Will be a JSON response of the error
+
+    if request.method != 'POST':
+        return error_response(response_data, 105)
+
+    # The body has to be a non-empty array of payment objects
+    if not isinstance(request_data, list):
+        return error_response(response_data, 103, "Error. The body of a batch payment must be an array of payments")
+
+    if len(request_data) == 0:
+        return error_response(response_data, 102, "Error. No payments were provided")
+
+    max_payments = settings.BATCH_PAYMENT['MAX_PAYMENTS']
+
+    if len(request_data) > max_payments:
+        return error_response(response_data, 104, "Error. A batch can have at most %d payments" % max_payments)
+
+    # The result for every payment, and the cleaned values of the ones which passed validation
+    results = []
+    payments = {}
+
+    for index, item in enumerate(request_data):
+        item_response = {
+            'ErrorCode': None,
+            'Comment': ""
+        }
+        results.append(item_response)
+
+        if not isinstance(item, dict):
+            error_response(item_response, 103, "Error. Each payment must be a JSON object")
+            continue
+
+        # Uses the same checks as a single payment, the error (if any) is written into item_response
+        payment = validate_payment_request(item, item_response)
+
+        if isinstance(payment, JsonResponse):
+            continue
+
+        # Each payment takes a token from its own card and payee, so only the payments of one over its limit are
+        # turned away
+        wait = take_payment_tokens(payment)
+
+        if wait:
+            error_response(item_response, 112, "Error. Too many payments with this card or to this payee account, try "
+                                               "again after %d seconds" % (int(wait) + 1))
+            continue
+
+        payments[index] = payment
+
+    try:
+        # Looks up every account and card in the batch at once, rather than one payment at a time
+        accounts = find_batch_accounts(payments)
+
+    # If the connection to the database fails, none of the payments can go ahead
+    except DatabaseError:
+        accounts = {index: 401 for index in payments}
+
+    curr_date = date.today()
+    new_transactions = []
+    completed = []
+
+    for index, payment in payments.items():
+        item_response = results[index]
+
+        # Either the payee and payer of the payment, or the error code for the one that couldn't be found
+        if isinstance(accounts[index], int):
+            error_response(item_response, accounts[index])
+            continue
+
+        payee_object, payer_object = accounts[index]
+        amount = payment['amount']
+
+        # If both currency codes are not the same then we need to convert the amount
+        if payment['payer_currency_code'] != payment['payee_currency_code']:
+            conversion = currency.convert(amount, payment['payer_currency_code'], payment['payee_currency_code'],
+                                          curr_date)
+
+            # Passes on the currency converter's error code and comment for this payment
+            if not conversion.ok:
+                error_response(item_response, conversion.error_code, conversion.comment)
+                continue
+
+            amount = conversion.value
+
+        # Forwards the payment to the PNS
+        pns_result = pns.send_payment(request_data[index])
+
+        if not pns_result.ok:
+            error_response(item_response, pns_result.error_code, pns_result.comment)
+            continue
+
+        new_transactions.append(Transaction(payer=payer_object, payee=payee_object, amount=amount,
+                                            currency=payment['payee_currency_code'], date=curr_date,
+                                            transactionStatus="Completed"))
+        completed.append(item_response)
+
+    # Saves every completed payment in one go
+    try:
+        ledger.record_payments(new_transactions)
+
+        for item_response in completed:
+            item_response['ErrorCode'] = None
+            item_response['Comment'] = "Payment Successfully Completed"
+
+    except DatabaseError:
+        for item_response in completed:
+            error_response(item_response, 401)
+
+    response_data['Results'] = results
+    response_data['Comment'] = "Batch Processed"
+    return JsonResponse(response_data, status=200)
+
+
+@idempotent
+@rate_limited(**REFUND_LIMITS)
 def initiate_refund(request):
     # The JSON default data of the response, stored in a dictionary
     response_data = {
@@ -218,10 +263,6 @@ def initiate_refund(request):
         'Comment': ""
     }
 
-    # The regex to check the currency code is valid
-    currency_code_regex = "^[0-9]{3}$"
-    compiled_currency_code_regex = re.compile(currency_code_regex)
-
     # A function which checks if the response is not empty and can be converted to JSON
     request_data = check_valid_request(request, response_data)
 
@@ -232,94 +273,79 @@ def initiate_refund(request):
 
     if request.method == 'POST':
 
-        # Gets the values from the request body
-        transaction_id = request_data.get('TransactionUUID', None)
-        amount = request_data.get('Amount', None)  # The amount they're being refunded
-        currency_code = request_data.get('CurrencyCode', None)
+        # Checks every field of the refund, returning the cleaned values
+        refund = validate_refund_request(request_data, response_data)
+
+        if isinstance(refund, JsonResponse):
+            return refund  # Will be a JSON response of the error
+
+        transaction_id = refund['transaction_id']
+        amount = refund['amount']
+        currency_code = refund['currency_code']
 
-        # Throws an error if any values are not present
-        if any(value is None for value in (transaction_id, amount, currency_code)):
-            return error_response(response_data, 102)
+        # transaction will already exist from initial payment. Only the fields needed are read.
+        curr_transaction = ledger.get_transaction(transaction_id)
 
-        # Throws a value error if they cannot be converted to the correct types
+        # Will produce the appropriate error code if we can't find the transaction
+        if curr_transaction is None:
+            return error_response(response_data, 402)
 
-        if not isinstance(transaction_id, int) or transaction_id < 0:
-            # The error if the transaction ID was not of uint
-            return error_response(response_data, 103, "Error. Transaction ID needs to be a positive integer")
+        # Return an error if the transaction is already refunded or cancelled, or is itself a refund
+        transaction_error = check_transaction_open(curr_transaction['transactionStatus'], response_data)
 
-        if not isinstance(amount, float) or amount <= 0:
-            return error_response(response_data, 104, "Error. Amount must be a float value larger than 0")
+        if transaction_error is not None:
+            return transaction_error
 
-        if not re.search(compiled_currency_code_regex, currency_code):
-            return error_response(response_data, 104, "Error. The currency code provided is not in the correct format")
+        # If the currency that we want a refund in is not the same that was carried out for the transaction
+        if curr_transaction['currency'] != currency_code:
+            # Gets the new currency value
+            conversion = currency.convert(amount, currency_code, curr_transaction['currency'], date.today())
+
+            # If everything is valid, then set the amount to the new value
+            if conversion.ok:
+                amount = conversion.value
 
-        try:
-            # transaction will already exist from initial payment
-            curr_transaction = Transaction.objects.get(id=transaction_id)
-
-            if curr_transaction.transactionStatus == "Refunded" or curr_transaction.transactionStatus == "Cancelled":
-                return error_response(response_data, 404)
-
-            # When refunding, we create a new transaction detailing how much was refunded. These have a status of
-            # 'Refund Transaction'. We give a more specific error for this.
-            if curr_transaction.transactionStatus == "Refund Transaction":
-                return error_response(response_data, 404,
-                                      "Error. The transaction ID provided is for a refund transaction")
-
-            # If the currency that we want a refund in is not the same that was carried out for the transaction
-            if curr_transaction.currency != currency_code:
-                # Creates the request body
-                currency_converter_request = {
-                    'CurrencyFrom': currency_code,
-                    'CurrencyTo': curr_transaction.currency,
-                    'Date': date.today(),
-                    'Amount': amount
-                }
-
-                # Calls the function to get the new currency value
-                currency_converter_response = convert_currency(currency_converter_request)
-
-                # If everything is valid, then set the amount to the new value
-                if currency_converter_response.status_code == 200:
-                    amount = currency_converter_response["Amount"]
-
-                else:
-                    # Returns the valid error code and message
-                    return currency_converter_response
-
-            if amount > curr_transaction.amount:
-                return error_response(response_data, 104, "Error. The amount requested was greater than the total fee "
-                                                          "of your booking.")
-
-            # Sends a request to the PNS
-            pns_response = request_refund_pns(request)
-
-            # If the transaction was ok, then set the status to refunded, and create a new transaction detailing how
-            # much was refunded (which is in a negative value).
-            if pns_response.status_code == 200:
-                new_transaction = Transaction(payer=curr_transaction.payer, payee=curr_transaction.payee,
-                                              amount=-amount,
-                                              currency=curr_transaction.currency, date=curr_transaction.date,
-                                              transactionStatus="Refund Transaction")
-
-                curr_transaction.transactionStatus = "Refunded"
-                curr_transaction.save()
-                new_transaction.save()
-                response_data['Comment'] = "Refund Successful"  # change to the proper error code
-                return JsonResponse(response_data, status=200)
             else:
-                # Else it will pass along the error message from the PNS along with our relevant error code
-                return pns_response
+                # Returns the valid error code and message
+                return error_response(response_data, conversion.error_code, conversion.comment)
 
-        # Will produce the appropriate error code if we can't find the transaction
-        except Transaction.DoesNotExist:
-            return error_response(response_data, 402)
+        if amount > curr_transaction['amount']:
+            return error_response(response_data, 104, "Error. The amount requested was greater than the total fee "
+                                                      "of your booking.")
+
+        # The transaction is claimed before the PNS is asked, so that if another request refunds or cancels it in the
+        # meantime, only one of them goes ahead
+        if not ledger.claim_refund(curr_transaction):
+            return ledger.transition_error(transaction_id, response_data)
+
+        # Sends a request to the PNS. The claim is given up if it can't be sent.
+        try:
+            pns_result = pns.send_refund(request.body)
+
+        except BaseException:
+            ledger.release_refund(curr_transaction)
+            raise
+
+        # If the transaction was ok, then set the status to refunded, and create a new transaction detailing how
+        # much was refunded (which is in a negative value)
+        if pns_result.ok:
+            if not ledger.refund_transaction(curr_transaction, amount):
+                return ledger.transition_error(transaction_id, response_data)
+
+            response_data['Comment'] = "Refund Successful"  # change to the proper error code
+            return JsonResponse(response_data, status=200)
+        else:
+            # Else the transaction can be refunded again, and it will pass along the error message from the PNS along
+            # with our relevant error code
+            ledger.release_refund(curr_transaction)
+            return error_response(response_data, pns_result.error_code, pns_result.comment)
 
     else:
         # If it isn't a POST request
         return error_response(response_data, 105)
 
 
+@rate_limited(**CANCELLATION_LIMITS)
 def initiate_cancellation(request):
     # The JSON default data of the response, stored in a dictionary
     response_data = {
@@ -338,41 +364,22 @@ def initiate_cancellation(request):
     # Checks if it is a POST method
     if request.method == 'POST':
 
-        transaction_id = request_data.get('TransactionUUID', None)
-
-        # Checks a TransactionUUID was provided
-        if transaction_id is None:
-            return error_response(response_data, 102, "Error. No transaction ID was provided")
-
-        # Checks the transaction ID is a positive integer
-        if not isinstance(transaction_id, int) or transaction_id < 0:
-            return error_response(response_data, 103, "Error. Transaction ID needs to be a positive integer")
+        # Checks a TransactionUUID was provided, and that it's a positive integer
+        cancellation = validate_cancellation_request(request_data, response_data)
 
-        try:
-            # Finding the transaction we want to cancel
-            cancel_transaction = Transaction.objects.get(id=transaction_id)
-
-            # Return an error if the transaction is already refunded or cancelled
-            if cancel_transaction.transactionStatus == "Refunded" or cancel_transaction.transactionStatus == "Cancelled":
-                return error_response(response_data, 404)
+        if isinstance(cancellation, JsonResponse):
+            return cancellation  # Will be a JSON response of the error
 
-            # When refunding, we create a new transaction detailing how much was refunded. These have a status of
-            # 'Refund Transaction'. We give a more specific error for this.
-            if cancel_transaction.transactionStatus == "Refund Transaction":
-                return error_response(response_data, 404,
-                                      "Error. The transaction ID provided is for a refund transaction")
+        transaction_id = cancellation['transaction_id']
 
-            # Updating and saving the transaction status
-            cancel_transaction.transactionStatus = "Cancelled"
-            cancel_transaction.save()
+        # Updating the transaction status, if it exists and is still open
+        if not ledger.cancel_transaction(transaction_id):
+            # Works out whether the transaction doesn't exist, or has already been closed
+            return ledger.transition_error(transaction_id, response_data)
 
-            # Updates response with a valid status code and comment
-            response_data['Comment'] = "Cancellation Successful"
-            return JsonResponse(response_data, status=200)
-
-        # Throws an error if the transaction we're trying to find using the ID supplied does not exist
-        except Transaction.DoesNotExist:
-            return error_response(response_data, 402)
+        # Updates response with a valid status code and comment
+        response_data['Comment'] = "Cancellation Successful"
+        return JsonResponse(response_data, status=200)
 
     else:
         # Return an error if it's not a POST request
@@ -386,89 +393,334 @@ def request_transaction_pns(request):
         'Comment': ""
     }
 
-    # The URL of the PNS
-    pns_url = " http://samshepherd.eu.pythonanywhere.com/pns/initiatetransactionpns/"
-
     # A function which checks if the response is not empty and can be converted to JSON
     request_data = check_valid_request(request, response_data)
 
     if isinstance(request_data, JsonResponse):
         return request_data  # Will be a JSON response of the error, otherwise we continue
 
-    # Remove the arguments the PNS doesn't need
-    request_data.pop('PayerCurrencyCode')
-    request_data.pop('RecipientName')
-    request_data.pop('Email')
+    return service_response(pns.send_payment(request_data), response_data)
 
-    # Change the name of some keys to match what the PNS expects
-    request_data['HolderName'] = request_data.pop('CardHolderName')
-    request_data['BillingAddress'] = request_data.pop('CardHolderAddress')
-    request_data['CurrencyCode'] = request_data.pop('PayeeCurrencyCode')
-    request_data['AccountNumber'] = request_data.pop('PayeeBankAccNum')
-    request_data['Sort-Code'] = request_data.pop('PayeeBankSortCode')
 
-    # Send a POST request with this data to the PNS
-    pns_response = requests.post(pns_url, data=request_data)
+def request_refund_pns(request):
+    # The JSON default data of the response, stored in a dictionary
+    response_data = {
+        'ErrorCode': None,
+        'Comment': ""
+    }
 
-    # Return our error code and their comment if the request was not OK
-    if pns_response.status_code != 200:
-        return error_response_external(pns_response, response_data, 301)
+    # We don't alter any data, and have already checked it in initiate_refund, so we can pass it on.
+    return service_response(pns.send_refund(request.body), response_data)
 
-    # Else, return an OK response
-    response_data['Comment'] = "PNS Payment Successful"
-    return JsonResponse(response_data, status=200)
 
+def convert_currency(request):
+    # The JSON default data of the response, stored in a dictionary
+    response_data = {
+        'ErrorCode': None,
+        'Comment': "",
+        'Amount': None
+    }
+
+    conversion = read_conversion(request, response_data)
 
-def request_refund_pns(request):
+    if isinstance(conversion, JsonResponse):
+        return conversion  # Will be a JSON response of the error
+
+    result = currency.convert(conversion['Amount'], conversion['CurrencyFrom'], conversion['CurrencyTo'],
+                              conversion.get('Date'))
+    response_data['Amount'] = result.value
+
+    return service_response(result, response_data)
+
+
+# Gets the conversion sent to the convert currency endpoints. Returns the JSON response of the error if it isn't valid.
+def read_conversion(request, response_data):
+    conversion = check_valid_request(request, response_data)
+
+    if isinstance(conversion, JsonResponse):
+        return conversion  # Will be a JSON response of the error
+
+    # Checks the amount and both currencies were given
+    if not isinstance(conversion, dict) or not isinstance(conversion.get('Amount'), (int, float)) \
+            or conversion.get('CurrencyFrom') is None or conversion.get('CurrencyTo') is None:
+        return error_response(response_data, 102)
+
+    currencies = (conversion['CurrencyFrom'], conversion['CurrencyTo'])
+
+    # Checks both currencies are three digit codes, as they are sent to the currency converter and used in cache keys
+    if not all(isinstance(code, str) for code in currencies):
+        return error_response(response_data, 103, "Error. The currency codes must be strings")
+
+    if not all(THREE_DIGITS.match(code) for code in currencies):
+        return error_response(response_data, 104, "Error. The currency codes provided are not in the correct format")
+
+    return conversion
+
+
+def cache_stats(request):
+    # Returns the hit, miss and eviction counters of each cache in this worker, and the state of its filters of known
+    # cards and payee accounts
+    stats = caching.cache_stats()
+    stats['known_accounts'] = known_accounts.stats()
+
+    return JsonResponse(stats, status=200)
+
+
+def prometheus_metrics(request):
+    # Returns the request, database and upstream metrics of this worker, in the Prometheus text format
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@read_only
+def transaction_history(request):
     # The JSON default data of the response, stored in a dictionary
     response_data = {
         'ErrorCode': None,
         'Comment': ""
     }
 
-    # URL of the PNS
-    pns_url = " http://samshepherd.eu.pythonanywhere.com/pns/initiatetransactionpns/"
+    if request.method != 'GET':
+        return error_response(response_data, 105, "Error. This function only accepts GET requests")
 
-    # We don't alter any data, and have already checked it in initiate_refund, so we can pass it on.
-    pns_response = requests.post(pns_url, data=request)
+    query = read_history_query(request.GET, response_data)
 
-    # Returns our error code and their comment if request was not 200
-    if pns_response.status_code != 200:
-        return error_response_external(pns_response, response_data, 301)
+    if isinstance(query, JsonResponse):
+        return query  # Will be a JSON response of the error
 
-    # Else, the refund was successful
-    response_data['Comment'] = "PNS Refund Successful"
+    rows, limit = query
 
-    return JsonResponse(response_data, status=200)
+    # The rows are only read once the view has returned, as the response is streamed, so the database to read them
+    # from is chosen now
+    rows = rows.using(rows.db)
 
+    # Each transaction is written as its own line of JSON (NDJSON) as it's read, so memory use doesn't depend on how
+    # many transactions an account has
+    return StreamingHttpResponse(history_lines(rows, limit), content_type='application/x-ndjson')
 
-def convert_currency(request):
+
+# Checks the query string of a history request, returning the rows of the page asked for and the page size
+def read_history_query(params, response_data):
+    payer_account = params.get('PayerAccount')
+    payee_account = params.get('PayeeAccount')
+
+    # The history is either of the payments an account made, or the payments it received
+    if (payer_account is None) == (payee_account is None):
+        return error_response(response_data, 102, "Error. Either a PayerAccount or a PayeeAccount must be provided")
+
+    try:
+        account_number = int(payer_account if payer_account is not None else payee_account)
+        limit = int(params.get('Limit', settings.TRANSACTION_HISTORY['PAGE_SIZE']))
+
+    except ValueError:
+        return error_response(response_data, 103, "Error. The account number and Limit must be integers")
+
+    # Larger numbers would make the query fail rather than find nothing
+    if not 0 <= account_number <= MAX_ID:
+        return error_response(response_data, 104, "Error. The account number must be between 0 and %d" % MAX_ID)
+
+    max_page_size = settings.TRANSACTION_HISTORY['MAX_PAGE_SIZE']
+
+    if not 0 < limit <= max_page_size:
+        return error_response(response_data, 104, "Error. Limit must be between 1 and %d" % max_page_size)
+
+    try:
+        date_from = parse_date(params['DateFrom']) if 'DateFrom' in params else None
+        date_to = parse_date(params['DateTo']) if 'DateTo' in params else None
+
+        # The cursor is the date and ID of the last transaction of the previous page
+        after = params.get('After')
+
+        if after is not None:
+            after_date, after_id = after.split(',')
+            after_date, after_id = parse_date(after_date), int(after_id)
+
+            if not 0 <= after_id <= MAX_ID:
+                raise ValueError
+
+    except ValueError:
+        return error_response(response_data, 104, "Error. Dates need to be real dates in YYYY-MM-DD format, and After "
+                                                  "needs to be the NextCursor of a previous page")
+
+    if payer_account is not None:
+        conditions = Q(payer_id=account_number)
+    else:
+        conditions = Q(payee_id=account_number)
+
+    if date_from is not None:
+        conditions &= Q(date__gte=date_from)
+
+    if date_to is not None:
+        conditions &= Q(date__lte=date_to)
+
+    # Keyset pagination: the page starts straight after the cursor, found using the (payer/payee, date, id) index,
+    # instead of counting past every earlier transaction as an OFFSET would. The date__gte on its own lets the index be
+    # searched, the rest skips the transactions on the cursor's date which were on the previous page.
+    if after is not None:
+        conditions &= Q(date__gte=after_date) & (Q(date__gt=after_date) | Q(id__gt=after_id))
+
+    # The history covers archived transactions too. Both tables have the same indexes, so each is searched the same way
+    # before the two are put in order.
+    fields = ('id', 'payer_id', 'payee_id', 'amount', 'currency', 'date', 'transactionStatus')
+    transactions = Transaction.objects.filter(conditions).values_list(*fields).union(
+        ArchivedTransaction.objects.filter(conditions).values_list(*fields), all=True)
+
+    # One more row than the page size is read, to find out if there's another page
+    rows = transactions.order_by('date', 'id')[:limit + 1]
+
+    return rows, limit
+
+
+# Yields the page of transactions as lines of JSON, a chunk at a time, followed by a line with the cursor of the next
+# page (null if this is the last page)
+def history_lines(rows, limit):
+    chunk_size = settings.TRANSACTION_HISTORY['CHUNK_SIZE']
+    lines = []
+    next_cursor = None
+    last_row = None
+
+    for count, row in enumerate(rows.iterator(chunk_size=chunk_size)):
+        if count == limit:
+            next_cursor = "%s,%d" % (last_row[5].isoformat(), last_row[0])
+            break
+
+        transaction_id, payer, payee, amount, currency, transaction_date, status = row
+        lines.append(dumps({
+            'TransactionUUID': transaction_id,
+            'PayerAccount': payer,
+            'PayeeAccount': payee,
+            'Amount': amount,
+            'Currency': currency,
+            'Date': transaction_date.isoformat(),
+            'TransactionStatus': status
+        }) + b"\n")
+        last_row = row
+
+        if len(lines) == chunk_size:
+            yield b"".join(lines)
+            lines = []
+
+    lines.append(dumps({'NextCursor': next_cursor}) + b"\n")
+    yield b"".join(lines)
+
+
+@read_only
+def settlement_summary(request):
     # The JSON default data of the response, stored in a dictionary
     response_data = {
         'ErrorCode': None,
         'Comment': "",
-        'Amount': None
+        'Settlements': []
     }
 
-    # The URL to access the currency converter endpoint
-    currency_url = ' http://samshepherd.eu.pythonanywhere.com/currency/convert/'
+    if request.method != 'GET':
+        return error_response(response_data, 105, "Error. This function only accepts GET requests")
 
-    # A function which checks if the response is not empty and can be converted to JSON
+    payee_account = request.GET.get('PayeeAccount')
 
-    # Sends a POST request to the currency converter
-    currency_response = requests.post(currency_url, data=request)
+    if payee_account is None:
+        return error_response(response_data, 102, "Error. A PayeeAccount must be provided")
 
-    # Gets the status code of the request, if it was valid, then extract the new amount,
-    # else, produce the correct error code
-    print(currency_response.status_code)
-    if currency_response.status_code != 200:
-        return error_response_external(currency_response, response_data, 201)
+    try:
+        payee_account = int(payee_account)
 
-    # We get the amount from the response body and ensure we send it back.
-    response_body = json.loads(currency_response.text)
-    print(response_body)
+    except ValueError:
+        return error_response(response_data, 103, "Error. The account number must be an integer")
 
-    response_data['Amount'] = response_body['Amount']
-    response_data['Comment'] = "Conversion Successful"
+    # Larger numbers would make the query fail rather than find nothing
+    if not 0 <= payee_account <= MAX_ID:
+        return error_response(response_data, 104, "Error. The account number must be between 0 and %d" % MAX_ID)
+
+    try:
+        date_from = parse_date(request.GET['DateFrom']) if 'DateFrom' in request.GET else None
+        date_to = parse_date(request.GET['DateTo']) if 'DateTo' in request.GET else None
+
+    except ValueError:
+        return error_response(response_data, 104, "Error. Dates need to be real dates in YYYY-MM-DD format")
+
+    # Read straight from the summary, one row per currency per day, rather than adding up every transaction
+    summaries = SettlementSummary.objects.filter(payee_id=payee_account)
+
+    if date_from is not None:
+        summaries = summaries.filter(date__gte=date_from)
+
+    if date_to is not None:
+        summaries = summaries.filter(date__lte=date_to)
+
+    if 'Currency' in request.GET:
+        summaries = summaries.filter(currency=request.GET['Currency'])
+
+    for day, currency, payment_count, payment_total, refund_count, refund_total in summaries.order_by(
+            'date', 'currency').values_list('date', 'currency', 'paymentCount', 'paymentTotal', 'refundCount',
+                                            'refundTotal'):
+        response_data['Settlements'].append({
+            'Date': day.isoformat(),
+            'Currency': currency,
+            'PaymentCount': payment_count,
+            'PaymentTotal': round(payment_total, 2),
+            'RefundCount': refund_count,
+            'RefundTotal': round(refund_total, 2),
+            'NetTotal': round(payment_total - refund_total, 2)
+        })
 
     return JsonResponse(response_data, status=200)
+
+
+@read_only
+def transaction_status(request):
+    # The JSON default data of the response, stored in a dictionary
+    response_data = {
+        'ErrorCode': None,
+        'Comment': ""
+    }
+
+    if request.method != 'GET':
+        return error_response(response_data, 105, "Error. This function only accepts GET requests")
+
+    try:
+        transaction_id = int(request.GET['TransactionUUID'])
+
+    except KeyError:
+        return error_response(response_data, 102, "Error. No transaction ID was provided")
+
+    except ValueError:
+        return error_response(response_data, 103, "Error. Transaction ID needs to be a positive integer")
+
+    # Read through the status cache, so polling a transaction which hasn't changed doesn't use the database
+    found = status_cache.get_status(transaction_id)
+
+    if found is None:
+        return error_response(response_data, 402)
+
+    record, etag = found
+
+    # The client already has this version of the status, so there's no need to send it again
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        response = HttpResponse(status=304)
+
+    else:
+        transaction_status, amount, currency_code, transaction_date, error = record
+
+        response_data['TransactionUUID'] = transaction_id
+        response_data['TransactionStatus'] = transaction_status
+        response_data['Amount'] = amount
+        response_data['Currency'] = currency_code
+        response_data['Date'] = transaction_date
+
+        # The error of a payment the PNS rejected
+        if error is not None:
+            response_data['Comment'] = error
+
+        response = JsonResponse(response_data, status=200)
+
+    # Clients and proxies may keep the response, but have to check it's still current each time
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+# Whether an If-None-Match header includes the ETag, using the weak comparison as GET requests do
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+
+    return any(tag == '*' or (tag[2:] if tag.startswith('W/') else tag) == etag for tag in parse_etags(if_none_match))
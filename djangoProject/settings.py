@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+import django
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -22,6 +25,14 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = 'django-insecure-5w5^m)#06i96_jeytu%f4ap+l@eqtrqmwua&288bzca7exgqff'
 
+# The key of the card number fingerprints cards are found by (see api/cards.py). Changing it means running
+# backfill_card_fingerprints --all.
+CARD_FINGERPRINT_KEY = os.environ.get('CARD_FINGERPRINT_KEY', SECRET_KEY)
+
+# The key card details waiting in the PNS outbox are encrypted with (see api/cards.py). Changing it leaves any payments
+# still waiting unreadable, so the outbox should be empty first.
+OUTBOX_PAYLOAD_KEY = os.environ.get('OUTBOX_PAYLOAD_KEY', SECRET_KEY)
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
@@ -41,6 +52,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so the time taken by the rest of the middleware is included
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,11 +88,60 @@ WSGI_APPLICATION = 'djangoProject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# The database is SQLite unless DB_ENGINE names another backend, in which case it's configured with the other DB_
+# environment variables. DB_REPLICA_HOST adds a read replica, which the views that only read are sent to (see
+# api/database.py).
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'django.db.backends.sqlite3')
+
+if DB_ENGINE == 'django.db.backends.sqlite3':
+    DATABASES = {
+        'default': {
+            'ENGINE': DB_ENGINE,
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            # Connections are kept open between requests, so the pragmas below aren't run for every request
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'OPTIONS': {},
+        }
     }
+
+    # Transactions take the write lock when they start, rather than when they first write, so two transactions which
+    # read before writing wait for each other instead of one failing with "database is locked"
+    if django.VERSION >= (5, 1):
+        DATABASES['default']['OPTIONS']['transaction_mode'] = 'IMMEDIATE'
+
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': DB_ENGINE,
+            'NAME': os.environ.get('DB_NAME', 'payments'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', ''),
+            'PORT': os.environ.get('DB_PORT', ''),
+            # Persistent connections, checked before each request reuses them
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+
+    if os.environ.get('DB_REPLICA_HOST'):
+        DATABASES['replica'] = dict(DATABASES['default'], HOST=os.environ['DB_REPLICA_HOST'],
+                                    PORT=os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+                                    TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['api.database.ReplicaRouter']
+
+# Run on every SQLite connection as it's opened (see api/database.py)
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'wal'),
+    # Safe with WAL, only the last transactions before a power cut can be lost, not the database
+    'synchronous': 'normal',
+    # Milliseconds a connection waits for another's write to finish
+    'busy_timeout': 20000,
+    # Negative sizes are in KiB
+    'cache_size': -64000,
+    'temp_store': 'memory',
 }
 
 
@@ -123,3 +185,205 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Caches used by the API (see api/caching.py). A 'local' cache is kept in each worker's memory, a 'django' cache is
+# stored in the CACHES alias given so it is shared between workers.
+
+API_CACHES = {
+    # Currency conversion rates, keyed on the currency pair and date
+    'currency_rates': {
+        'BACKEND': 'local',
+        'ALIAS': 'default',
+        'MAX_ENTRIES': 1024,
+        'TTL': 60 * 60,
+    },
+    # The matrix of stored exchange rates for each day, keyed on the date. Each worker checks the day's version in the
+    # database every EXCHANGE_RATES['VERSION_CHECK_INTERVAL'] seconds, so it sees rates imported since.
+    'exchange_rates': {
+        'BACKEND': 'local',
+        'ALIAS': 'default',
+        'MAX_ENTRIES': 64,
+        'TTL': 5 * 60,
+    },
+    # Whether each email domain can receive email, when EMAIL_VALIDATION['MODE'] is 'cached'
+    'email_domains': {
+        'BACKEND': 'local',
+        'ALIAS': 'default',
+        'MAX_ENTRIES': 10000,
+        'TTL': 60 * 60,
+    },
+    # Card and payee account lookups which failed recently, so retries of them don't go to the database
+    'negative_lookups': {
+        'BACKEND': 'local',
+        'ALIAS': 'default',
+        'MAX_ENTRIES': 10000,
+        'TTL': 30,
+    },
+    # Completed responses of requests sent with an Idempotency-Key, so replays don't need the database
+    'idempotency': {
+        'BACKEND': 'local',
+        'ALIAS': 'default',
+        'MAX_ENTRIES': 10000,
+        'TTL': 10 * 60,
+    },
+    # The status of each transaction polled with transactionStatus (see api/status_cache.py). The TTL is for refunded,
+    # cancelled and failed transactions, as they can't change again.
+    'transaction_status': {
+        'BACKEND': 'local',
+        'ALIAS': 'default',
+        'MAX_ENTRIES': 100000,
+        'TTL': 60 * 60,
+    },
+}
+
+# Completed and pending transactions can still change, and only changes made by this worker (or any worker, with the
+# django cache backend) reach its cache, so their cached status is only kept for OPEN_TTL seconds
+
+TRANSACTION_STATUS = {
+    'OPEN_TTL': 5,
+}
+
+# The amount sent to the currency converter when working out a rate, large enough that rounding doesn't matter
+CURRENCY_RATE_REFERENCE_AMOUNT = 1000000.0
+
+# The Bloom filters of known cards and payee accounts, which payments from unknown cards or to unknown accounts are
+# turned away with (see api/known_accounts.py). Their sizes, false positive rates and build times are shown at
+# /cacheStats.
+KNOWN_ACCOUNTS = {
+    'ENABLED': True,
+    # The chance of an unknown card or account getting past the filter, and being looked up in the database
+    'ERROR_RATE': 0.001,
+    # Each filter is sized for this many times the cards or accounts there are, but never less than MIN_CAPACITY, so
+    # ones added before the next rebuild don't push the false positive rate up
+    'HEADROOM': 2.0,
+    'MIN_CAPACITY': 10000,
+    # The most memory each filter can use, in bytes. A filter capped by this has a higher false positive rate.
+    'MAX_BYTES': 16 * 1024 * 1024,
+    # Seconds between checks of the version of the cards and bank details, which every save changes. A worker rebuilds
+    # its filters when it has, so cards and accounts added by other processes are turned away for up to this long (plus
+    # the time to build) before they're known.
+    'VERSION_CHECK_INTERVAL': 10,
+    # Seconds between rebuilds even if the version hasn't changed, for cards and accounts added without a save
+    'REBUILD_INTERVAL': 5 * 60,
+    # Rows read at a time whilst building
+    'CHUNK_SIZE': 5000,
+}
+
+# How the emails of payments are checked (see api/schemas.py): 'syntax' only checks the address itself, without any
+# network lookups, 'cached' also checks the domain can receive email with DNS, caching the answer in the email_domains
+# cache, and 'full' makes the DNS lookups for every payment. Use 'syntax' where there's no DNS, e.g. an air-gapped
+# staging environment.
+EMAIL_VALIDATION = {
+    'MODE': os.environ.get('EMAIL_VALIDATION_MODE', 'cached'),
+}
+
+# The rate limits themselves are set for each view, in api/ratelimit.py. The local backend keeps the
+# buckets in each worker, so each worker allows the full limit, and the django backend shares them between workers
+# through the cache ALIAS.
+RATE_LIMIT = {
+    'ENABLED': True,
+    'BACKEND': 'local',
+    'ALIAS': 'default',
+    # Buckets kept by the local backend, the least recently used are dropped past this
+    'MAX_KEYS': 100000,
+    # Only when behind a proxy which sets X-Forwarded-For, as clients could otherwise set it to anything
+    'TRUST_X_FORWARDED_FOR': False,
+}
+
+EXCHANGE_RATES = {
+    # Pairs without a stored rate are converted through this currency (GBP), if both have a rate with it
+    'BASE_CURRENCY': '826',
+    # Seconds a worker uses its cached rates of a day for before checking they haven't been imported again since, so
+    # imports reach every worker within this long
+    'VERSION_CHECK_INTERVAL': 5,
+}
+
+
+# Upstream services (see api/outbound.py). The URLs can be overridden with environment variables, so a local stub can
+# be used instead. Retries are only used for idempotent calls, which the PNS payment and refund calls are not.
+
+OUTBOUND_SERVICES = {
+    'pns': {
+        'URL': os.environ.get('PNS_URL', 'http://samshepherd.eu.pythonanywhere.com/pns/initiatetransactionpns/'),
+        'CONNECT_TIMEOUT': 3.05,
+        'READ_TIMEOUT': 15,
+        'RETRIES': 0,
+        'BACKOFF': 0.2,
+        'FAILURE_THRESHOLD': 5,
+        'RESET_TIMEOUT': 30,
+    },
+    'currency': {
+        'URL': os.environ.get('CURRENCY_CONVERTER_URL', 'http://samshepherd.eu.pythonanywhere.com/currency/convert/'),
+        'CONNECT_TIMEOUT': 3.05,
+        'READ_TIMEOUT': 5,
+        'RETRIES': 2,
+        'BACKOFF': 0.2,
+        'FAILURE_THRESHOLD': 5,
+        'RESET_TIMEOUT': 30,
+    },
+}
+
+# Size of the keep-alive connection pool shared by the upstream calls
+OUTBOUND_POOL_CONNECTIONS = 4
+OUTBOUND_POOL_MAXSIZE = 32
+
+# Idempotency-Key handling for initiatePayment and initiateRefund (see api/idempotency.py), times in seconds
+
+IDEMPOTENCY = {
+    # How long a completed response is kept for replays, before purge_idempotency_keys removes it
+    'TTL': 24 * 60 * 60,
+    # A reservation still in progress after this long is treated as abandoned, and can be taken over
+    'LOCK_TIMEOUT': 60,
+    # How long a duplicate request waits for the first one to finish before being rejected
+    'WAIT': 5,
+    'POLL_INTERVAL': 0.1,
+}
+
+# Batch payments are sent to the PNS one at a time, so the number in a batch is limited to keep a request from holding a
+# worker for minutes. Larger batches are turned away with ErrorCode 104.
+BATCH_PAYMENT = {
+    'MAX_PAYMENTS': 100,
+}
+
+# The transaction history endpoint, which streams one page of an account's transactions at a time
+
+TRANSACTION_HISTORY = {
+    # Transactions per page, when the request doesn't give a Limit, and the largest Limit allowed
+    'PAGE_SIZE': 1000,
+    'MAX_PAGE_SIZE': 10000,
+    # Rows fetched from the database at a time whilst the page is streamed
+    'CHUNK_SIZE': 2000,
+}
+
+# Closed transactions are moved to the archive table by archive_transactions once they're this many days old, leaving
+# recent ones in Transaction. Completed payments are kept longer, as they're the only ones still likely to be refunded
+# or cancelled.
+
+TRANSACTION_ARCHIVE = {
+    'CLOSED_AFTER_DAYS': 30,
+    'COMPLETED_AFTER_DAYS': 180,
+    # Transactions moved in each database transaction
+    'BATCH_SIZE': 1000,
+}
+
+# The JSON codec used for request and response bodies (see api/codec.py): 'auto' uses orjson if it's installed and the
+# json module if not, 'orjson' or 'json' forces one
+API_JSON_CODEC = 'auto'
+
+# Payments accepted with Prefer: respond-async are sent to the PNS by the run_pns_outbox worker (see api/outbox.py),
+# times in seconds
+
+PNS_OUTBOX = {
+    # Payments claimed by a worker at a time, and how many of them are sent at once
+    'BATCH_SIZE': 50,
+    'CONCURRENCY': 8,
+    # Attempts made before a payment is marked as failed, and the delay before the first retry, which doubles each time
+    'MAX_ATTEMPTS': 8,
+    'RETRY_DELAY': 2,
+    'MAX_RETRY_DELAY': 300,
+    # A claimed payment not finished after this long is taken back, in case its worker stopped
+    'LOCK_TIMEOUT': 120,
+    # How long the worker waits before looking again when there's nothing to send
+    'POLL_INTERVAL': 1,
+}
@@ -0,0 +1,24 @@
+"""
+API only settings for djangoProject, used when DJANGO_PROFILE=api (see wsgi.py and asgi.py).
+
+The JSON API doesn't use the admin, sessions, users, messages, static files or templates, so this profile leaves them
+and their middleware out, and workers start faster and do less for each request. The admin is still served by workers
+started with the full profile in settings.py.
+"""
+
+from djangoProject.settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    'api.apps.Lab1Config',
+]
+
+MIDDLEWARE = [
+    # First, so the time taken by the rest of the middleware is included
+    'api.metrics.MetricsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+]
+
+TEMPLATES = []
+
+# Nothing is translated
+USE_I18N = False
@@ -13,16 +13,30 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path
-from api import views
+from api import async_views, views
 
 urlpatterns = [
     path('initiatePayment', views.initiate_payment),
+    path('initiateBatchPayment', views.initiate_batch_payment),
     path('initiateRefund', views.initiate_refund),
     path('initiateCancellation', views.initiate_cancellation),
+    path('transactionStatus', views.transaction_status),
     path('requestTransactionPNS', views.request_transaction_pns),
     path('requestRefundPNS', views.request_refund_pns),
     path('convertCurrency', views.convert_currency),
-    path('admin', admin.site.urls)
+    path('cacheStats', views.cache_stats),
+    path('metrics', views.prometheus_metrics),
+    path('transactionHistory', views.transaction_history),
+    path('settlementSummary', views.settlement_summary),
+    path('initiatePaymentAsync', async_views.initiate_payment_async),
+    path('initiateRefundAsync', async_views.initiate_refund_async),
+    path('convertCurrencyAsync', async_views.convert_currency_async),
 ]
+
+# The admin is only served by the full settings profile, the API only profile doesn't install it
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+
+    urlpatterns.append(path('admin', admin.site.urls))
@@ -11,6 +11,13 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'djangoProject.settings')
+# DJANGO_PROFILE=api starts a worker which only serves the API, without the admin and the apps and middleware it needs
+# (see settings_api.py). Workers serving the admin use the full profile.
+PROFILES = {
+    'full': 'djangoProject.settings',
+    'api': 'djangoProject.settings_api',
+}
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', PROFILES[os.environ.get('DJANGO_PROFILE', 'full')])
 
 application = get_wsgi_application()